@@ -1,10 +1,13 @@
 from flask import Flask
 from app.config import Config
-from app.database import init_db
+from app.database import init_db, close_db
+from app.utils.http_cache import compress_response, version_static_urls
+from app.utils.uploads import UploadRequest
 import os
 
-def create_app(config_class=Config):
+def create_app(config_class=Config, start_services=True):
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config.from_object(config_class)
     
     # Ensure upload directory exists with proper permissions
@@ -30,15 +33,49 @@ def create_app(config_class=Config):
     
     # Initialize database
     init_db()
+    app.teardown_appcontext(close_db)
+    
+    # Registered before compression so request latency includes it
+    from app.routes.metrics import bp as metrics_bp
+    app.register_blueprint(metrics_bp)
+    app.after_request(compress_response)
+    app.url_defaults(version_static_urls)
     
     # Register blueprints
     from app.routes.views import bp as views_bp
     from app.routes.api import bp as api_bp
+    from app.routes.health import bp as health_bp
     
     app.register_blueprint(views_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(health_bp)
+    
+    # gunicorn --preload builds the app in the master process; threads do not
+    # survive the fork, so gunicorn.conf.py starts these in each worker instead
+    if start_services:
+        start_background_services(app)
     
     return app
 
-
-
+def start_background_services(app):
+    """Start the background threads of this process"""
+    # Share this process's metrics with the other workers' /metrics
+    if app.config['METRICS_DIR']:
+        from app import metrics
+        metrics.enable_multiprocess(app.config['METRICS_DIR'], app.config['METRICS_WRITE_INTERVAL'])
+    
+    # Resume checkout jobs left queued by a previous run (worker mode: the
+    # checkout worker process does this)
+    if app.config['CHECKOUT_RUNNER'] == 'inline':
+        from app.services.checkout_jobs import recover_checkout_jobs
+        recover_checkout_jobs()
+    
+    # Scheduled stock/price monitor (one process per data directory)
+    if app.config['MONITOR_ENABLED']:
+        from app.services.monitor import monitor
+        monitor.start()
+    
+    # Log retention (one process per data directory)
+    if app.config['LOG_RETENTION_DAYS'] or app.config['LOG_MAX_ROWS']:
+        from app.services.log_retention import log_pruner
+        log_pruner.start()
@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+from app.config import Config
+from app import metrics
+
+class CatalogCache:
+    """
+    In-process cache of product reads
+
+    Everything cached is tagged with the catalog version from SQLite. Writes
+    in this process call invalidate(); writes from other processes bump the
+    version through triggers and are noticed on the next read (checked at
+    most every CATALOG_CACHE_CHECK_INTERVAL seconds). Cached products are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_queries=None, check_interval=None):
+        self.max_queries = max_queries or Config.CATALOG_CACHE_MAX_QUERIES
+        self.check_interval = Config.CATALOG_CACHE_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._by_id = {}
+        self._by_url = {}
+        self._queries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _clear(self):
+        self._by_id.clear()
+        self._by_url.clear()
+        self._queries.clear()
+
+    def _sync(self):
+        """Drop everything if the catalog version moved; returns the current version"""
+        from app.models import get_catalog_version
+
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return self._version
+        version = get_catalog_version()
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                self._clear()
+                self._version = version
+            self._checked_at = now
+        return version
+
+    def invalidate(self):
+        """Forget everything; the next read reloads from the database"""
+        with self._lock:
+            self._clear()
+            self._version = None
+            self.invalidations += 1
+
+    def _lookup(self, table, key, loader):
+        version = self._sync()
+        with self._lock:
+            if key in table:
+                self.hits += 1
+                if table is self._queries:
+                    table.move_to_end(key)
+                return table[key]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            # Don't store a value loaded across an invalidation
+            if self._version == version:
+                table[key] = value
+                if table is self._queries and len(table) > self.max_queries:
+                    table.popitem(last=False)
+        return value
+
+    def get_product(self, product_id):
+        """Cached get_product_by_id"""
+        from app.models import get_product_by_id
+        return self._lookup(self._by_id, int(product_id), lambda: get_product_by_id(product_id))
+
+    def get_product_by_url(self, product_url):
+        """Cached get_product_by_url"""
+        from app.models import get_product_by_url
+        return self._lookup(self._by_url, product_url, lambda: get_product_by_url(product_url))
+
+    def list_products(self, limit=None, cursor=None, stock_status=None, min_price=None,
+                      max_price=None, fields=None):
+        """Cached list_products; returns (products, next_cursor)"""
+        from app.models import list_products
+        key = (limit, cursor, stock_status, min_price, max_price, tuple(fields) if fields else None)
+        return self._lookup(self._queries, key, lambda: list_products(
+            limit=limit, cursor=cursor, stock_status=stock_status,
+            min_price=min_price, max_price=max_price, fields=fields
+        ))
+
+    def version(self):
+        """Catalog version the cache is currently synced to"""
+        return self._sync()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'products': len(self._by_id) + len(self._by_url),
+                'queries': len(self._queries)
+            }
+
+catalog_cache = CatalogCache()
+
+metrics.gauge_callback(
+    'catalog_cache_lookups', 'Catalog cache lookups by result',
+    lambda: {('hit',): catalog_cache.hits, ('miss',): catalog_cache.misses},
+    ['result'], kind='counter'
+)
+metrics.gauge_callback('catalog_cache_invalidations', 'Catalog cache invalidations',
+                       lambda: catalog_cache.invalidations, kind='counter')
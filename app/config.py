@@ -1,6 +1,50 @@
 import os
 from pathlib import Path
 
+# Only five dampfi.ch accounts exist and each runs one checkout at a time
+MAX_ACCOUNTS = 5
+BROWSER_INSTANCE_MB = 400  # resident memory of one Chromium running a checkout
+
+def cpu_count():
+    """CPUs this process may run on (respects affinity/cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+def memory_mb():
+    """Memory available to this process in MB (cgroup limit if lower), or None"""
+    try:
+        total = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1048576
+    except (AttributeError, ValueError, OSError):
+        return None
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit():
+                total = min(total, int(value) / 1048576)
+            break
+        except OSError:
+            continue
+    return total
+
+def default_browser_pool_size():
+    """One browser per core, as many as half the memory holds, at most one per account"""
+    size = min(cpu_count(), MAX_ACCOUNTS)
+    memory = memory_mb()
+    if memory:
+        size = min(size, int(memory / 2 // BROWSER_INSTANCE_MB))
+    return max(1, size)
+
+def default_web_workers():
+    """Gunicorn processes: requests are short SQLite reads, so one per core plus one"""
+    return cpu_count() + 1
+
+def default_web_threads():
+    """Threads per gunicorn process; cover the time spent waiting on SQLite and sockets"""
+    return max(4, 2 * cpu_count())
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
@@ -8,6 +52,39 @@ class Config:
     DATABASE_PATH = os.environ.get('DATABASE_PATH') or os.path.join(
         Path(__file__).parent.parent, 'data', 'database.db'
     )
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 10))  # seconds
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -16000))  # negative = KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))  # 256MB
+    SQLITE_STATEMENT_CACHE = 256
+    
+    # Schema migrations (app/migrations)
+    DB_BACKUP_ON_MIGRATE = os.environ.get('DB_BACKUP_ON_MIGRATE', 'true').lower() == 'true'
+    DB_BACKUP_DIR = os.environ.get('DB_BACKUP_DIR') or os.path.join(
+        os.path.dirname(DATABASE_PATH), 'backups'
+    )
+    DB_MIGRATION_CHUNK = int(os.environ.get('DB_MIGRATION_CHUNK', 500))  # rows per backfill transaction
+    DB_MIGRATION_PAUSE = float(os.environ.get('DB_MIGRATION_PAUSE', 0.05))  # seconds between chunks
+    
+    # Logging (background writer for the logs table)
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 200))
+    LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 0.5))  # seconds
+    LOG_ENQUEUE_TIMEOUT = float(os.environ.get('LOG_ENQUEUE_TIMEOUT', 0.05))  # seconds
+
+    # Log retention (background pruning; 0 disables a limit)
+    LOG_RETENTION_DAYS = float(os.environ.get('LOG_RETENTION_DAYS', 30))
+    LOG_MAX_ROWS = int(os.environ.get('LOG_MAX_ROWS', 1000000))
+    LOG_PRUNE_INTERVAL = float(os.environ.get('LOG_PRUNE_INTERVAL', 600))  # seconds between passes
+    LOG_PRUNE_BATCH = int(os.environ.get('LOG_PRUNE_BATCH', 1000))  # rows per delete transaction
+    LOG_PRUNE_PAUSE = float(os.environ.get('LOG_PRUNE_PAUSE', 0.05))  # seconds between batches
+    LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', '')  # write pruned rows to ndjson.gz here
+    
+    # Prometheus /metrics across processes: every process writes a snapshot
+    # of its metrics here and /metrics merges them ('' = this process only;
+    # gunicorn.conf.py defaults it to a directory next to the database)
+    METRICS_DIR = os.environ.get('METRICS_DIR', '')
+    METRICS_WRITE_INTERVAL = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))  # seconds
     
     # Uploads
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(
@@ -15,13 +92,100 @@ class Config:
     )
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_SIZE', 10485760))  # 10MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', min(2, os.cpu_count() or 1)))
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+    IMMUTABLE_MAX_AGE = 31536000  # content-addressed files never change
+    # Hand image bytes to a front proxy: '' (serve here), 'x-sendfile'
+    # (Apache/lighttpd) or 'x-accel-redirect' (nginx internal location)
+    UPLOAD_SENDFILE = os.environ.get('UPLOAD_SENDFILE', '').lower()
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/_uploads/')
+    USE_X_SENDFILE = UPLOAD_SENDFILE == 'x-sendfile'
+    
+    # Catalog cache
+    CATALOG_CACHE_MAX_QUERIES = int(os.environ.get('CATALOG_CACHE_MAX_QUERIES', 256))  # cached listings
+    CATALOG_CACHE_CHECK_INTERVAL = float(os.environ.get('CATALOG_CACHE_CHECK_INTERVAL', 0))  # seconds
+    
+    # Gallery
+    GALLERY_PAGE_SIZE = int(os.environ.get('GALLERY_PAGE_SIZE', 24))
+    
+    # HTTP caching and compression
+    COMPRESS_MIN_SIZE = 1024  # bytes
+    COMPRESS_LEVEL_GZIP = 6
+    COMPRESS_LEVEL_BR = 5
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 3600))  # seconds
+    UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 86400))  # seconds
+    SEND_FILE_MAX_AGE_DEFAULT = STATIC_MAX_AGE
+    # Part of every ETag and static URL so a deploy invalidates them
+    # ('' = derived from the app's code, templates and assets)
+    BUILD_ID = os.environ.get('BUILD_ID', '')
     
     # Dampfi.ch
     DAMPFI_BASE_URL = 'https://www.dampfi.ch'
     
+    # Scraper
+    SCRAPE_CONCURRENCY = int(os.environ.get('SCRAPE_CONCURRENCY', 8))  # total parallel fetches
+    SCRAPE_PER_HOST_CONCURRENCY = int(os.environ.get('SCRAPE_PER_HOST_CONCURRENCY', 4))
+    SCRAPE_BATCH_SIZE = int(os.environ.get('SCRAPE_BATCH_SIZE', 25))  # product updates per commit
+    SCRAPE_CACHE_DIR = os.environ.get('SCRAPE_CACHE_DIR') or os.path.join(
+        Path(__file__).parent.parent, 'data', 'cache', 'html'
+    )
+    SCRAPE_CACHE_TTL = int(os.environ.get('SCRAPE_CACHE_TTL', 86400))  # seconds
+    SCRAPE_CACHE_MAX_BYTES = int(os.environ.get('SCRAPE_CACHE_MAX_BYTES', 209715200))  # 200MB
+    SCRAPE_REQUESTS_PER_MINUTE = int(os.environ.get('SCRAPE_REQUESTS_PER_MINUTE', 120))  # 0 = unlimited
+    SCRAPE_REQUEST_BURST = int(os.environ.get('SCRAPE_REQUEST_BURST', 10))
+    
+    # Stock/price monitor
+    MONITOR_ENABLED = os.environ.get('MONITOR_ENABLED', 'true').lower() == 'true'
+    MONITOR_TICK = float(os.environ.get('MONITOR_TICK', 30))  # seconds between scheduling passes
+    MONITOR_CONCURRENCY = int(os.environ.get('MONITOR_CONCURRENCY', 2))
+    MONITOR_BATCH_SIZE = int(os.environ.get('MONITOR_BATCH_SIZE', 20))  # max products per pass
+    MONITOR_BUDGET_SHARE = float(os.environ.get('MONITOR_BUDGET_SHARE', 0.5))  # leave the rest for manual scrapes
+    MONITOR_DEFAULT_INTERVAL = 6 * 3600  # seconds
+    MONITOR_MIN_INTERVAL = 15 * 60
+    MONITOR_MAX_INTERVAL = 24 * 3600
+    MONITOR_PARTIAL_INTERVAL = 3600  # cap for partially stocked products
+    MONITOR_BACKOFF = 1.5  # interval growth per unchanged poll
+    
     # Playwright
     PLAYWRIGHT_HEADLESS = True
     PLAYWRIGHT_TIMEOUT = 30000  # 30 seconds
+    CHECKOUT_LOGIN_TIMEOUT = 15000  # login redirect
+    CHECKOUT_CART_ADD_TIMEOUT = 15000  # add-to-cart XHR
+    CHECKOUT_PAGE_TIMEOUT = 20000  # checkout form / loading overlay
+    CHECKOUT_ORDER_TIMEOUT = 45000  # place order -> success page
+    CHECKOUT_HTTP_CART = os.environ.get('CHECKOUT_HTTP_CART', 'true').lower() == 'true'
+    # Playwright trace zips: 'off', 'failed' (failed runs only) or 'slow' (failed or slow runs).
+    # Traces include what was typed, i.e. the dampfi.ch credentials.
+    CHECKOUT_TRACE = os.environ.get('CHECKOUT_TRACE', 'off').lower()
+    CHECKOUT_TRACE_SLOW_SECONDS = float(os.environ.get('CHECKOUT_TRACE_SLOW_SECONDS', 90))
+    CHECKOUT_TRACE_DIR = os.environ.get('CHECKOUT_TRACE_DIR') or os.path.join(
+        Path(__file__).parent.parent, 'data', 'traces'
+    )
+    
+    # Checkout jobs
+    # Threads feeding the browser pool; extra ones run HTTP stock checks meanwhile
+    CHECKOUT_WORKERS = int(os.environ.get('CHECKOUT_WORKERS', 0)) or 2 * default_browser_pool_size()
+    # Pre-checkout stock check: 'fail' the job, 'trim' unavailable items, or 'skip' the check
+    CHECKOUT_ON_UNAVAILABLE = os.environ.get('CHECKOUT_ON_UNAVAILABLE', 'fail')
+    # Where jobs run: 'inline' (threads of the web process) or 'worker'
+    # (scripts/checkout_worker.py; web processes only queue them)
+    CHECKOUT_RUNNER = os.environ.get('CHECKOUT_RUNNER', 'inline').lower()
+    CHECKOUT_POLL_INTERVAL = float(os.environ.get('CHECKOUT_POLL_INTERVAL', 2))  # seconds, worker mode
+    # A running job's owner renews its lease every third of this; jobs whose
+    # lease ran out are failed as interrupted
+    CHECKOUT_LEASE_SECONDS = float(os.environ.get('CHECKOUT_LEASE_SECONDS', 60))
+    CHECKOUT_WORKER_HEARTBEAT = os.environ.get('CHECKOUT_WORKER_HEARTBEAT') or os.path.join(
+        Path(__file__).parent.parent, 'data', 'checkout_worker.json'
+    )
+    
+    # Production server (gunicorn.conf.py; 0 = derive from the CPU count)
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 0)) or default_web_workers()
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 0)) or default_web_threads()
+    
+    # Browser pool (warm Chromium instances for checkouts)
+    BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 0)) or default_browser_pool_size()  # max concurrent checkouts
+    BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', 20))  # relaunch after N checkouts
+    BROWSER_MAX_MEMORY_MB = int(os.environ.get('BROWSER_MAX_MEMORY_MB', 0)) or BROWSER_POOL_SIZE * BROWSER_INSTANCE_MB * 2  # recycle above
 
 
 
@@ -1,13 +1,83 @@
 import sqlite3
 import json
 import os
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 from app.config import Config
+from app import metrics
 
-def get_db():
-    """Get database connection"""
-    # Ensure database directory exists and has proper permissions
-    db_path = Config.DATABASE_PATH
+# One SQLite connection per thread, opened lazily and reused for the life of
+# the thread. Flask request threads (gunicorn gthread workers) and background
+# threads each get their own connection, so nothing is shared across threads.
+_local = threading.local()
+_dirs_ready = False
+
+DB_QUERY_SECONDS = metrics.histogram(
+    'sqlite_query_duration_seconds', 'Time spent in execute/executemany/commit',
+    ['statement'], buckets=metrics.DB_BUCKETS
+)
+DB_HANDLES = metrics.counter('sqlite_handles', 'get_db() calls', ['connection'])
+STATEMENT_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'CREATE', 'PRAGMA'}
+
+def _statement_kind(sql):
+    kind = sql.lstrip()[:6].upper()
+    return kind if kind in STATEMENT_KINDS else 'OTHER'
+
+class PooledConnection:
+    """Thin wrapper around a thread-owned sqlite3 connection.
+
+    Callers keep using the ``conn = get_db() ... conn.close()`` pattern;
+    ``close()`` only ends any open transaction and hands the connection back
+    to its thread instead of closing the underlying handle.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return self._conn.execute(sql, parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=_statement_kind(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return self._conn.executemany(sql, seq_of_parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=_statement_kind(sql))
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement='COMMIT')
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            release_db()
+
+def _ensure_db_dir(db_path):
+    """Create the database directory once per process"""
+    global _dirs_ready
+    if _dirs_ready:
+        return
     db_dir = os.path.dirname(db_path)
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
@@ -16,22 +86,100 @@ def get_db():
             os.chmod(db_dir, 0o755)
         except:
             pass  # Ignore if chmod fails
-    
-    # Connect to database
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    _dirs_ready = True
+
+def _connect(db_path):
+    """Open a new connection and apply per-connection pragmas"""
+    conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        timeout=Config.SQLITE_BUSY_TIMEOUT,
+        cached_statements=Config.SQLITE_STATEMENT_CACHE
+    )
     conn.row_factory = sqlite3.Row
-    
-    # Ensure database file has write permissions
-    try:
-        if os.path.exists(db_path):
-            os.chmod(db_path, 0o644)
-    except:
-        pass  # Ignore if chmod fails
-    
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = {int(Config.SQLITE_CACHE_SIZE)}')
+    conn.execute(f'PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}')
     return conn
 
-def create_tables():
-    """Create all database tables"""
+def get_db():
+    """Get the database connection for the current thread"""
+    db_path = Config.DATABASE_PATH
+    conn = getattr(_local, 'conn', None)
+    # Reopen after a fork (gunicorn --preload) or a DATABASE_PATH change
+    if conn is not None and (_local.pid != os.getpid() or _local.path != db_path):
+        conn = None
+    if conn is None:
+        _ensure_db_dir(db_path)
+        conn = _connect(db_path)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = db_path
+        _local.depth = 0
+        DB_HANDLES.inc(connection='opened')
+    else:
+        DB_HANDLES.inc(connection='reused')
+    _local.depth += 1
+    return PooledConnection(conn)
+
+def release_db():
+    """Release one handle; roll back a transaction left open by the outermost"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        return
+    _local.depth = max(_local.depth - 1, 0)
+    if _local.depth == 0 and conn.in_transaction:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            pass
+
+def close_db(exception=None):
+    """Flask teardown hook: return the thread's connection to a clean state"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        _local.depth = 1
+        release_db()
+
+def close_thread_db():
+    """Close the current thread's connection for good (worker shutdown)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        if _local.pid == os.getpid():
+            conn.close()
+
+# Expands orders.items (JSON list of cart items) into order_items rows.
+# Names, ids and prices missing from an item are taken from the product
+# with the same URL.
+ORDER_ITEMS_INSERT = '''
+    INSERT INTO order_items (order_id, position, product_id, product_url, name,
+                             option_value, option_label, quantity, unit_price)
+    SELECT o.id, CAST(j.key AS INTEGER),
+           COALESCE(json_extract(o.items, j.fullkey || '.product_id'), p.id),
+           json_extract(o.items, j.fullkey || '.product_url'),
+           COALESCE(json_extract(o.items, j.fullkey || '.name'),
+                    json_extract(o.items, j.fullkey || '.product_name'), p.name),
+           json_extract(o.items, j.fullkey || '.option_value'),
+           json_extract(o.items, j.fullkey || '.option_label'),
+           COALESCE(CAST(json_extract(o.items, j.fullkey || '.quantity') AS INTEGER), 1),
+           COALESCE(json_extract(o.items, j.fullkey || '.price'), p.price)
+    FROM orders o
+    JOIN json_each(CASE WHEN json_valid(o.items) THEN o.items ELSE '[]' END) j
+    LEFT JOIN products p ON p.product_url = json_extract(o.items, j.fullkey || '.product_url')
+    WHERE json_extract(o.items, j.fullkey || '.product_url') IS NOT NULL AND {where}
+'''
+
+def create_tables(commit=True):
+    """
+    Create the baseline schema (tables that do not exist yet)
+    
+    Only cheap statements belong here. Anything that touches existing rows
+    (new columns, indexes on tables that may already be large, data
+    backfills) is a versioned migration in app/migrations, which runs after
+    the pre-migration backup. With commit=False the caller owns the
+    transaction (migrate's dry run).
+    """
     conn = get_db()
     try:
         # Users table
@@ -47,6 +195,16 @@ def create_tables():
             )
         ''')
         
+        # Saved dampfi.ch browser sessions (encrypted Playwright storage_state)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_sessions (
+                user_id INTEGER PRIMARY KEY,
+                storage_state BLOB NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        
         # Products table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS products (
@@ -57,11 +215,45 @@ def create_tables():
                 stock_status TEXT DEFAULT 'unknown',
                 options TEXT,
                 image_path TEXT,
+                image_variants TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
+        # Catalog version: bumped by triggers on every products write so each
+        # process can tell cheaply whether its cached catalog is stale
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS products_version_{event.lower()}
+                AFTER {event} ON products
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+        
+        # Stock monitor schedule (adaptive per-product polling interval)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS product_monitor (
+                product_id INTEGER PRIMARY KEY,
+                interval_seconds REAL NOT NULL,
+                next_check_at REAL NOT NULL,
+                last_checked_at REAL,
+                last_changed_at REAL,
+                failures INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_product_monitor_due ON product_monitor (next_check_at)'
+        )
+        
         # Orders table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS orders (
@@ -76,6 +268,101 @@ def create_tables():
             )
         ''')
         
+        # Order lines, normalized from orders.items for SQL aggregates
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS order_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                product_id INTEGER,
+                product_url TEXT NOT NULL,
+                name TEXT,
+                option_value TEXT,
+                option_label TEXT,
+                quantity INTEGER NOT NULL DEFAULT 1,
+                unit_price REAL,
+                FOREIGN KEY (order_id) REFERENCES orders(id)
+            )
+        ''')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id, position)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_url)')
+        
+        # Checkout jobs (one per checkout submission)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS checkout_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                submission_key TEXT UNIQUE NOT NULL,
+                user_id INTEGER NOT NULL,
+                items TEXT NOT NULL,
+                status TEXT DEFAULT 'queued',
+                progress TEXT,
+                steps TEXT DEFAULT '[]',
+                result TEXT,
+                worker_pid INTEGER,
+                worker_instance TEXT,
+                lease_until TIMESTAMP,
+                on_unavailable TEXT,
+                batch_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_checkout_jobs_user_status ON checkout_jobs (user_id, status)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_checkout_jobs_finished ON checkout_jobs (finished_at)'
+        )
+        
+        # Checkout spans (one row per step, plus a root 'checkout' span per run)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                trace_id TEXT NOT NULL,
+                order_id INTEGER,
+                user_id INTEGER,
+                name TEXT NOT NULL,
+                url TEXT,
+                status TEXT,
+                started_at TIMESTAMP,
+                ended_at TIMESTAMP,
+                duration_ms REAL,
+                attributes TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_traces_trace ON traces (trace_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_traces_order ON traces (order_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_traces_started ON traces (started_at, name)')
+        
+        # HTTP validators and last parse result per scraped URL
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_cache (
+                product_url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                parser_version INTEGER,
+                result TEXT,
+                fetched_at TIMESTAMP
+            )
+        ''')
+        
+        # Bulk scrape runs (progress of background refreshes)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT DEFAULT 'running',
+                total INTEGER DEFAULT 0,
+                done INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                errors TEXT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        
         # Logs table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS logs (
@@ -86,28 +373,211 @@ def create_tables():
                 context TEXT
             )
         ''')
-        
-        conn.commit()
+
+        if commit:
+            conn.commit()
     except Exception as e:
         print(f"Error creating tables: {e}")
         raise
     finally:
         conn.close()
 
-def init_db():
-    """Initialize database with tables"""
-    create_tables()
+def configure_db():
+    """Apply database-wide settings that persist in the database file"""
+    conn = get_db()
+    try:
+        # WAL lets readers proceed while a writer holds the lock
+        conn.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conn.close()
+
+    # Ensure database file has write permissions
+    try:
+        if os.path.exists(Config.DATABASE_PATH):
+            os.chmod(Config.DATABASE_PATH, 0o644)
+    except:
+        pass  # Ignore if chmod fails
+
+def init_db(backup=None):
+    """Initialize database with tables and apply pending migrations"""
+    from app.migrations import migrate
+    
+    # A brand-new database has nothing worth backing up
+    fresh = not os.path.exists(Config.DATABASE_PATH) or os.path.getsize(Config.DATABASE_PATH) == 0
+    configure_db()
+    if backup is None:
+        backup = Config.DB_BACKUP_ON_MIGRATE and not fresh
+    # migrate() backs up first, then creates missing tables and migrates
+    return migrate(backup=backup)
+
+class LogWriter:
+    """Background writer that batches log records into the logs table.
+
+    Records are queued in memory and a single daemon thread drains them,
+    inserting each batch with executemany in one transaction. A batch is
+    written when it reaches LOG_BATCH_SIZE records or LOG_FLUSH_INTERVAL
+    seconds after its first record, whichever comes first. When the queue is
+    full, callers wait up to LOG_ENQUEUE_TIMEOUT seconds and the record is
+    then dropped (and counted) rather than blocking the request.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_size=None, batch_size=None, flush_interval=None, enqueue_timeout=None):
+        self.batch_size = batch_size or Config.LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.LOG_FLUSH_INTERVAL
+        self.enqueue_timeout = Config.LOG_ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_size or Config.LOG_QUEUE_SIZE)
+        self.dropped = 0  # not yet reported in the logs table
+        self.total_dropped = 0  # since start, never reset
+        self.written = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start the writer thread (again, if this is a forked child)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Records queued by the parent before a fork belong to the parent
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, record):
+        """Queue one (timestamp, level, message, context) row"""
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self.queue.put(record, timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self.total_dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """Block until every record queued so far has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def stop(self, timeout=5):
+        """Write out everything still queued and stop the thread"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        """Queue depth and counters for monitoring"""
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.total_dropped
+        }
+
+    def _run(self):
+        try:
+            while True:
+                batch = [self.queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size and not self._is_marker(batch[-1]):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                try:
+                    self._write([r for r in batch if not self._is_marker(r)])
+                except Exception as e:
+                    # Keep the thread alive; flush() waiters are still released
+                    print(f"Error writing log batch: {e}")
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if batch[-1] is self._STOP:
+                    return
+        finally:
+            close_thread_db()
+
+    def _is_marker(self, item):
+        return item is self._STOP or isinstance(item, threading.Event)
+
+    def _write(self, records):
+        dropped = 0
+        with self._lock:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+        if dropped:
+            records.append((
+                datetime.utcnow().isoformat(), 'warning',
+                f'Log queue full, dropped {dropped} message(s)', None
+            ))
+        if not records:
+            return
+        conn = None
+        try:
+            conn = get_db()
+            conn.executemany(
+                'INSERT INTO logs (timestamp, level, message, context) VALUES (?, ?, ?, ?)',
+                records
+            )
+            conn.commit()
+            self.written += len(records)
+        except Exception as e:
+            print(f"Error writing {len(records)} log message(s): {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+log_writer = LogWriter()
+atexit.register(log_writer.stop)
+
+metrics.gauge_callback('log_writer_queue_depth', 'Log records waiting to be written',
+                       lambda: log_writer.queue.qsize())
+metrics.gauge_callback('log_writer_dropped', 'Log records dropped because the queue was full',
+                       lambda: log_writer.total_dropped, kind='counter')
 
 def log_message(level, message, context=None):
     """Log a message to the database"""
+    try:
+        record = (
+            datetime.utcnow().isoformat(), level, message,
+            json.dumps(context, default=str) if context else None
+        )
+    except Exception as e:
+        print(f"Error logging message: {e}")
+        return
+    if Config.LOG_ASYNC:
+        log_writer.enqueue(record)
+        return
     conn = get_db()
     try:
         conn.execute(
             'INSERT INTO logs (timestamp, level, message, context) VALUES (?, ?, ?, ?)',
-            (datetime.utcnow().isoformat(), level, message, json.dumps(context) if context else None)
+            record
         )
         conn.commit()
     except Exception as e:
         print(f"Error logging message: {e}")
     finally:
         conn.close()
+
+def flush_logs(timeout=5):
+    """Wait until queued log messages have been written"""
+    log_writer.flush(timeout)
@@ -0,0 +1,371 @@
+import os
+import json
+import uuid
+import glob
+import atexit
+import bisect
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no archive compaction
+    fcntl = None
+
+# Minimal in-process metrics in the Prometheus text format. Every metric
+# keeps its samples in a dict guarded by its own lock, so updating one is a
+# dict lookup plus an add.
+#
+# Values live in the process that records them. gunicorn workers share one
+# port, so a scrape reaches an arbitrary worker; with enable_multiprocess()
+# every process also writes its values to a shared directory and /metrics
+# serves the merge of all of them (see MultiprocessStore).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+STEP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key, *extra):
+        return list(zip(self.labelnames, key)) + list(extra)
+
+    def samples(self):
+        """(suffix, [(label, value), ...], value) tuples"""
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '_total', self._labels(key), value
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (last one is +Inf), sum]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1]) for key, state in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', self._labels(key, ('le', _format_value(bound))), cumulative
+            yield '_sum', self._labels(key), total
+            yield '_count', self._labels(key), cumulative
+
+class CallbackGauge(_Metric):
+    """Value read at scrape time, for queue depths, pool sizes and counters
+    kept elsewhere (``kind='counter'``)
+
+    ``func`` returns a number, or a dict mapping label-value tuples (in
+    labelnames order) to numbers.
+    """
+
+    def __init__(self, name, documentation, func, labelnames=(), kind='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self.type = kind
+
+    def samples(self):
+        suffix = '_total' if self.type == 'counter' else ''
+        value = self.func()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            yield suffix, [], value
+            return
+        for key, sample in value.items():
+            if sample is not None:
+                yield suffix, self._labels(tuple(str(v) for v in key)), sample
+
+def render_families(families):
+    """(name, type, documentation, samples) tuples in the Prometheus text format"""
+    lines = []
+    for name, kind, documentation, samples in families:
+        if samples is None:
+            lines.append(f'# {name} unavailable: {_escape(documentation)}')
+            continue
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; registering a name twice returns the first one"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def collect(self):
+        """(name, type, documentation, samples) per metric; samples None if it failed"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = []
+        for metric in metrics:
+            try:
+                families.append((metric.name, metric.type, metric.documentation, list(metric.samples())))
+            except Exception as e:
+                families.append((metric.name, metric.type, str(e), None))
+        return families
+
+    def reset(self):
+        """Forget recorded values (a forked child starts from zero)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            with metric._lock:
+                metric._values.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        return render_families(self.collect())
+
+registry = Registry()
+_registry_pid = os.getpid()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MultiprocessStore:
+    """Metrics of all processes of a server, merged through a directory
+
+    Every process rewrites its own snapshot file every ``interval`` seconds
+    and at exit; render() merges all snapshots. Counters and histograms are
+    summed, including those of processes that have exited, so they never go
+    back when gunicorn recycles a worker; snapshots of exited processes on
+    this host are folded into one archive file. Gauges are reported per
+    live process with a ``pid`` label.
+    """
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, registry, directory, interval=5):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.host = socket.gethostname()
+        self.path = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start writing this process's snapshot"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if os.getpid() != _registry_pid:
+                # Values copied from the parent by fork() are the parent's
+                self.registry.reset()
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f'{self.host}-{self._pid}-{uuid.uuid4().hex[:8]}.json')
+        self.write()
+        threading.Thread(target=self._loop, name='metrics-writer', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                print(f'Error writing metrics snapshot: {e}')
+
+    def write(self):
+        """Replace this process's snapshot file"""
+        if self._pid != os.getpid():
+            return
+        families = [family for family in self.registry.collect() if family[3] is not None]
+        self._dump(self.path, {'host': self.host, 'pid': self._pid, 'metrics': families})
+
+    def _dump(self, path, data):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # removed or being replaced
+
+    def _is_live(self, path, data):
+        if data.get('host') == self.host and fcntl is not None:
+            return _pid_alive(data['pid'])
+        # Another container, or no safe liveness check: recently written
+        try:
+            return time.time() - os.path.getmtime(path) < 3 * self.interval
+        except OSError:
+            return False
+
+    def _snapshots(self):
+        archive = os.path.join(self.directory, self.ARCHIVE)
+        paths = [p for p in sorted(glob.glob(os.path.join(self.directory, '*.json'))) if p != archive]
+        return archive, paths
+
+    def _compact(self):
+        """Fold the counters and histograms of exited processes into the archive"""
+        if fcntl is None:
+            return
+        archive_path, paths = self._snapshots()
+        with open(os.path.join(self.directory, 'compact.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # another process is compacting
+            dead = []
+            for path in paths:
+                data = self._load(path)
+                if data and data.get('host') == self.host and not _pid_alive(data['pid']):
+                    dead.append((path, data))
+            if not dead:
+                return
+            archive = self._load(archive_path) or {'metrics': []}
+            families = _merge([archive] + [data for _, data in dead], include_gauges=False)
+            self._dump(archive_path, {'metrics': families})
+            for path, _ in dead:
+                os.remove(path)
+
+    def collect(self):
+        """Merged families of every process"""
+        self.write()
+        self._compact()
+        archive_path, paths = self._snapshots()
+        snapshots = [self._load(archive_path)]
+        for path in sorted(paths, key=lambda p: p != self.path):  # own metrics first
+            data = self._load(path)
+            if data:
+                data['live'] = self._is_live(path, data)
+                snapshots.append(data)
+        return _merge([s for s in snapshots if s], include_gauges=True)
+
+def _merge(snapshots, include_gauges):
+    merged = {}
+    for snapshot in snapshots:
+        for name, kind, documentation, samples in snapshot['metrics']:
+            family = merged.setdefault(name, (kind, documentation, {}))
+            if kind == 'gauge':
+                if not include_gauges or not snapshot.get('live'):
+                    continue
+                extra = (('pid', str(snapshot['pid'])),)
+            else:
+                extra = ()
+            values = family[2]
+            for suffix, labels, value in samples:
+                key = (suffix, tuple(tuple(label) for label in labels) + extra)
+                values[key] = values.get(key, 0) + value
+    return [(name, kind, documentation, [(suffix, list(labels), value)
+                                          for (suffix, labels), value in values.items()])
+            for name, (kind, documentation, values) in merged.items()]
+
+_store = None
+
+def enable_multiprocess(directory, interval=5):
+    """Share this process's metrics through directory and serve the merge"""
+    global _store
+    if _store is None or _store.directory != directory:
+        _store = MultiprocessStore(registry, directory, interval)
+    _store.start()
+
+def clear_multiprocess_dir(directory):
+    """Remove the snapshots of a previous server run (gunicorn master start)"""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+def render():
+    """/metrics body: this process's metrics, or all processes' when shared"""
+    if _store is not None and _store._pid == os.getpid():
+        return render_families(_store.collect())
+    return registry.render()
+
+@atexit.register
+def _write_final_snapshot():
+    if _store is not None:
+        try:
+            _store.write()
+        except Exception:
+            pass
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+def gauge_callback(name, documentation, func, labelnames=(), kind='gauge'):
+    return registry.register(CallbackGauge(name, documentation, func, labelnames, kind))
@@ -0,0 +1,5 @@
+"""Add products.image_variants (resized image files)"""
+from app.migrations import add_column
+
+def upgrade(conn):
+    add_column(conn, 'products', 'image_variants', 'TEXT')
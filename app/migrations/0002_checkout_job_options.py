@@ -0,0 +1,7 @@
+"""Add checkout_jobs.on_unavailable and batch_id"""
+from app.migrations import add_column
+
+def upgrade(conn):
+    add_column(conn, 'checkout_jobs', 'on_unavailable', 'TEXT')
+    add_column(conn, 'checkout_jobs', 'batch_id', 'TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_checkout_jobs_batch ON checkout_jobs (batch_id)')
@@ -0,0 +1,12 @@
+"""Fill order_items from the JSON items of existing orders"""
+from app.database import ORDER_ITEMS_INSERT
+from app.migrations import backfill_by_id
+
+def upgrade(conn):
+    pass  # order_items is part of the baseline schema
+
+def backfill(conn):
+    backfill_by_id(conn, 'orders', ORDER_ITEMS_INSERT.format(where='''
+        o.id >= ? AND o.id < ?
+        AND NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)
+    '''))
@@ -0,0 +1,6 @@
+"""Add checkout_jobs.worker_instance and lease_until"""
+from app.migrations import add_column
+
+def upgrade(conn):
+    add_column(conn, 'checkout_jobs', 'worker_instance', 'TEXT')
+    add_column(conn, 'checkout_jobs', 'lease_until', 'TIMESTAMP')
@@ -0,0 +1,9 @@
+"""Index products for the catalog listing and its filters"""
+
+def upgrade(conn):
+    # Newest first, optionally filtered by stock or price
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_created ON products (created_at DESC, id DESC)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_products_stock_created ON products (stock_status, created_at DESC, id DESC)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)')
@@ -0,0 +1,5 @@
+"""Index orders by user and time"""
+
+def upgrade(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_timestamp ON orders (user_id, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (timestamp)')
@@ -0,0 +1,6 @@
+"""Index logs by time and level"""
+
+def upgrade(conn):
+    # Newest-first listing, time-range filters and retention pruning
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_level_timestamp ON logs (level, timestamp)')
@@ -0,0 +1,58 @@
+"""Record product price/stock history, starting from the current values"""
+from app.migrations import backfill_by_id
+
+def upgrade(conn):
+    # One row per actual change, written by triggers so every writer
+    # (manual scrape, bulk refresh, monitor, API) is covered
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            price REAL,
+            stock_status TEXT,
+            options TEXT,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_product_history_product ON product_history (product_id, changed_at)'
+    )
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_history_insert
+        AFTER INSERT ON products
+        BEGIN
+            INSERT INTO product_history (product_id, price, stock_status, options)
+            VALUES (NEW.id, NEW.price, NEW.stock_status, NEW.options);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_history_update
+        AFTER UPDATE OF price, stock_status, options ON products
+        WHEN OLD.price IS NOT NEW.price
+          OR OLD.stock_status IS NOT NEW.stock_status
+          OR OLD.options IS NOT NEW.options
+        BEGIN
+            INSERT INTO product_history (product_id, price, stock_status, options)
+            VALUES (NEW.id, NEW.price, NEW.stock_status, NEW.options);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_history_delete
+        AFTER DELETE ON products
+        BEGIN
+            DELETE FROM product_history WHERE product_id = OLD.id;
+            DELETE FROM product_monitor WHERE product_id = OLD.id;
+        END
+    ''')
+
+def backfill(conn):
+    # Baseline for products that have no history yet (created before it
+    # was recorded). updated_at is an ISO string with a 'T'; datetime()
+    # gives it the trigger rows' CURRENT_TIMESTAMP format so they sort together
+    backfill_by_id(conn, 'products', '''
+        INSERT INTO product_history (product_id, price, stock_status, options, changed_at)
+        SELECT p.id, p.price, p.stock_status, p.options, COALESCE(datetime(p.updated_at), CURRENT_TIMESTAMP)
+        FROM products p
+        WHERE p.id >= ? AND p.id < ?
+          AND NOT EXISTS (SELECT 1 FROM product_history h WHERE h.product_id = p.id)
+    ''')
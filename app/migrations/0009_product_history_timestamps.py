@@ -0,0 +1,12 @@
+"""Rewrite ISO 'T' timestamps in product_history in CURRENT_TIMESTAMP format"""
+from app.migrations import backfill_by_id
+
+def upgrade(conn):
+    pass
+
+def backfill(conn):
+    # Baseline rows written by an earlier 0008 copied products.updated_at as is
+    backfill_by_id(conn, 'product_history', '''
+        UPDATE product_history SET changed_at = datetime(changed_at)
+        WHERE id >= ? AND id < ? AND changed_at LIKE '%T%' AND datetime(changed_at) IS NOT NULL
+    ''')
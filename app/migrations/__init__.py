@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import sqlite3
+import importlib
+from datetime import datetime
+from app.config import Config
+from app.database import get_db, create_tables, log_message
+
+# Versioned schema migrations. Each NNNN_name.py module in this package
+# defines upgrade(conn) and, for data changes on large tables, an optional
+# backfill(conn). The database's PRAGMA user_version holds the number of
+# the last migration applied.
+#
+# upgrade() runs in its own transaction together with the version bump.
+# backfill() runs after upgrade() has committed, in short transactions of
+# its own (see backfill_by_id), and the version is bumped only once it has
+# finished, so an interrupted backfill simply runs again. Both must
+# therefore be safe to re-run.
+
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+        self.description = (module.__doc__ or name).strip().splitlines()[0]
+
+    @property
+    def has_backfill(self):
+        return hasattr(self.module, 'backfill')
+
+    def __repr__(self):
+        return f'<Migration {self.version:04d}_{self.name}>'
+
+def discover_migrations():
+    """All migrations in this package, ordered by version"""
+    migrations = []
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            module = importlib.import_module(f'{__name__}.{filename[:-3]}')
+            migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f'Duplicate migration versions in {versions}')
+    return migrations
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def pending_migrations():
+    """Migrations newer than the database's user_version"""
+    conn = get_db()
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    return [m for m in discover_migrations() if m.version > version]
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ADD COLUMN unless the column already exists"""
+    columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def backfill_by_id(conn, table, sql, chunk_size=None, pause=None):
+    """
+    Run a data backfill over a table in id ranges, one transaction each
+
+    sql takes two parameters, the start (inclusive) and end (exclusive) of
+    the id range. Pausing between chunks lets the app's writers in while a
+    large table is rewritten.
+
+    Returns:
+        number of rows changed
+    """
+    chunk_size = chunk_size or Config.DB_MIGRATION_CHUNK
+    pause = Config.DB_MIGRATION_PAUSE if pause is None else pause
+    row = conn.execute(f'SELECT MIN(id), MAX(id) FROM {table}').fetchone()
+    if row[0] is None:
+        return 0
+    changed = 0
+    for start in range(row[0], row[1] + 1, chunk_size):
+        cursor = conn.execute(sql, (start, start + chunk_size))
+        conn.commit()
+        changed += max(cursor.rowcount, 0)
+        time.sleep(pause)
+    return changed
+
+def backup_database(directory=None, label='backup'):
+    """
+    Copy the database with SQLite's online backup API
+
+    The copy is consistent even while the app keeps writing, and is made a
+    batch of pages at a time so writers are not blocked for long.
+    """
+    directory = directory or Config.DB_BACKUP_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(Config.DATABASE_PATH))[0]
+    path = os.path.join(directory, f"{name}-{label}-{datetime.utcnow():%Y%m%dT%H%M%S}.db")
+    source = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.SQLITE_BUSY_TIMEOUT)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=1024, sleep=0.01)
+        # The copy inherits WAL mode; make it a self-contained single file
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+    return path
+
+def _apply(conn, migration):
+    # IMMEDIATE takes the write lock up front; another process migrating the
+    # same database waits here and then finds the migration applied
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if current_version(conn) >= migration.version:
+            conn.rollback()
+            return False
+        migration.module.upgrade(conn)
+        if not migration.has_backfill:
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if migration.has_backfill:
+        migration.module.backfill(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(f'PRAGMA user_version = {max(migration.version, current_version(conn))}')
+        conn.commit()
+    return True
+
+def migrate(dry_run=False, backup=True):
+    """
+    Bring the schema up to date: create missing tables, then apply pending
+    migrations in order
+
+    The backup is taken before anything is changed. With dry_run, the
+    table creation and every pending upgrade() are executed in one
+    transaction that is then rolled back (checking them against the real
+    schema); backfills are not run and nothing is backed up or changed.
+
+    Returns:
+        list of the migrations applied (or that would be applied)
+    """
+    pending = pending_migrations()
+
+    conn = get_db()
+    try:
+        if dry_run:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                create_tables(commit=False)
+                for migration in pending:
+                    migration.module.upgrade(conn)
+            finally:
+                conn.rollback()
+            return pending
+
+        backup_path = None
+        if backup and pending:
+            backup_path = backup_database(label=f'v{current_version(conn)}')
+
+        create_tables()
+        if backup_path:
+            # Logged once the logs table is sure to exist
+            log_message('info', 'Database backed up before migrating', {'path': backup_path})
+        applied = []
+        for migration in pending:
+            started = time.perf_counter()
+            if _apply(conn, migration):
+                applied.append(migration)
+                log_message('info', f'Applied migration {migration.version:04d}_{migration.name}', {
+                    'description': migration.description,
+                    'seconds': round(time.perf_counter() - started, 3)
+                })
+        return applied
+    finally:
+        conn.close()
@@ -1,5 +1,9 @@
-from app.database import get_db
+from app.database import get_db, ORDER_ITEMS_INSERT
+from app.cache import catalog_cache
+from app.utils.helpers import encrypt_data, decrypt_data
+import re
 import json
+import base64
 import sqlite3
 from datetime import datetime
 
@@ -14,44 +18,194 @@ def get_product_by_id(product_id):
             product = dict(row)
             if product.get('options'):
                 product['options'] = json.loads(product['options'])
+            if product.get('image_variants'):
+                product['image_variants'] = json.loads(product['image_variants'])
             return product
         return None
     finally:
         conn.close()
 
-def get_all_products():
-    """Get all products"""
+def get_product_by_url(product_url):
+    """Get product by URL (uses the UNIQUE index on product_url)"""
     conn = get_db()
     try:
-        rows = conn.execute(
-            'SELECT * FROM products ORDER BY created_at DESC'
-        ).fetchall()
-        products = []
-        for row in rows:
+        row = conn.execute(
+            'SELECT * FROM products WHERE product_url = ?', (product_url,)
+        ).fetchone()
+        if row:
             product = dict(row)
             if product.get('options'):
                 product['options'] = json.loads(product['options'])
-            products.append(product)
-        return products
+            if product.get('image_variants'):
+                product['image_variants'] = json.loads(product['image_variants'])
+            return product
+        return None
+    finally:
+        conn.close()
+
+def get_catalog_version():
+    """Current products version (bumped by triggers on every write)"""
+    conn = get_db()
+    try:
+        row = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+        return row['version'] if row else 0
     finally:
         conn.close()
 
+def count_products_with_image(image_path):
+    """How many products reference a (content-addressed, shareable) image"""
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT COUNT(*) AS n FROM products WHERE image_path = ?', (image_path,)
+        ).fetchone()
+        return row['n']
+    finally:
+        conn.close()
+
+# Columns that may be requested through list_products(fields=...)
+PRODUCT_FIELDS = (
+    'id', 'product_url', 'name', 'price', 'stock_status', 'options',
+    'image_path', 'image_variants', 'created_at', 'updated_at'
+)
+
+def encode_cursor(created_at, product_id):
+    """Opaque keyset cursor for the product listing"""
+    raw = json.dumps([created_at, product_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, product_id = json.loads(base64.urlsafe_b64decode(padded))
+        return created_at, int(product_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def list_products(limit=None, cursor=None, stock_status=None, min_price=None, max_price=None, fields=None):
+    """
+    List products newest first with keyset pagination
+    
+    Args:
+        limit: page size (None returns every matching product)
+        cursor: next_cursor from the previous page
+        stock_status: only products with this stock status
+        min_price / max_price: inclusive price range
+        fields: columns to return (default all); 'id' is always included
+    
+    Returns:
+        tuple (products, next_cursor or None)
+    """
+    columns = [f for f in PRODUCT_FIELDS if fields is None or f in fields or f == 'id']
+    select = list(dict.fromkeys(columns + ['created_at']))
+    
+    where = []
+    params = []
+    if stock_status:
+        where.append('stock_status = ?')
+        params.append(stock_status)
+    if min_price is not None:
+        where.append('price >= ?')
+        params.append(min_price)
+    if max_price is not None:
+        where.append('price <= ?')
+        params.append(max_price)
+    if cursor:
+        where.append('(created_at, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    
+    sql = f'SELECT {", ".join(select)} FROM products'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        # Fetch one extra row to know whether there is a next page
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    
+    conn = get_db()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    
+    products = []
+    for row in rows:
+        product = {column: row[column] for column in columns}
+        if product.get('options'):
+            product['options'] = json.loads(product['options'])
+        if product.get('image_variants'):
+            product['image_variants'] = json.loads(product['image_variants'])
+        products.append(product)
+    return products, next_cursor
+
+def get_all_products():
+    """Get all products"""
+    products, _ = list_products()
+    return products
+
 def create_product(product_url, name, price=None, stock_status='unknown', options=None, image_path=None):
-    """Create a new product"""
+    """Create a new product; returns None if the URL already exists"""
     conn = get_db()
     try:
         options_json = json.dumps(options) if options else None
-        conn.execute('''
+        cursor = conn.execute('''
             INSERT INTO products (product_url, name, price, stock_status, options, image_path)
             VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(product_url) DO NOTHING
         ''', (product_url, name, price, stock_status, options_json, image_path))
         conn.commit()
-        return conn.lastrowid
+        catalog_cache.invalidate()
+        return cursor.lastrowid if cursor.rowcount == 1 else None
     except sqlite3.IntegrityError:
         return None
     finally:
         conn.close()
 
+def create_products_bulk(products):
+    """
+    Insert many products in one transaction
+    
+    Args:
+        products: list of dicts with 'product_url' and optional 'name',
+                  'price', 'stock_status', 'options'
+    
+    Returns:
+        list of (product_id or None, created flag), one per input row
+    """
+    conn = get_db()
+    try:
+        results = []
+        for product in products:
+            options = product.get('options')
+            cursor = conn.execute('''
+                INSERT INTO products (product_url, name, price, stock_status, options)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(product_url) DO NOTHING
+            ''', (
+                product['product_url'],
+                product.get('name') or 'Unknown Product',
+                product.get('price'),
+                product.get('stock_status') or 'unknown',
+                json.dumps(options) if options else None
+            ))
+            created = cursor.rowcount == 1
+            results.append((cursor.lastrowid if created else None, created))
+        conn.commit()
+        catalog_cache.invalidate()
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def update_product(product_id, **kwargs):
     """Update product fields"""
     conn = get_db()
@@ -77,6 +231,9 @@ def update_product(product_id, **kwargs):
         if 'image_path' in kwargs:
             updates.append('image_path = ?')
             values.append(kwargs['image_path'])
+        if 'image_variants' in kwargs:
+            updates.append('image_variants = ?')
+            values.append(json.dumps(kwargs['image_variants']) if kwargs['image_variants'] else None)
         
         updates.append('updated_at = ?')
         values.append(datetime.utcnow().isoformat())
@@ -87,6 +244,7 @@ def update_product(product_id, **kwargs):
             values
         )
         conn.commit()
+        catalog_cache.invalidate()
         return True
     except Exception as e:
         print(f"Error updating product: {e}")
@@ -94,6 +252,77 @@ def update_product(product_id, **kwargs):
     finally:
         conn.close()
 
+def update_products_bulk(updates):
+    """
+    Apply scrape updates to many products in one transaction
+    
+    Args:
+        updates: list of (product_id, dict) pairs; missing fields keep their value
+    """
+    if not updates:
+        return True
+    conn = get_db()
+    try:
+        now = datetime.utcnow().isoformat()
+        conn.executemany('''
+            UPDATE products SET
+                name = COALESCE(?, name),
+                price = COALESCE(?, price),
+                stock_status = COALESCE(?, stock_status),
+                options = COALESCE(?, options),
+                updated_at = ?
+            WHERE id = ?
+        ''', [
+            (
+                fields.get('name'),
+                fields.get('price'),
+                fields.get('stock_status'),
+                json.dumps(fields['options']) if fields.get('options') else None,
+                now,
+                product_id
+            )
+            for product_id, fields in updates
+        ])
+        conn.commit()
+        catalog_cache.invalidate()
+        return True
+    except Exception as e:
+        print(f"Error updating products: {e}")
+        return False
+    finally:
+        conn.close()
+
+def get_scrape_cache_entry(product_url):
+    """Get the stored validators and parse result for a URL"""
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT * FROM scrape_cache WHERE product_url = ?', (product_url,)
+        ).fetchone()
+        if not row:
+            return None
+        entry = dict(row)
+        entry['result'] = json.loads(entry['result']) if entry.get('result') else None
+        return entry
+    finally:
+        conn.close()
+
+def save_scrape_cache_entry(product_url, etag, last_modified, content_hash, parser_version, result):
+    """Store validators and parse result for a URL"""
+    conn = get_db()
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO scrape_cache
+                (product_url, etag, last_modified, content_hash, parser_version, result, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (product_url, etag, last_modified, content_hash, parser_version,
+              json.dumps(result), datetime.utcnow().isoformat()))
+        conn.commit()
+    except Exception as e:
+        print(f"Error saving scrape cache entry: {e}")
+    finally:
+        conn.close()
+
 def get_user_by_id(user_id):
     """Get user by ID"""
     conn = get_db()
@@ -122,6 +351,8 @@ def update_user_credentials(user_id, dampfi_email, dampfi_password):
             'UPDATE users SET dampfi_email = ?, dampfi_password = ? WHERE id = ?',
             (dampfi_email, dampfi_password, user_id)
         )
+        # A saved session belongs to the old account
+        conn.execute('DELETE FROM user_sessions WHERE user_id = ?', (user_id,))
         conn.commit()
         return True
     except Exception as e:
@@ -130,40 +361,646 @@ def update_user_credentials(user_id, dampfi_email, dampfi_password):
     finally:
         conn.close()
 
-def create_order(user_id, total_price, items, status='pending', confirmation_data=None):
-    """Create a new order"""
+def get_user_session(user_id):
+    """Get the saved dampfi.ch storage_state for a user, or None"""
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT storage_state FROM user_sessions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if not row:
+            return None
+        state = decrypt_data(row['storage_state'])
+        return json.loads(state) if state else None
+    finally:
+        conn.close()
+
+def save_user_session(user_id, storage_state):
+    """Store a user's dampfi.ch storage_state (cookies and localStorage), encrypted"""
     conn = get_db()
     try:
         conn.execute('''
+            INSERT INTO user_sessions (user_id, storage_state, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                storage_state = excluded.storage_state,
+                updated_at = excluded.updated_at
+        ''', (user_id, encrypt_data(json.dumps(storage_state)), datetime.utcnow().isoformat()))
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving user session: {e}")
+        return False
+    finally:
+        conn.close()
+
+def delete_user_session(user_id):
+    """Forget a user's saved dampfi.ch session"""
+    conn = get_db()
+    try:
+        conn.execute('DELETE FROM user_sessions WHERE user_id = ?', (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def create_order(user_id, total_price, items, status='pending', confirmation_data=None):
+    """Create a new order and its order_items rows"""
+    conn = get_db()
+    try:
+        cursor = conn.execute('''
             INSERT INTO orders (user_id, total_price, items, status, confirmation_data)
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, total_price, json.dumps(items), status, json.dumps(confirmation_data) if confirmation_data else None))
+        order_id = cursor.lastrowid
+        conn.execute(ORDER_ITEMS_INSERT.format(where='o.id = ?'), (order_id,))
         conn.commit()
-        return conn.lastrowid
+        return order_id
     except Exception as e:
+        conn.rollback()
         print(f"Error creating order: {e}")
         return None
     finally:
         conn.close()
 
+ORDER_ITEM_FIELDS = ('product_id', 'product_url', 'name', 'option_value', 'option_label',
+                     'quantity', 'unit_price')
+
 def get_user_orders(user_id, limit=10):
-    """Get recent orders for a user"""
+    """Get recent orders for a user, with their items"""
     conn = get_db()
     try:
         rows = conn.execute('''
-            SELECT * FROM orders 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
+            SELECT id, user_id, timestamp, total_price, status, confirmation_data
+            FROM orders
+            WHERE user_id = ?
+            ORDER BY timestamp DESC, id DESC
             LIMIT ?
         ''', (user_id, limit)).fetchall()
         orders = []
         for row in rows:
-            order = dict(row)
-            if order.get('items'):
-                order['items'] = json.loads(order['items'])
+            order = dict(row, items=[])
             if order.get('confirmation_data'):
                 order['confirmation_data'] = json.loads(order['confirmation_data'])
             orders.append(order)
+        if orders:
+            by_id = {order['id']: order for order in orders}
+            item_rows = conn.execute(f'''
+                SELECT order_id, {', '.join(ORDER_ITEM_FIELDS)} FROM order_items
+                WHERE order_id IN ({', '.join('?' * len(by_id))})
+                ORDER BY order_id, position
+            ''', list(by_id)).fetchall()
+            for item in item_rows:
+                by_id[item['order_id']]['items'].append({f: item[f] for f in ORDER_ITEM_FIELDS})
         return orders
     finally:
         conn.close()
+
+def get_recent_orders(user_id, limit=5):
+    """Order summaries (item count, order number) for the checkout review page"""
+    conn = get_db()
+    try:
+        rows = conn.execute('''
+            SELECT o.id, o.timestamp, o.total_price, o.status,
+                   json_extract(o.confirmation_data, '$.order_number') AS order_number,
+                   (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id) AS item_count
+            FROM orders o
+            WHERE o.user_id = ?
+            ORDER BY o.timestamp DESC, o.id DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def get_monthly_spend(user_id=None, since=None):
+    """Order count and spend per user per calendar month (UTC)"""
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(user_id)
+    if since:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    conn = get_db()
+    try:
+        rows = conn.execute(f'''
+            SELECT user_id, strftime('%Y-%m', timestamp) AS month,
+                   COUNT(*) AS orders, ROUND(COALESCE(SUM(total_price), 0), 2) AS spend
+            FROM orders {where}
+            GROUP BY user_id, month
+            ORDER BY month DESC, user_id
+        ''', params).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def get_top_ordered_products(limit=10, user_id=None, since=None):
+    """Products by total quantity ordered"""
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append('o.user_id = ?')
+        params.append(user_id)
+    if since:
+        clauses.append('o.timestamp >= ?')
+        params.append(since)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    conn = get_db()
+    try:
+        rows = conn.execute(f'''
+            SELECT oi.product_url, MAX(oi.product_id) AS product_id, MAX(oi.name) AS name,
+                   SUM(oi.quantity) AS quantity, COUNT(DISTINCT oi.order_id) AS orders,
+                   ROUND(SUM(oi.quantity * oi.unit_price), 2) AS revenue
+            FROM order_items oi JOIN orders o ON o.id = oi.order_id
+            {where}
+            GROUP BY oi.product_url
+            ORDER BY quantity DESC, orders DESC
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def _checkout_job_from_row(row):
+    job = dict(row)
+    job['items'] = json.loads(job['items'])
+    job['steps'] = json.loads(job['steps']) if job.get('steps') else []
+    if job.get('result'):
+        job['result'] = json.loads(job['result'])
+    return job
+
+def create_checkout_job(submission_key, user_id, items, on_unavailable=None, batch_id=None):
+    """
+    Create a checkout job, or return the existing one for this submission key
+    
+    Args:
+        on_unavailable: what the pre-checkout stock check does with
+                        unavailable items ('fail', 'trim' or 'skip')
+        batch_id: groups the jobs of one multi-user submission
+    
+    Returns:
+        tuple (job dict, created flag)
+    """
+    conn = get_db()
+    try:
+        cursor = conn.execute('''
+            INSERT INTO checkout_jobs (submission_key, user_id, items, on_unavailable, batch_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(submission_key) DO NOTHING
+        ''', (submission_key, user_id, json.dumps(items), on_unavailable, batch_id,
+              datetime.utcnow().isoformat()))
+        conn.commit()
+        created = cursor.rowcount == 1
+        row = conn.execute(
+            'SELECT * FROM checkout_jobs WHERE submission_key = ?', (submission_key,)
+        ).fetchone()
+        return _checkout_job_from_row(row), created
+    finally:
+        conn.close()
+
+def get_checkout_job(job_id):
+    """Get checkout job by ID"""
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT * FROM checkout_jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        return _checkout_job_from_row(row) if row else None
+    finally:
+        conn.close()
+
+def get_checkout_jobs_by_status(status):
+    """Get all checkout jobs with the given status"""
+    conn = get_db()
+    try:
+        rows = conn.execute(
+            'SELECT * FROM checkout_jobs WHERE status = ? ORDER BY id', (status,)
+        ).fetchall()
+        return [_checkout_job_from_row(row) for row in rows]
+    finally:
+        conn.close()
+
+def claim_checkout_job(job_id, worker_pid, worker_instance, lease_until):
+    """
+    Atomically move a queued job to running
+    
+    This is also the per-account mutex: a job is only claimed when no other
+    job of the same user is running and it is that user's oldest queued job.
+    Returns False if the job is taken, finished or has to wait its turn.
+    """
+    conn = get_db()
+    try:
+        cursor = conn.execute('''
+            UPDATE checkout_jobs
+            SET status = 'running', worker_pid = ?, worker_instance = ?, lease_until = ?, started_at = ?
+            WHERE id = ? AND status = 'queued'
+              AND NOT EXISTS (
+                  SELECT 1 FROM checkout_jobs other
+                  WHERE other.user_id = checkout_jobs.user_id AND other.status = 'running'
+              )
+              AND id = (
+                  SELECT MIN(id) FROM checkout_jobs other
+                  WHERE other.user_id = checkout_jobs.user_id AND other.status = 'queued'
+              )
+        ''', (worker_pid, worker_instance, lease_until, datetime.utcnow().isoformat(), job_id))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def renew_checkout_job_leases(worker_instance, lease_until):
+    """Extend the lease of every job this process instance is running"""
+    conn = get_db()
+    try:
+        conn.execute('''
+            UPDATE checkout_jobs SET lease_until = ?
+            WHERE status = 'running' AND worker_instance = ?
+        ''', (lease_until, worker_instance))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_abandoned_checkout_jobs(worker_instance, now=None, any_owner=False):
+    """
+    Running jobs owned by another process instance whose lease ran out
+    
+    With any_owner, every running job of another instance counts, whatever
+    its lease (the single checkout worker restarting).
+    """
+    conn = get_db()
+    try:
+        rows = conn.execute('''
+            SELECT * FROM checkout_jobs
+            WHERE status = 'running' AND worker_instance IS NOT ?
+              AND (? OR lease_until IS NULL OR lease_until < ?)
+            ORDER BY id
+        ''', (worker_instance, bool(any_owner), now or datetime.utcnow().isoformat())).fetchall()
+        return [_checkout_job_from_row(row) for row in rows]
+    finally:
+        conn.close()
+
+def get_next_queued_checkout_job(user_id):
+    """ID of the user's oldest queued job, or None"""
+    conn = get_db()
+    try:
+        row = conn.execute('''
+            SELECT MIN(id) AS id FROM checkout_jobs WHERE user_id = ? AND status = 'queued'
+        ''', (user_id,)).fetchone()
+        return row['id']
+    finally:
+        conn.close()
+
+def get_dispatchable_checkout_jobs():
+    """Oldest queued job of every account that has no running job"""
+    conn = get_db()
+    try:
+        rows = conn.execute('''
+            SELECT MIN(id) AS id FROM checkout_jobs queued
+            WHERE status = 'queued'
+              AND NOT EXISTS (
+                  SELECT 1 FROM checkout_jobs other
+                  WHERE other.user_id = queued.user_id AND other.status = 'running'
+              )
+            GROUP BY user_id
+        ''').fetchall()
+        return [row['id'] for row in rows]
+    finally:
+        conn.close()
+
+def get_checkout_batch_jobs(batch_id):
+    """All jobs of a multi-user submission"""
+    conn = get_db()
+    try:
+        rows = conn.execute(
+            'SELECT * FROM checkout_jobs WHERE batch_id = ? ORDER BY id', (batch_id,)
+        ).fetchall()
+        return [_checkout_job_from_row(row) for row in rows]
+    finally:
+        conn.close()
+
+def get_checkout_job_timings(since):
+    """user_id, status, started_at and finished_at of jobs finished since a timestamp"""
+    conn = get_db()
+    try:
+        rows = conn.execute('''
+            SELECT user_id, status, started_at, finished_at FROM checkout_jobs
+            WHERE finished_at >= ? ORDER BY finished_at
+        ''', (since,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def count_checkout_jobs_by_status():
+    """{status: count} over all checkout jobs"""
+    conn = get_db()
+    try:
+        rows = conn.execute(
+            'SELECT status, COUNT(*) AS n FROM checkout_jobs GROUP BY status'
+        ).fetchall()
+        return {row['status']: row['n'] for row in rows}
+    finally:
+        conn.close()
+
+def add_checkout_job_step(job_id, message):
+    """Record a progress step for a running job"""
+    conn = get_db()
+    try:
+        conn.execute('''
+            UPDATE checkout_jobs
+            SET progress = ?,
+                steps = json_insert(COALESCE(steps, '[]'), '$[#]', json_object('time', ?, 'message', ?))
+            WHERE id = ?
+        ''', (message, datetime.utcnow().isoformat(), message, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def finish_checkout_job(job_id, status, result):
+    """Store the final status and result of a job"""
+    conn = get_db()
+    try:
+        conn.execute('''
+            UPDATE checkout_jobs SET status = ?, result = ?, finished_at = ?
+            WHERE id = ?
+        ''', (status, json.dumps(result), datetime.utcnow().isoformat(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+# Checkout traces
+
+SPAN_COLUMNS = ('step', 'url', 'status', 'started_at', 'ended_at', 'duration_ms')
+
+def save_trace_spans(trace_id, user_id, order_id, spans):
+    """Store the spans of one checkout run in one transaction"""
+    conn = get_db()
+    try:
+        conn.executemany('''
+            INSERT INTO traces (trace_id, order_id, user_id, name, url, status,
+                                started_at, ended_at, duration_ms, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (trace_id, order_id, user_id, span['step'], span.get('url'), span.get('status'),
+             span.get('started_at'), span.get('ended_at'), span.get('duration_ms'),
+             json.dumps({k: v for k, v in span.items() if k not in SPAN_COLUMNS}) or None)
+            for span in spans
+        ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _span_from_row(row):
+    span = dict(row)
+    span['attributes'] = json.loads(span['attributes']) if span.get('attributes') else {}
+    return span
+
+def get_trace(trace_id=None, order_id=None):
+    """Spans of one run by trace ID or order ID, in start order"""
+    column, value = ('trace_id', trace_id) if trace_id else ('order_id', order_id)
+    conn = get_db()
+    try:
+        rows = conn.execute(
+            f'SELECT * FROM traces WHERE {column} = ? ORDER BY started_at, id', (value,)
+        ).fetchall()
+        return [_span_from_row(row) for row in rows]
+    finally:
+        conn.close()
+
+def get_span_durations(since):
+    """(name, status, duration_ms) of all spans started since a timestamp"""
+    conn = get_db()
+    try:
+        rows = conn.execute('''
+            SELECT name, status, duration_ms FROM traces WHERE started_at >= ?
+        ''', (since,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def create_scrape_run(total):
+    """Start tracking a bulk scrape run"""
+    conn = get_db()
+    try:
+        cursor = conn.execute(
+            'INSERT INTO scrape_runs (total, started_at) VALUES (?, ?)',
+            (total, datetime.utcnow().isoformat())
+        )
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+def update_scrape_run(run_id, done, failed, errors=None, status=None):
+    """Record bulk scrape progress"""
+    conn = get_db()
+    try:
+        conn.execute('''
+            UPDATE scrape_runs SET done = ?, failed = ?, errors = ?,
+                status = COALESCE(?, status),
+                finished_at = CASE WHEN ? IS NULL THEN finished_at ELSE ? END
+            WHERE id = ?
+        ''', (done, failed, json.dumps(errors) if errors else None, status,
+              status, datetime.utcnow().isoformat(), run_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_scrape_run(run_id):
+    """Get bulk scrape run by ID"""
+    conn = get_db()
+    try:
+        row = conn.execute('SELECT * FROM scrape_runs WHERE id = ?', (run_id,)).fetchone()
+        if not row:
+            return None
+        run = dict(row)
+        run['errors'] = json.loads(run['errors']) if run.get('errors') else []
+        return run
+    finally:
+        conn.close()
+
+# Product history and monitor schedule
+
+def get_product_history(product_id, since=None, until=None, limit=None):
+    """Price/stock changes of a product, oldest first"""
+    sql = 'SELECT id, price, stock_status, options, changed_at FROM product_history WHERE product_id = ?'
+    params = [product_id]
+    if since:
+        sql += ' AND changed_at >= ?'
+        params.append(since)
+    if until:
+        sql += ' AND changed_at <= ?'
+        params.append(until)
+    if limit:
+        # Most recent `limit` changes, still returned oldest first
+        sql = f'SELECT * FROM ({sql} ORDER BY changed_at DESC, id DESC LIMIT ?) ORDER BY changed_at, id'
+        params.append(limit)
+    else:
+        sql += ' ORDER BY changed_at, id'
+    
+    conn = get_db()
+    try:
+        history = []
+        for row in conn.execute(sql, params).fetchall():
+            entry = dict(row)
+            del entry['id']  # only needed to order changes with the same timestamp
+            entry['options'] = json.loads(entry['options']) if entry.get('options') else None
+            history.append(entry)
+        return history
+    finally:
+        conn.close()
+
+def get_due_monitor_products(now, limit, default_interval):
+    """Products whose next monitor check is due, most overdue first"""
+    conn = get_db()
+    try:
+        # New products are due immediately
+        conn.execute('''
+            INSERT OR IGNORE INTO product_monitor (product_id, interval_seconds, next_check_at)
+            SELECT id, ?, ? FROM products
+        ''', (default_interval, now))
+        conn.commit()
+        rows = conn.execute('''
+            SELECT p.id, p.product_url, p.name, p.price, p.stock_status, p.options,
+                   m.interval_seconds, m.failures
+            FROM product_monitor m JOIN products p ON p.id = m.product_id
+            WHERE m.next_check_at <= ?
+            ORDER BY m.next_check_at
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+        products = []
+        for row in rows:
+            product = dict(row)
+            if product.get('options'):
+                product['options'] = json.loads(product['options'])
+            products.append(product)
+        return products
+    finally:
+        conn.close()
+
+def update_monitor_schedule(entries):
+    """
+    Store the next check of monitored products in one transaction
+    
+    Args:
+        entries: list of dicts with product_id, interval_seconds, next_check_at,
+                 checked_at, changed (bool) and failures
+    """
+    conn = get_db()
+    try:
+        conn.executemany('''
+            UPDATE product_monitor
+            SET interval_seconds = ?, next_check_at = ?, last_checked_at = ?,
+                last_changed_at = CASE WHEN ? THEN ? ELSE last_changed_at END,
+                failures = ?
+            WHERE product_id = ?
+        ''', [
+            (e['interval_seconds'], e['next_check_at'], e['checked_at'],
+             e['changed'], e['checked_at'], e['failures'], e['product_id'])
+            for e in entries
+        ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_monitor_summary(now):
+    """Counts for monitoring the monitor"""
+    conn = get_db()
+    try:
+        row = conn.execute('''
+            SELECT COUNT(*) AS monitored,
+                   SUM(next_check_at <= ?) AS due,
+                   SUM(failures > 0) AS failing,
+                   AVG(interval_seconds) AS avg_interval_seconds
+            FROM product_monitor
+        ''', (now,)).fetchone()
+        return dict(row)
+    finally:
+        conn.close()
+
+LOG_CONTEXT_KEY = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def query_logs(levels=None, since=None, until=None, context=None, limit=100):
+    """
+    Newest log entries, optionally filtered
+    
+    Args:
+        levels: list of levels to include
+        since, until: ISO-8601 UTC timestamps (since inclusive, until exclusive)
+        context: dict of context key -> value that must match (compared as text)
+        limit: max entries
+    """
+    clauses, params = [], []
+    if levels:
+        clauses.append(f"level IN ({', '.join('?' * len(levels))})")
+        params.extend(levels)
+    if since:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    if until:
+        clauses.append('timestamp < ?')
+        params.append(until)
+    for key, value in (context or {}).items():
+        if not LOG_CONTEXT_KEY.match(key):
+            raise ValueError(f'Invalid context key: {key}')
+        clauses.append('CAST(json_extract(context, ?) AS TEXT) = ?')
+        params.extend([f'$.{key}', str(value)])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    
+    conn = get_db()
+    try:
+        # Served by idx_logs_timestamp / idx_logs_level_timestamp; context
+        # filters are checked on the rows the index walk visits
+        rows = conn.execute(
+            f'SELECT * FROM logs {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+        logs = []
+        for row in rows:
+            entry = dict(row)
+            if entry.get('context'):
+                entry['context'] = json.loads(entry['context'])
+            logs.append(entry)
+        return logs
+    finally:
+        conn.close()
+
+def get_log_overflow_id(max_rows):
+    """Highest log id beyond the newest max_rows entries, or None"""
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT id FROM logs ORDER BY id DESC LIMIT 1 OFFSET ?', (max_rows,)
+        ).fetchone()
+        return row['id'] if row else None
+    finally:
+        conn.close()
+
+def get_prunable_logs(limit, cutoff=None, max_id=None):
+    """Oldest log rows written before cutoff, or with id <= max_id"""
+    conn = get_db()
+    try:
+        if cutoff is not None:
+            query, param = 'SELECT * FROM logs WHERE timestamp < ? ORDER BY timestamp LIMIT ?', cutoff
+        else:
+            query, param = 'SELECT * FROM logs WHERE id <= ? ORDER BY id LIMIT ?', max_id
+        return [dict(row) for row in conn.execute(query, (param, limit)).fetchall()]
+    finally:
+        conn.close()
+
+def delete_logs(ids):
+    """Delete log rows by id in one transaction"""
+    conn = get_db()
+    try:
+        conn.executemany('DELETE FROM logs WHERE id = ?', [(log_id,) for log_id in ids])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -1,22 +1,76 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for, send_from_directory
 from app.models import (
-    create_product, update_product, get_product_by_id, get_all_products,
-    get_user_by_id, update_user_credentials, get_user_orders
+    create_product, create_products_bulk, update_product, PRODUCT_FIELDS,
+    get_user_by_id, update_user_credentials, get_user_orders, get_checkout_job,
+    get_scrape_run, count_products_with_image, get_product_history, get_trace, query_logs,
+    get_monthly_spend, get_top_ordered_products
 )
-from app.utils.validators import is_valid_dampfi_url, validate_user_id
+from app.utils.validators import is_valid_dampfi_url, validate_user_id, product_fields_error
 from app.utils.helpers import save_uploaded_file, delete_image_file
-from app.services.scraper import scrape_product_metadata
-from app.services.automation import run_checkout
+from app.utils.http_cache import catalog_etag, is_not_modified, not_modified_response
+from app.services.scraper import scrape_product_metadata, product_updates_from_scrape
+from app.services.bulk_scraper import start_bulk_refresh
+from app.services.checkout_jobs import (
+    submit_checkout, submit_checkout_batch, get_checkout_batch, checkout_throughput,
+    checkout_step_metrics, ON_UNAVAILABLE_MODES, SubmissionKeyConflict
+)
+from app.services.browser_pool import get_browser_pool
+from app.services.images import schedule_image_processing
+from app.services.monitor import monitor
 from app.database import log_message, get_db
+from app.cache import catalog_cache
+from app.config import Config
 import json
+import os
+import re
+from datetime import datetime, timezone
 
 bp = Blueprint('api', __name__)
 
 @bp.route('/products', methods=['GET'])
-def list_products():
-    """Get all products"""
-    products = get_all_products()
-    return jsonify({'products': products})
+def list_products_endpoint():
+    """
+    List products, newest first
+    
+    Query parameters (all optional):
+        limit: page size (max 200); without it every product is returned
+        cursor: next_cursor from the previous page
+        stock_status: filter by stock status
+        min_price / max_price: price range
+        fields: comma-separated columns to return
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, 200))
+    
+    fields = None
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown:
+            return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+    
+    # Same catalog version + same query = same body
+    etag = catalog_etag(catalog_cache.version(), request.query_string.decode('utf-8'))
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    
+    try:
+        products, next_cursor = catalog_cache.list_products(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            stock_status=request.args.get('stock_status'),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            fields=fields
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify({'products': products, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @bp.route('/products', methods=['POST'])
 def create_product_endpoint():
@@ -30,12 +84,11 @@ def create_product_endpoint():
     if not is_valid_dampfi_url(product_url):
         return jsonify({'error': 'Invalid dampfi.ch URL'}), 400
     
-    # Check if product already exists
-    products = get_all_products()
-    for p in products:
-        if p['product_url'] == product_url:
-            return jsonify({'error': 'Product with this URL already exists'}), 400
+    error = product_fields_error(data)
+    if error:
+        return jsonify({'error': error}), 400
     
+    # The UNIQUE index on product_url rejects duplicates
     product_id = create_product(
         product_url=product_url,
         name=data.get('name', 'Unknown Product'),
@@ -45,29 +98,93 @@ def create_product_endpoint():
     )
     
     if product_id:
-        product = get_product_by_id(product_id)
+        product = catalog_cache.get_product(product_id)
         return jsonify({'product': product}), 201
+    elif catalog_cache.get_product_by_url(product_url):
+        return jsonify({'error': 'Product with this URL already exists'}), 400
     else:
         return jsonify({'error': 'Failed to create product'}), 500
 
+@bp.route('/products/import', methods=['POST'])
+def import_products():
+    """
+    Bulk import products in one transaction
+    
+    Accepts a JSON array (or NDJSON with Content-Type application/x-ndjson)
+    of product URLs or objects with 'product_url' and optional 'name',
+    'price', 'stock_status', 'options'. Returns a per-row report.
+    """
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            rows = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            rows = request.get_json()
+    except ValueError:
+        return jsonify({'error': 'Invalid JSON'}), 400
+    if not isinstance(rows, list):
+        return jsonify({'error': 'Expected a JSON array or NDJSON'}), 400
+    
+    report = []
+    valid = []
+    for index, row in enumerate(rows):
+        if isinstance(row, str):
+            row = {'product_url': row}
+        url = str(row.get('product_url') or '').strip() if isinstance(row, dict) else ''
+        if not url or not is_valid_dampfi_url(url):
+            report.append({'row': index, 'product_url': url or None, 'status': 'invalid',
+                           'error': 'Invalid dampfi.ch URL'})
+            continue
+        error = product_fields_error(row)
+        if error:
+            report.append({'row': index, 'product_url': url, 'status': 'invalid', 'error': error})
+            continue
+        entry = {'row': index, 'product_url': url}
+        report.append(entry)
+        valid.append((entry, dict(row, product_url=url)))
+    
+    try:
+        results = create_products_bulk([product for _, product in valid])
+    except Exception as e:
+        return jsonify({'error': f'Import failed: {str(e)}'}), 500
+    
+    for (entry, _), (product_id, created) in zip(valid, results):
+        entry['status'] = 'created' if created else 'conflict'
+        if created:
+            entry['id'] = product_id
+    
+    summary = {status: sum(1 for r in report if r['status'] == status)
+               for status in ('created', 'conflict', 'invalid')}
+    return jsonify({'summary': summary, 'rows': report}), 200
+
 @bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get product by ID"""
-    product = get_product_by_id(product_id)
+    etag = catalog_etag(catalog_cache.version(), 'product', product_id)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    
+    product = catalog_cache.get_product(product_id)
     if product:
-        return jsonify({'product': product})
+        response = jsonify({'product': product})
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
     return jsonify({'error': 'Product not found'}), 404
 
 @bp.route('/products/<int:product_id>', methods=['PUT'])
 def update_product_endpoint(product_id):
     """Update a product"""
-    product = get_product_by_id(product_id)
+    product = catalog_cache.get_product(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
     data = request.get_json() or {}
     updates = {}
     
+    error = product_fields_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
     # Validate URL if provided
     if 'product_url' in data:
         url = data['product_url'].strip()
@@ -85,7 +202,7 @@ def update_product_endpoint(product_id):
         updates['options'] = data['options']
     
     if update_product(product_id, **updates):
-        product = get_product_by_id(product_id)
+        product = catalog_cache.get_product(product_id)
         return jsonify({'product': product})
     else:
         return jsonify({'error': 'Failed to update product'}), 500
@@ -93,30 +210,50 @@ def update_product_endpoint(product_id):
 @bp.route('/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """Delete a product"""
-    product = get_product_by_id(product_id)
+    product = catalog_cache.get_product(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    # Delete image file
-    if product.get('image_path'):
-        delete_image_file(product['image_path'])
-    
     # Delete from database
-    from app.database import get_db
     conn = get_db()
     try:
         conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
         conn.commit()
+        catalog_cache.invalidate()
+        
+        # Images are shared between products with identical uploads
+        image_path = product.get('image_path')
+        if image_path and count_products_with_image(image_path) == 0:
+            delete_image_file(image_path, product.get('image_variants'))
         return jsonify({'message': 'Product deleted'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+@bp.route('/products/<int:product_id>/history', methods=['GET'])
+def get_product_history_endpoint(product_id):
+    """
+    Price/stock time series of a product (one point per change)
+    
+    Query parameters (all optional):
+        since, until: UTC timestamps, e.g. 2024-05-01 or 2024-05-01 12:00:00
+        limit: only the most recent N changes
+    """
+    if not catalog_cache.get_product(product_id):
+        return jsonify({'error': 'Product not found'}), 404
+    
+    # changed_at is stored as 'YYYY-MM-DD HH:MM:SS'
+    since = request.args.get('since', '').replace('T', ' ') or None
+    until = request.args.get('until', '').replace('T', ' ') or None
+    limit = request.args.get('limit', type=int)
+    history = get_product_history(product_id, since=since, until=until, limit=limit)
+    return jsonify({'product_id': product_id, 'history': history})
+
 @bp.route('/products/<int:product_id>/scrape', methods=['POST'])
 def scrape_product(product_id):
     """Trigger metadata scraping for a product"""
-    product = get_product_by_id(product_id)
+    product = catalog_cache.get_product(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
@@ -129,20 +266,11 @@ def scrape_product(product_id):
         
         if 'error' not in result:
             # Update product with scraped data
-            updates = {}
-            if result.get('name'):
-                updates['name'] = result['name']
-            if result.get('price') is not None:
-                updates['price'] = result['price']
-            if result.get('stock_status'):
-                updates['stock_status'] = result['stock_status']
-            if result.get('options') is not None:
-                updates['options'] = result['options']
-            
+            updates = product_updates_from_scrape(result)
             if updates:
                 update_product(product_id, **updates)
             
-            return jsonify({'product': get_product_by_id(product_id), 'scraped': result})
+            return jsonify({'product': catalog_cache.get_product(product_id), 'scraped': result})
         
         if attempt < max_retries - 1:
             log_message('info', f'Retrying scrape for product {product_id}', {'attempt': attempt + 1})
@@ -154,10 +282,38 @@ def scrape_product(product_id):
     
     return jsonify({'error': error_msg}), 500
 
+@bp.route('/products/scrape', methods=['POST'])
+def bulk_scrape_products():
+    """Start a background metadata refresh for all (or the given) products"""
+    data = request.get_json(silent=True) or {}
+    product_ids = data.get('product_ids')
+    if product_ids is not None and not isinstance(product_ids, list):
+        return jsonify({'error': 'product_ids must be a list'}), 400
+    if product_ids is not None and not all(isinstance(pid, int) and not isinstance(pid, bool)
+                                           for pid in product_ids):
+        return jsonify({'error': 'product_ids must be integers'}), 400
+    
+    run_id, missing_ids = start_bulk_refresh(product_ids)
+    run = get_scrape_run(run_id)
+    return jsonify({
+        'run_id': run_id,
+        'total': run['total'],
+        'missing_ids': missing_ids,
+        'status_url': url_for('api.get_bulk_scrape_run', run_id=run_id)
+    }), 202
+
+@bp.route('/products/scrape/runs/<int:run_id>', methods=['GET'])
+def get_bulk_scrape_run(run_id):
+    """Get progress of a bulk refresh"""
+    run = get_scrape_run(run_id)
+    if not run:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify({'run': run})
+
 @bp.route('/products/<int:product_id>/upload', methods=['POST'])
 def upload_product_image(product_id):
     """Upload product image"""
-    product = get_product_by_id(product_id)
+    product = catalog_cache.get_product(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
@@ -168,18 +324,24 @@ def upload_product_image(product_id):
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    # Delete old image if exists
-    if product.get('image_path'):
-        delete_image_file(product['image_path'])
-    
-    # Save new image
+    # Save new image (content-addressed)
     image_path = save_uploaded_file(file, product_id)
-    if image_path:
-        update_product(product_id, image_path=image_path)
-        product = get_product_by_id(product_id)
-        return jsonify({'product': product}), 200
-    else:
+    if not image_path:
         return jsonify({'error': 'Invalid file type or upload failed'}), 400
+    
+    old_path = product.get('image_path')
+    if image_path != old_path:
+        update_product(product_id, image_path=image_path, image_variants=None)
+        # Delete old image unless another product still uses it
+        if old_path and count_products_with_image(old_path) == 0:
+            delete_image_file(old_path, product.get('image_variants'))
+    
+    # Thumbnails and WebP/AVIF variants are built in the background
+    if image_path != old_path or not product.get('image_variants'):
+        schedule_image_processing(product_id, image_path)
+    
+    product = catalog_cache.get_product(product_id)
+    return jsonify({'product': product}), 200
 
 @bp.route('/user/<int:user_id>/credentials', methods=['POST'])
 def save_user_credentials(user_id):
@@ -201,7 +363,7 @@ def save_user_credentials(user_id):
 
 @bp.route('/checkout/confirm', methods=['POST'])
 def confirm_checkout():
-    """Confirm and execute checkout"""
+    """Confirm checkout and queue it as a background job"""
     data = request.get_json() or {}
     user_id = data.get('user_id')
     selected_items = data.get('items', [])
@@ -216,20 +378,163 @@ def confirm_checkout():
     if not user or not user.get('dampfi_email') or not user.get('dampfi_password'):
         return jsonify({'error': 'User credentials not configured'}), 400
     
-    # Run checkout automation
-    result = run_checkout(
-        user_id=user_id,
-        user_credentials={
-            'dampfi_email': user['dampfi_email'],
-            'dampfi_password': user['dampfi_password']
-        },
-        selected_items=selected_items
-    )
+    on_unavailable = data.get('on_unavailable')
+    if on_unavailable is not None and on_unavailable not in ON_UNAVAILABLE_MODES:
+        return jsonify({'error': f'on_unavailable must be one of {", ".join(ON_UNAVAILABLE_MODES)}'}), 400
     
-    if result.get('success'):
-        return jsonify(result), 200
-    else:
-        return jsonify(result), 500
+    # Queue the checkout; the client polls the job for progress
+    submission_key = request.headers.get('Idempotency-Key') or data.get('submission_key')
+    try:
+        job, created = submit_checkout(user_id, selected_items, submission_key, on_unavailable)
+    except SubmissionKeyConflict as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'created': created,
+        'status_url': url_for('api.get_checkout_job_status', job_id=job['id'])
+    }), 202
+
+@bp.route('/checkout/batch', methods=['POST'])
+def confirm_checkout_batch():
+    """
+    Queue checkouts for several accounts at once
+    
+    Body: {"orders": [{"user_id": 1, "items": [...], "on_unavailable": "trim"}, ...]}
+    Different accounts check out in parallel; orders for the same account
+    run one after another.
+    """
+    data = request.get_json() or {}
+    orders = data.get('orders')
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'error': 'orders must be a non-empty list'}), 400
+    
+    for index, order in enumerate(orders):
+        user_id = order.get('user_id') if isinstance(order, dict) else None
+        if not user_id or not validate_user_id(user_id):
+            return jsonify({'error': f'Order {index}: invalid user ID'}), 400
+        if not order.get('items'):
+            return jsonify({'error': f'Order {index}: no items selected'}), 400
+        on_unavailable = order.get('on_unavailable')
+        if on_unavailable is not None and on_unavailable not in ON_UNAVAILABLE_MODES:
+            return jsonify({'error': f'Order {index}: invalid on_unavailable'}), 400
+        user = get_user_by_id(user_id)
+        if not user or not user.get('dampfi_email') or not user.get('dampfi_password'):
+            return jsonify({'error': f'Order {index}: user credentials not configured'}), 400
+    
+    batch_key = request.headers.get('Idempotency-Key') or data.get('batch_id')
+    try:
+        batch_id, jobs = submit_checkout_batch(orders, batch_key)
+    except SubmissionKeyConflict as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({
+        'batch_id': batch_id,
+        'job_ids': [job['id'] for job in jobs],
+        'status_url': url_for('api.get_checkout_batch_status', batch_id=batch_id)
+    }), 202
+
+@bp.route('/checkout/batches/<batch_id>', methods=['GET'])
+def get_checkout_batch_status(batch_id):
+    """Get the combined status and results of a checkout batch"""
+    batch = get_checkout_batch(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify({'batch': batch})
+
+@bp.route('/checkout/jobs/<int:job_id>', methods=['GET'])
+def get_checkout_job_status(job_id):
+    """Get checkout job status and progress"""
+    job = get_checkout_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job})
+
+@bp.route('/metrics/browser-pool', methods=['GET'])
+def browser_pool_metrics():
+    """Get browser pool metrics"""
+    return jsonify({'browser_pool': get_browser_pool().metrics()})
+
+@bp.route('/metrics/catalog-cache', methods=['GET'])
+def catalog_cache_metrics():
+    """Get catalog cache hit/miss statistics"""
+    return jsonify({'catalog_cache': catalog_cache.stats()})
+
+@bp.route('/metrics/checkout-jobs', methods=['GET'])
+def checkout_job_metrics():
+    """Checkout throughput (orders/min, p50/p95 duration) over ?window= seconds"""
+    window = request.args.get('window', 3600, type=int)
+    if window <= 0:
+        return jsonify({'error': 'window must be positive'}), 400
+    return jsonify({'checkout_jobs': checkout_throughput(window)})
+
+@bp.route('/metrics/checkout', methods=['GET'])
+def checkout_metrics():
+    """Per-step checkout duration percentiles over ?window= seconds"""
+    window = request.args.get('window', 3600, type=int)
+    if window <= 0:
+        return jsonify({'error': 'window must be positive'}), 400
+    return jsonify({'checkout': checkout_step_metrics(window)})
+
+def _order_filters():
+    """Optional ?user_id= and ?since= (ISO-8601) filters of the order aggregates"""
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None and not validate_user_id(user_id):
+        raise ValueError('Invalid user ID')
+    since = request.args.get('since')
+    if since:
+        since = datetime.fromisoformat(since).isoformat(sep=' ')
+    return {'user_id': user_id, 'since': since}
+
+@bp.route('/metrics/orders/spend', methods=['GET'])
+def order_spend_metrics():
+    """Orders and spend per user per month"""
+    try:
+        filters = _order_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'spend': get_monthly_spend(**filters)})
+
+@bp.route('/metrics/orders/top-products', methods=['GET'])
+def top_products_metrics():
+    """Most-ordered products by quantity (?limit=, ?user_id=, ?since=)"""
+    try:
+        filters = _order_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    return jsonify({'products': get_top_ordered_products(limit=limit, **filters)})
+
+@bp.route('/checkout/traces/<trace_id>', methods=['GET'])
+def get_checkout_trace(trace_id):
+    """Spans of one checkout run"""
+    spans = get_trace(trace_id=trace_id)
+    if not spans:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify({'trace_id': trace_id, 'spans': spans})
+
+@bp.route('/checkout/traces/<trace_id>/playwright', methods=['GET'])
+def download_playwright_trace(trace_id):
+    """Playwright trace zip of a slow or failed run (open with `playwright show-trace`)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', trace_id):
+        return jsonify({'error': 'Trace not found'}), 404
+    filename = f'{trace_id}.zip'
+    if not os.path.exists(os.path.join(Config.CHECKOUT_TRACE_DIR, filename)):
+        return jsonify({'error': 'No Playwright trace for this run'}), 404
+    return send_from_directory(Config.CHECKOUT_TRACE_DIR, filename, as_attachment=True)
+
+@bp.route('/orders/<int:order_id>/trace', methods=['GET'])
+def get_order_trace(order_id):
+    """Spans of the checkout run that placed an order"""
+    spans = get_trace(order_id=order_id)
+    if not spans:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify({'order_id': order_id, 'trace_id': spans[0]['trace_id'], 'spans': spans})
+
+@bp.route('/metrics/monitor', methods=['GET'])
+def monitor_metrics():
+    """Get stock/price monitor state and counters"""
+    return jsonify({'monitor': monitor.metrics()})
 
 @bp.route('/user/<int:user_id>/orders', methods=['GET'])
 def get_orders(user_id):
@@ -247,22 +552,31 @@ def get_logs():
     if not debug_mode:
         return jsonify({'error': 'Debug mode not enabled'}), 403
     
-    limit = request.args.get('limit', 100, type=int)
-    conn = get_db()
+    # ?level=error,warning&since=...&until=... (ISO-8601 UTC) and
+    # context.<key>=<value> for each context field that must match
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    levels = [l.strip() for l in request.args.get('level', '').split(',') if l.strip()]
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if value:
+            try:
+                moment = datetime.fromisoformat(value)
+            except ValueError:
+                return jsonify({'error': f'Invalid {name} timestamp: {value}'}), 400
+            if moment.tzinfo is not None:
+                # Stored timestamps are naive UTC
+                moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+            bounds[name] = moment.isoformat()
+    context = {
+        key[len('context.'):]: value
+        for key, value in request.args.items() if key.startswith('context.')
+    }
     try:
-        rows = conn.execute(
-            'SELECT * FROM logs ORDER BY timestamp DESC LIMIT ?',
-            (limit,)
-        ).fetchall()
-        logs = []
-        for row in rows:
-            log_entry = dict(row)
-            if log_entry.get('context'):
-                log_entry['context'] = json.loads(log_entry['context'])
-            logs.append(log_entry)
-        return jsonify({'logs': logs})
-    finally:
-        conn.close()
+        logs = query_logs(levels=levels, context=context, limit=limit, **bounds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'logs': logs})
 
 
 
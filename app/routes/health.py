@@ -0,0 +1,59 @@
+import time
+from flask import Blueprint, jsonify
+from app.config import Config
+from app.database import get_db
+
+bp = Blueprint('health', __name__)
+
+# Liveness only says the process answers requests; readiness also checks
+# what a request needs (database, migrations, checkout capacity), so a
+# load balancer stops routing to a worker without restarting it.
+
+@bp.route('/healthz')
+def liveness():
+    """Liveness probe"""
+    return jsonify({'status': 'ok'})
+
+def _check_database():
+    from app.migrations import pending_migrations
+    started = time.perf_counter()
+    conn = get_db()
+    try:
+        conn.execute('SELECT 1').fetchone()
+    finally:
+        conn.close()
+    pending = pending_migrations()
+    return {
+        'ok': not pending,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        'pending_migrations': [f'{m.version:04d}_{m.name}' for m in pending]
+    }
+
+def _check_checkouts():
+    if Config.CHECKOUT_RUNNER == 'inline':
+        from app.services.browser_pool import browser_pool_health
+        return dict(browser_pool_health(), runner='inline')
+    from app.services.checkout_jobs import read_worker_heartbeat
+    heartbeat = read_worker_heartbeat()
+    if heartbeat is None:
+        return {'ok': False, 'runner': 'worker', 'error': 'no heartbeat from the checkout worker'}
+    max_age = max(3 * Config.CHECKOUT_POLL_INTERVAL, 30)
+    pool = heartbeat.get('browser_pool') or {}
+    return {
+        'ok': heartbeat['age'] <= max_age and pool.get('ok', False),
+        'runner': 'worker',
+        'heartbeat_age': heartbeat['age'],
+        'browser_pool': pool
+    }
+
+@bp.route('/readyz')
+def readiness():
+    """Readiness probe: 503 until the database and checkout runner are usable"""
+    checks = {}
+    for name, check in (('database', _check_database), ('checkout', _check_checkouts)):
+        try:
+            checks[name] = check()
+        except Exception as e:
+            checks[name] = {'ok': False, 'error': str(e)}
+    ready = all(check['ok'] for check in checks.values())
+    return jsonify({'status': 'ready' if ready else 'unavailable', 'checks': checks}), 200 if ready else 503
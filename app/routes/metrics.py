@@ -0,0 +1,29 @@
+import time
+from flask import Blueprint, Response, g, request
+from app import metrics
+
+bp = Blueprint('metrics', __name__)
+
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Flask request latency by route',
+    ['method', 'route', 'status']
+)
+
+@bp.before_app_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def _observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule, not the path, keeps label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                route=route, status=response.status_code)
+    return response
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition (all processes when METRICS_DIR is shared)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
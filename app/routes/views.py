@@ -1,21 +1,78 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
-from app.models import get_all_products, get_product_by_id, get_user_by_id, get_user_orders
-from app.database import log_message
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, session, make_response, abort
+from werkzeug.security import safe_join
+from app.models import get_user_by_id, get_recent_orders
+from app.cache import catalog_cache
+from app.utils.http_cache import catalog_etag, is_not_modified, not_modified_response
 from app.config import Config
 import os
+import re
+import mimetypes
 
 bp = Blueprint('views', __name__)
 
+# Columns the templates actually render
+GALLERY_FIELDS = ['id', 'product_url', 'name', 'price', 'stock_status', 'options', 'image_path', 'image_variants']
+MANAGEMENT_FIELDS = ['id', 'product_url', 'name', 'price', 'stock_status', 'image_path', 'image_variants']
+
+CONTENT_HASH_NAME = re.compile(r'^[0-9a-f]{64}[._]')
+
+IMAGE_MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+@bp.app_template_global()
+def product_image(product):
+    """
+    URLs for a product's <picture>: 'src' (fallback), 'srcset' (JPEG sizes)
+    and 'sources' [(mime type, srcset), ...] for AVIF/WebP; None without image
+    """
+    if not product.get('image_path'):
+        return None
+    
+    def url(filename):
+        return url_for('views.uploaded_file', filename=filename)
+    
+    original = url(os.path.basename(product['image_path']))
+    variants = product.get('image_variants')
+    if not variants:
+        # Not processed yet: serve the upload as-is
+        return {'src': original, 'srcset': '', 'sources': []}
+    
+    sizes = sorted(variants['sizes'].values(), key=lambda entry: entry['width'])
+    jpeg = [f"{url(e['jpeg'])} {e['width']}w" for e in sizes if 'jpeg' in e]
+    jpeg.append(f"{original} {variants['width']}w")
+    sources = []
+    for fmt, mime_type in IMAGE_MIME_TYPES.items():
+        srcset = [f"{url(e[fmt])} {e['width']}w" for e in sizes if fmt in e]
+        if srcset:
+            sources.append((mime_type, ', '.join(srcset)))
+    
+    medium = variants['sizes'].get('medium', {})
+    src = url(medium['jpeg']) if 'jpeg' in medium else original
+    return {'src': src, 'srcset': ', '.join(jpeg), 'sources': sources}
+
 @bp.route('/')
 def gallery():
-    """Main gallery view"""
-    products = get_all_products()
-    return render_template('gallery.html', products=products)
+    """Main gallery view (first page; gallery.js loads the rest)"""
+    # The page only depends on the catalog, unless flash messages are pending
+    etag = None
+    if not session.get('_flashes'):
+        etag = catalog_etag(catalog_cache.version(), 'gallery', Config.GALLERY_PAGE_SIZE)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+    
+    products, next_cursor = catalog_cache.list_products(limit=Config.GALLERY_PAGE_SIZE, fields=GALLERY_FIELDS)
+    response = make_response(render_template(
+        'gallery.html', products=products, next_cursor=next_cursor,
+        gallery_fields=','.join(GALLERY_FIELDS), page_size=Config.GALLERY_PAGE_SIZE
+    ))
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    return response
 
 @bp.route('/product-management')
 def product_management():
     """Product management view"""
-    products = get_all_products()
+    products, _ = catalog_cache.list_products(fields=MANAGEMENT_FIELDS)
     return render_template('product_management.html', products=products)
 
 @bp.route('/checkout/review')
@@ -36,7 +93,7 @@ def checkout_review():
         return redirect(url_for('views.user_setup', user_id=user_id))
     
     # Get recent orders for reporting
-    recent_orders = get_user_orders(user_id, limit=5)
+    recent_orders = get_recent_orders(user_id, limit=5)
     
     return render_template('checkout_review.html', user=user, recent_orders=recent_orders)
 
@@ -53,6 +110,35 @@ def user_setup():
 
 @bp.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded product images"""
-    return send_from_directory(Config.UPLOAD_FOLDER, filename)
+    """Serve uploaded product images
+
+    send_file answers If-None-Match/If-Modified-Since with 304 and Range
+    with 206, and hands the open file to the server's wsgi.file_wrapper
+    (sendfile(2) under gunicorn) instead of reading it into Python. With
+    UPLOAD_SENDFILE set, the front proxy sends the bytes instead.
+    """
+    # Content-addressed names (<sha256>...) never change their bytes
+    content_addressed = bool(CONTENT_HASH_NAME.match(filename))
+    max_age = Config.IMMUTABLE_MAX_AGE if content_addressed else Config.UPLOAD_MAX_AGE
+    
+    if Config.UPLOAD_SENDFILE == 'x-accel-redirect':
+        path = safe_join(Config.UPLOAD_FOLDER, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        # nginx serves the internal location, including ETag and ranges
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = Config.UPLOAD_ACCEL_PREFIX + filename
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        # USE_X_SENDFILE makes send_file emit X-Sendfile instead of the body
+        response = send_from_directory(
+            Config.UPLOAD_FOLDER, filename, max_age=max_age,
+            etag=filename if content_addressed else True
+        )
+    
+    if content_addressed:
+        response.cache_control.immutable = True
+    return response
 
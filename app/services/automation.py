@@ -1,10 +1,476 @@
-from playwright.sync_api import sync_playwright
+import os
+import re
 import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from app.config import Config
 from app.database import log_message
-from app.models import create_order
+from app import metrics
+from app.models import (
+    create_order, get_user_session, save_user_session, delete_user_session, save_trace_spans
+)
+from app.services.browser_pool import get_browser_pool, DEFAULT_CONTEXT_OPTIONS
 
-def run_checkout(user_id, user_credentials, selected_items):
+# Selectors shared by the checkout steps
+LOGIN_EMAIL_SELECTOR = 'input[name="login[username]"], input[type="email"], #email'
+LOGIN_PASSWORD_SELECTOR = 'input[name="login[password]"], input[type="password"], #pass'
+LOGIN_BUTTON_SELECTOR = 'button[type="submit"], button.action.login, .action.login'
+OPTION_SELECT_SELECTOR = 'select[name*="option"], select[name*="super_attribute"]'
+QTY_INPUT_SELECTOR = 'input[name="qty"], input[type="number"][name*="qty"]'
+ADD_TO_CART_SELECTOR = 'button[title*="Add to Cart"], button.action.tocart, #product-addtocart-button'
+CHECKOUT_READY_SELECTOR = '#checkout-payment-method-load, .payment-methods, #shipping, form[name="checkout"], #shipping-form'
+LOADING_MASK_SELECTOR = '.loading-mask, #checkout-loader'
+BILL_PAYMENT_SELECTOR = 'input[value*="bill"], input[value*="invoice"], label:has-text("Bill"), label:has-text("Rechnung")'
+TOTAL_PRICE_SELECTOR = '.grand.totals .price, .order-total .price, [class*="total"] .price'
+PLACE_ORDER_SELECTOR = 'button[title*="Place Order"], button.checkout, .action.primary.checkout'
+CONFIRMATION_SELECTOR = '.order-number, [class*="order-id"], .checkout-success'
+
+PRICE_PATTERN = re.compile(r'[\d,]+\.?\d*')
+
+STEP_SECONDS = metrics.histogram('checkout_step_duration_seconds', 'Checkout steps by outcome',
+                                 ['step', 'status'], buckets=metrics.STEP_BUCKETS)
+ADD_TO_CART_FORM_SELECTOR = '#product_addtocart_form, form[action*="checkout/cart/add"]'
+
+class StepTimer:
+    """Record a span for each checkout step: timestamps, duration, status and details
+
+    Details set on the yielded entry are kept with the span; pages
+    navigated while a step is open are added to its 'urls' and locator
+    counts recorded with ``count()`` to its 'selectors'.
+    """
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = datetime.utcnow().isoformat()
+        self.steps = []
+        self._started = time.perf_counter()
+        self._current = None
+
+    @contextmanager
+    def step(self, name, **details):
+        started_at = datetime.utcnow().isoformat()
+        started = time.perf_counter()
+        entry = {'step': name, **details}
+        parent, self._current = self._current, entry
+        try:
+            yield entry
+        except Exception as e:
+            entry['status'] = 'error'
+            entry['error'] = str(e)
+            raise
+        finally:
+            self._current = parent
+            entry.setdefault('status', 'failed' if entry.get('ok') is False else 'ok')
+            entry['started_at'] = started_at
+            entry['ended_at'] = datetime.utcnow().isoformat()
+            duration = time.perf_counter() - started
+            entry['duration_ms'] = round(duration * 1000, 1)
+            self.steps.append(entry)
+            STEP_SECONDS.observe(duration, step=name, status=entry['status'])
+
+    def navigated(self, url):
+        if self._current is not None:
+            self._current.setdefault('urls', []).append(url)
+
+    def count(self, name, locator):
+        """locator.count(), recorded on the current step"""
+        n = locator.count()
+        if self._current is not None:
+            self._current.setdefault('selectors', {})[name] = n
+        return n
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def summary(self):
+        return {
+            'trace_id': self.trace_id,
+            'total_ms': self.elapsed_ms(),
+            'steps': self.steps
+        }
+
+def _is_cart_add_response(response):
+    return response.request.method == 'POST' and '/checkout/cart/add' in response.url
+
+def _wait_for_idle_checkout(page):
+    """Wait until Magento's checkout loading overlay is gone"""
+    try:
+        page.wait_for_selector(LOADING_MASK_SELECTOR, state='hidden',
+                               timeout=Config.CHECKOUT_PAGE_TIMEOUT)
+    except PlaywrightTimeoutError:
+        pass
+
+def _session_is_valid(context):
+    """Cheap probe: Magento's customer section is only populated when logged in"""
+    try:
+        response = context.request.get(
+            f'{Config.DAMPFI_BASE_URL}/customer/section/load/?sections=customer',
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+            timeout=Config.CHECKOUT_LOGIN_TIMEOUT
+        )
+        if not response.ok:
+            return False
+        customer = response.json().get('customer') or {}
+        return bool(customer.get('firstname') or customer.get('fullname'))
+    except Exception:
+        return False
+
+def _login(page, user_credentials):
+    """Log in through the login form; returns True if the login redirected"""
+    page.goto(f'{Config.DAMPFI_BASE_URL}/customer/account/login', wait_until='domcontentloaded')
+    
+    # Fill login form
+    email_input = page.locator(LOGIN_EMAIL_SELECTOR)
+    password_input = page.locator(LOGIN_PASSWORD_SELECTOR)
+    
+    if email_input.count() > 0 and password_input.count() > 0:
+        email_input.first.fill(user_credentials['dampfi_email'])
+        password_input.first.fill(user_credentials['dampfi_password'])
+        
+        # Submit login and wait until we are redirected away from the login page
+        login_button = page.locator(LOGIN_BUTTON_SELECTOR)
+        if login_button.count() > 0:
+            login_button.first.click()
+            try:
+                page.wait_for_url(lambda url: '/customer/account/login' not in url,
+                                  wait_until='domcontentloaded',
+                                  timeout=Config.CHECKOUT_LOGIN_TIMEOUT)
+                return True
+            except PlaywrightTimeoutError:
+                log_message('warning', 'Login did not redirect, continuing')
+    return False
+
+def _ensure_logged_in(context, page, user_id, user_credentials, has_saved_session):
+    """Reuse the saved session if it still works, otherwise log in and save a new one"""
+    if has_saved_session and _session_is_valid(context):
+        return 'reused'
+    if _login(page, user_credentials):
+        save_user_session(user_id, context.storage_state())
+        return 'logged_in'
+    if has_saved_session:
+        delete_user_session(user_id)
+    return 'unverified'
+
+def _add_item_via_ui(page, item):
+    """Add one item through the product page; returns True if the cart-add request succeeded"""
+    page.goto(item['product_url'], wait_until='domcontentloaded')
+    add_to_cart = page.locator(ADD_TO_CART_SELECTOR)
+    try:
+        add_to_cart.first.wait_for(state='visible', timeout=Config.CHECKOUT_PAGE_TIMEOUT)
+    except PlaywrightTimeoutError:
+        log_message('warning', 'Add-to-cart button not found', {'url': item['product_url']})
+        return False
+    
+    # Select option if provided
+    option_value = item.get('option_value')
+    if option_value:
+        option_select = page.locator(OPTION_SELECT_SELECTOR)
+        if option_select.count() > 0:
+            option_select.first.select_option(option_value)
+    
+    # Set quantity
+    qty_input = page.locator(QTY_INPUT_SELECTOR)
+    if qty_input.count() > 0:
+        qty_input.first.fill(str(item.get('quantity', 1)))
+    
+    # Click add to cart and wait for the cart-add XHR
+    try:
+        with page.expect_response(_is_cart_add_response,
+                                  timeout=Config.CHECKOUT_CART_ADD_TIMEOUT) as response_info:
+            add_to_cart.first.click()
+        return response_info.value.ok
+    except PlaywrightTimeoutError:
+        log_message('warning', 'No add-to-cart response', {'url': item['product_url']})
+        return False
+
+def parse_add_to_cart_form(html, base_url):
+    """
+    Extract the add-to-cart form from a product page
+    
+    Returns:
+        dict with 'action', 'fields' (hidden inputs) and 'option_field'
+        (name of the option select, if any), or None if there is no form
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    form = soup.select_one(ADD_TO_CART_FORM_SELECTOR)
+    if not form or not form.get('action'):
+        return None
+    fields = {}
+    for hidden in form.select('input[type="hidden"][name]'):
+        fields[hidden['name']] = hidden.get('value', '')
+    if not fields.get('product'):
+        return None
+    option_select = form.select_one(OPTION_SELECT_SELECTOR)
+    return {
+        'action': urljoin(base_url, form['action']),
+        'fields': fields,
+        'option_field': option_select.get('name') if option_select else None
+    }
+
+def _form_key(context):
+    """Magento mirrors the session form key in a cookie"""
+    for cookie in context.cookies(Config.DAMPFI_BASE_URL):
+        if cookie['name'] == 'form_key':
+            return cookie['value']
+    return None
+
+def _add_item_via_http(context, item, form_key):
+    """Replay the add-to-cart form POST with the browser session's cookies"""
+    request = context.request
+    product_page = request.get(item['product_url'], timeout=Config.CHECKOUT_CART_ADD_TIMEOUT)
+    if not product_page.ok:
+        return False
+    form = parse_add_to_cart_form(product_page.text(), item['product_url'])
+    if not form:
+        return False
+    
+    data = dict(form['fields'])
+    data['qty'] = str(item.get('quantity', 1))
+    if form_key or data.get('form_key'):
+        data['form_key'] = form_key or data['form_key']
+    option_value = item.get('option_value')
+    if option_value:
+        if not form['option_field']:
+            return False
+        data[form['option_field']] = option_value
+    
+    response = request.post(
+        form['action'],
+        form=data,
+        headers={'X-Requested-With': 'XMLHttpRequest', 'Referer': item['product_url']},
+        timeout=Config.CHECKOUT_CART_ADD_TIMEOUT
+    )
+    if not response.ok:
+        return False
+    try:
+        payload = response.json()
+    except Exception:
+        # A 2xx page instead of JSON (e.g. the cart after a redirect): the
+        # add went through, and retrying it on the product page would
+        # double the quantity
+        return True
+    # On failure Magento answers with a redirect back to the product page
+    return not (isinstance(payload, dict) and payload.get('backUrl'))
+
+def _add_items_via_http(context, selected_items, timer):
+    """Fast path: add items without rendering product pages; returns the items that failed"""
+    form_key = _form_key(context)
+    failed = []
+    for item in selected_items:
+        with timer.step('add_to_cart_http', url=item['product_url']) as step:
+            try:
+                step['ok'] = _add_item_via_http(context, item, form_key)
+            except Exception as e:
+                step['ok'] = False
+                step['error'] = str(e)
+        if not step['ok']:
+            failed.append(item)
+    return failed
+
+def _report(progress, message, context=None):
+    """Log a checkout step and pass it on to the caller's progress callback"""
+    log_message('info', message, context)
+    if progress:
+        try:
+            progress(message)
+        except Exception as e:
+            print(f"Error reporting checkout progress: {e}")
+
+def _start_playwright_trace(context):
+    """Record a Playwright trace when CHECKOUT_TRACE asks for one; returns True if started"""
+    if Config.CHECKOUT_TRACE == 'off':
+        return False
+    try:
+        context.tracing.start(screenshots=True, snapshots=True)
+        return True
+    except Exception as e:
+        log_message('warning', f'Could not start Playwright tracing: {str(e)}')
+        return False
+
+def _stop_playwright_trace(context, timer, success):
+    """Keep the trace zip for failed (and, in 'slow' mode, slow) runs; returns its path"""
+    slow = timer.elapsed_ms() > Config.CHECKOUT_TRACE_SLOW_SECONDS * 1000
+    keep = not success or (Config.CHECKOUT_TRACE == 'slow' and slow)
+    try:
+        if not keep:
+            context.tracing.stop()
+            return None
+        os.makedirs(Config.CHECKOUT_TRACE_DIR, exist_ok=True)
+        path = os.path.join(Config.CHECKOUT_TRACE_DIR, f'{timer.trace_id}.zip')
+        context.tracing.stop(path=path)
+        os.chmod(path, 0o600)  # contains the typed credentials
+        return path
+    except Exception as e:
+        log_message('warning', f'Could not save Playwright trace: {str(e)}')
+        return None
+
+def _record_trace(timer, user_id, order_id, success, session, items_count, playwright_trace):
+    """Store the run's spans plus a root 'checkout' span"""
+    STEP_SECONDS.observe(timer.elapsed_ms() / 1000, step='checkout', status='ok' if success else 'error')
+    root = {
+        'step': 'checkout',
+        'status': 'ok' if success else 'error',
+        'started_at': timer.started_at,
+        'ended_at': datetime.utcnow().isoformat(),
+        'duration_ms': timer.elapsed_ms(),
+        'session': session,
+        'items': items_count,
+        'playwright_trace': bool(playwright_trace)
+    }
+    try:
+        save_trace_spans(timer.trace_id, user_id, order_id, [root] + timer.steps)
+    except Exception as e:
+        log_message('error', f'Could not store checkout trace: {str(e)}', {'trace_id': timer.trace_id})
+
+def _checkout_steps(context, user_id, user_credentials, selected_items, has_saved_session=False, progress=None):
+    """Drive the dampfi.ch checkout inside an isolated browser context"""
+    timer = StepTimer()
+    tracing = _start_playwright_trace(context)
+    page = context.new_page()
+    page.set_default_timeout(Config.PLAYWRIGHT_TIMEOUT)
+    page.on('framenavigated', lambda frame: timer.navigated(frame.url) if frame == page.main_frame else None)
+    session = None
+    order_id = None
+    result = None
+    
+    try:
+        # Step 1: Login to dampfi.ch
+        _report(progress, 'Logging in to dampfi.ch')
+        with timer.step('login') as step:
+            session = _ensure_logged_in(context, page, user_id, user_credentials, has_saved_session)
+            step['session'] = session
+        
+        # Step 2: Add all products to cart, over HTTP first and through the
+        # product page for anything the fast path could not add
+        _report(progress, 'Adding products to cart')
+        remaining = selected_items
+        if Config.CHECKOUT_HTTP_CART:
+            remaining = _add_items_via_http(context, selected_items, timer)
+            if remaining:
+                log_message('warning', 'Falling back to product pages for some items',
+                            {'urls': [item['product_url'] for item in remaining]})
+        not_added = []
+        for item in remaining:
+            with timer.step('add_to_cart', url=item['product_url']) as step:
+                step['ok'] = _add_item_via_ui(page, item)
+            if not step['ok']:
+                not_added.append(item)
+        if not_added:
+            # Never place an order that is missing items the user selected
+            raise RuntimeError('Could not add to cart: ' + ', '.join(
+                item.get('name') or item['product_url'] for item in not_added
+            ))
+        
+        # Step 3: Go to checkout
+        _report(progress, 'Proceeding to checkout')
+        with timer.step('checkout_page') as step:
+            page.goto(f'{Config.DAMPFI_BASE_URL}/checkout', wait_until='domcontentloaded')
+            # Address should be pre-filled from account; wait for the form or payment list
+            try:
+                page.wait_for_selector(CHECKOUT_READY_SELECTOR, state='visible',
+                                       timeout=Config.CHECKOUT_PAGE_TIMEOUT)
+            except PlaywrightTimeoutError:
+                step['form_visible'] = False
+                log_message('warning', 'Checkout form did not appear')
+            _wait_for_idle_checkout(page)
+        
+        # Step 4: Select payment method "Bill"
+        _report(progress, 'Selecting payment method')
+        with timer.step('payment_method'):
+            bill_payment = page.locator(BILL_PAYMENT_SELECTOR)
+            if timer.count('bill_payment', bill_payment) > 0:
+                bill_payment.first.click()
+                _wait_for_idle_checkout(page)
+        
+        # Step 5: Get total price
+        total_price = None
+        with timer.step('read_total') as step:
+            total_price_elem = page.locator(TOTAL_PRICE_SELECTOR)
+            if timer.count('total_price', total_price_elem) > 0:
+                price_text = total_price_elem.first.inner_text()
+                price_match = PRICE_PATTERN.search(price_text.replace(',', '.'))
+                if price_match:
+                    try:
+                        total_price = float(price_match.group().replace(',', '.'))
+                    except:
+                        pass
+            step['total_price'] = total_price
+        
+        # Step 6: Place order and wait for the success page
+        _report(progress, 'Placing order')
+        with timer.step('place_order') as step:
+            place_order_button = page.locator(PLACE_ORDER_SELECTOR)
+            if timer.count('place_order', place_order_button) > 0:
+                place_order_button.first.click()
+                try:
+                    page.wait_for_url(lambda url: '/checkout/onepage/success' in url,
+                                      wait_until='domcontentloaded',
+                                      timeout=Config.CHECKOUT_ORDER_TIMEOUT)
+                except PlaywrightTimeoutError:
+                    # Some themes render the confirmation without a redirect
+                    try:
+                        page.wait_for_selector(CONFIRMATION_SELECTOR, timeout=Config.CHECKOUT_PAGE_TIMEOUT)
+                    except PlaywrightTimeoutError:
+                        step['confirmation_detected'] = False
+                        log_message('warning', 'Order confirmation page not detected')
+        
+        # Step 7: Get order confirmation
+        confirmation_data = {}
+        with timer.step('confirmation'):
+            order_number_elem = page.locator(CONFIRMATION_SELECTOR)
+            if timer.count('order_number', order_number_elem) > 0:
+                confirmation_data['order_number'] = order_number_elem.first.inner_text()
+            
+            confirmation_text = page.locator('body').inner_text()
+            if 'thank you' in confirmation_text.lower() or 'bestellung' in confirmation_text.lower():
+                confirmation_data['status'] = 'confirmed'
+        
+        # Create order record
+        order_id = create_order(
+            user_id=user_id,
+            total_price=total_price,
+            items=selected_items,
+            status='completed',
+            confirmation_data=confirmation_data
+        )
+        
+        # Keep the refreshed cookies for the next checkout
+        if session != 'unverified':
+            save_user_session(user_id, context.storage_state())
+        
+        timings = timer.summary()
+        log_message('info', 'Checkout completed successfully', {'order_id': order_id, 'timings': timings})
+        
+        result = {
+            'success': True,
+            'message': 'Order placed successfully',
+            'order_id': order_id,
+            'total_price': total_price,
+            'confirmation_data': confirmation_data,
+            'timings': timings
+        }
+        
+    except Exception as e:
+        timings = timer.summary()
+        log_message('error', f'Checkout automation error: {str(e)}', {'user_id': user_id, 'timings': timings})
+        result = {
+            'success': False,
+            'message': f'Checkout failed: {str(e)}',
+            'error': str(e),
+            'timings': timings
+        }
+    
+    playwright_trace = _stop_playwright_trace(context, timer, result['success']) if tracing else None
+    if playwright_trace:
+        result['playwright_trace'] = True
+    _record_trace(timer, user_id, order_id, result['success'], session, len(selected_items), playwright_trace)
+    return result
+
+def run_checkout(user_id, user_credentials, selected_items, progress=None):
     """
     Run checkout automation using Playwright
     
@@ -12,148 +478,26 @@ def run_checkout(user_id, user_credentials, selected_items):
         user_id: User ID (1-5)
         user_credentials: dict with 'dampfi_email' and 'dampfi_password'
         selected_items: list of dicts with 'product_url', 'quantity', 'option_value'
+        progress: optional callable, called with a message at each step
     
     Returns:
         dict with 'success', 'message', 'order_data'
     """
     try:
-        log_message('info', f'Starting checkout for user {user_id}', {'items_count': len(selected_items)})
+        _report(progress, f'Starting checkout for user {user_id}', {'items_count': len(selected_items)})
+        
+        # Start from the saved dampfi.ch session when there is one
+        storage_state = get_user_session(user_id)
+        context_options = dict(DEFAULT_CONTEXT_OPTIONS)
+        if storage_state:
+            context_options['storage_state'] = storage_state
+        
+        return get_browser_pool().run(
+            _checkout_steps, user_id, user_credentials, selected_items,
+            has_saved_session=bool(storage_state), progress=progress,
+            context_options=context_options
+        )
         
-        with sync_playwright() as p:
-            # Launch browser (headless)
-            browser = p.chromium.launch(headless=Config.PLAYWRIGHT_HEADLESS)
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
-            page = context.new_page()
-            
-            try:
-                # Step 1: Login to dampfi.ch
-                log_message('info', 'Logging in to dampfi.ch')
-                page.goto(f'{Config.DAMPFI_BASE_URL}/customer/account/login', wait_until='networkidle')
-                
-                # Fill login form
-                email_input = page.locator('input[name="login[username]"], input[type="email"], #email')
-                password_input = page.locator('input[name="login[password]"], input[type="password"], #pass')
-                
-                if email_input.count() > 0 and password_input.count() > 0:
-                    email_input.fill(user_credentials['dampfi_email'])
-                    password_input.fill(user_credentials['dampfi_password'])
-                    
-                    # Submit login
-                    login_button = page.locator('button[type="submit"], button.action.login, .action.login')
-                    if login_button.count() > 0:
-                        login_button.click()
-                        page.wait_for_timeout(2000)  # Wait for login to process
-                
-                # Step 2: Add all products to cart
-                log_message('info', 'Adding products to cart')
-                for item in selected_items:
-                    product_url = item['product_url']
-                    quantity = item.get('quantity', 1)
-                    option_value = item.get('option_value')
-                    
-                    page.goto(product_url, wait_until='networkidle')
-                    page.wait_for_timeout(1000)
-                    
-                    # Select option if provided
-                    if option_value:
-                        option_select = page.locator('select[name*="option"], select[name*="super_attribute"]')
-                        if option_select.count() > 0:
-                            option_select.select_option(option_value)
-                            page.wait_for_timeout(500)
-                    
-                    # Set quantity
-                    qty_input = page.locator('input[name="qty"], input[type="number"][name*="qty"]')
-                    if qty_input.count() > 0:
-                        qty_input.fill(str(quantity))
-                    
-                    # Click add to cart
-                    add_to_cart = page.locator('button[title*="Add to Cart"], button.action.tocart, #product-addtocart-button')
-                    if add_to_cart.count() > 0:
-                        add_to_cart.click()
-                        page.wait_for_timeout(2000)  # Wait for cart update
-                
-                # Step 3: Go to checkout
-                log_message('info', 'Proceeding to checkout')
-                page.goto(f'{Config.DAMPFI_BASE_URL}/checkout', wait_until='networkidle')
-                page.wait_for_timeout(2000)
-                
-                # Step 4: Fill shipping information (if needed)
-                # Note: Address should be saved in account, but we'll check if form appears
-                shipping_form = page.locator('form[name="checkout"], #shipping-form')
-                if shipping_form.count() > 0:
-                    # Address should be pre-filled from account, but we can verify
-                    page.wait_for_timeout(1000)
-                
-                # Step 5: Select payment method "Bill"
-                log_message('info', 'Selecting payment method')
-                bill_payment = page.locator('input[value*="bill"], input[value*="invoice"], label:has-text("Bill"), label:has-text("Rechnung")')
-                if bill_payment.count() > 0:
-                    bill_payment.first.click()
-                    page.wait_for_timeout(1000)
-                
-                # Step 6: Get total price
-                total_price_elem = page.locator('.grand.totals .price, .order-total .price, [class*="total"] .price')
-                total_price = None
-                if total_price_elem.count() > 0:
-                    price_text = total_price_elem.first.inner_text()
-                    import re
-                    price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', '.'))
-                    if price_match:
-                        try:
-                            total_price = float(price_match.group().replace(',', '.'))
-                        except:
-                            pass
-                
-                # Step 7: Place order
-                log_message('info', 'Placing order')
-                place_order_button = page.locator('button[title*="Place Order"], button.checkout, .action.primary.checkout')
-                if place_order_button.count() > 0:
-                    place_order_button.click()
-                    page.wait_for_timeout(5000)  # Wait for order confirmation
-                
-                # Step 8: Get order confirmation
-                confirmation_data = {}
-                order_number_elem = page.locator('.order-number, [class*="order-id"], .checkout-success')
-                if order_number_elem.count() > 0:
-                    confirmation_data['order_number'] = order_number_elem.first.inner_text()
-                
-                confirmation_text = page.locator('body').inner_text()
-                if 'thank you' in confirmation_text.lower() or 'bestellung' in confirmation_text.lower():
-                    confirmation_data['status'] = 'confirmed'
-                
-                # Create order record
-                order_id = create_order(
-                    user_id=user_id,
-                    total_price=total_price,
-                    items=selected_items,
-                    status='completed',
-                    confirmation_data=confirmation_data
-                )
-                
-                log_message('info', f'Checkout completed successfully', {'order_id': order_id})
-                
-                browser.close()
-                
-                return {
-                    'success': True,
-                    'message': 'Order placed successfully',
-                    'order_id': order_id,
-                    'total_price': total_price,
-                    'confirmation_data': confirmation_data
-                }
-                
-            except Exception as e:
-                log_message('error', f'Checkout automation error: {str(e)}', {'user_id': user_id})
-                browser.close()
-                return {
-                    'success': False,
-                    'message': f'Checkout failed: {str(e)}',
-                    'error': str(e)
-                }
-                
     except Exception as e:
         log_message('error', f'Playwright error: {str(e)}', {'user_id': user_id})
         return {
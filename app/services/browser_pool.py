@@ -0,0 +1,301 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from concurrent.futures import Future
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app import metrics
+
+# Playwright's sync API is bound to the thread that started it, so each pool
+# slot is a worker thread that owns one warm Chromium instance. Jobs are
+# handed to the workers and run there with a fresh BrowserContext.
+
+DEFAULT_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+def _descendant_pids(root_pid):
+    """PIDs of all processes below root_pid (Linux /proc only)"""
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return []
+    pids, stack = [], [root_pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            pids.append(child)
+            stack.append(child)
+    return pids
+
+def browser_memory_mb():
+    """Resident memory of the Playwright driver and browsers, or None if unknown"""
+    if not os.path.isdir('/proc'):
+        return None
+    total_kb = 0
+    for pid in _descendant_pids(os.getpid()):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+class _Job:
+    def __init__(self, func, args, kwargs, context_options):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.context_options = context_options
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+class BrowserPool:
+    """A fixed number of warm Chromium instances shared by checkout jobs.
+
+    ``run(func, ...)`` calls ``func(context, ...)`` with a new, isolated
+    BrowserContext on one of the warm browsers and returns its result. At
+    most ``size`` jobs run at once; the rest wait in FIFO order. A browser
+    is relaunched after ``max_uses`` jobs or when the browsers together use
+    more than ``max_memory_mb`` of resident memory.
+    """
+
+    _STOP = object()
+
+    def __init__(self, size=None, max_uses=None, max_memory_mb=None, headless=None):
+        self.size = size or Config.BROWSER_POOL_SIZE
+        self.max_uses = max_uses or Config.BROWSER_MAX_USES
+        self.max_memory_mb = Config.BROWSER_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+        self.headless = Config.PLAYWRIGHT_HEADLESS if headless is None else headless
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._warm = 0
+        self._busy = 0
+        self._launches = 0
+        self._recycles = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._launch_error = None
+
+    def start(self):
+        """Start the worker threads; each launches its browser immediately"""
+        with self._lock:
+            if self._workers:
+                return
+            for n in range(self.size):
+                worker = threading.Thread(target=self._worker, name=f'browser-pool-{n}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, func, *args, context_options=None, **kwargs):
+        """Queue func(context, *args, **kwargs) and return a Future"""
+        self.start()
+        job = _Job(func, args, kwargs, context_options or DEFAULT_CONTEXT_OPTIONS)
+        self._jobs.put(job)
+        return job.future
+
+    def run(self, func, *args, timeout=None, context_options=None, **kwargs):
+        """Run func(context, *args, **kwargs) on a pooled browser and wait for it"""
+        return self.submit(func, *args, context_options=context_options, **kwargs).result(timeout)
+
+    def shutdown(self, timeout=10):
+        """Close every browser; jobs already queued still run first"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._jobs.put(self._STOP)
+        for worker in workers:
+            worker.join(timeout)
+
+    def metrics(self):
+        """Pool state and counters for monitoring"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                'size': self.size,
+                'warm': self._warm,
+                'busy': self._busy,
+                'queued': self._jobs.qsize(),
+                'launches': self._launches,
+                'recycles': self._recycles,
+                'completed': self._completed,
+                'failed': self._failed,
+                'avg_wait_seconds': round(self._wait_total / finished, 3) if finished else 0.0,
+                'max_wait_seconds': round(self._wait_max, 3),
+                'memory_mb': browser_memory_mb()
+            }
+
+    def health(self):
+        """
+        Whether the pool can take checkouts
+        
+        A pool that has not started yet is healthy (browsers launch on the
+        first job). A started one needs all worker threads alive and, unless
+        nothing has been launched yet, at least one browser up or no failed
+        launch since the last successful one.
+        """
+        with self._lock:
+            alive = sum(1 for worker in self._workers if worker.is_alive())
+            started = bool(self._workers)
+            ok = not started or (alive == self.size and (self._warm > 0 or self._launch_error is None))
+            return {
+                'ok': ok,
+                'started': started,
+                'alive_workers': alive,
+                'size': self.size,
+                'warm': self._warm,
+                'busy': self._busy,
+                'launch_error': self._launch_error
+            }
+
+    def _launch(self, playwright):
+        try:
+            browser = playwright.chromium.launch(headless=self.headless)
+        except Exception as e:
+            with self._lock:
+                self._launch_error = str(e)
+            raise
+        with self._lock:
+            self._warm += 1
+            self._launches += 1
+            self._launch_error = None
+        return browser
+
+    def _close(self, browser):
+        with self._lock:
+            self._warm -= 1
+        try:
+            browser.close()
+        except Exception as e:
+            log_message('warning', f'Error closing pooled browser: {str(e)}')
+
+    def _should_recycle(self, uses):
+        if uses >= self.max_uses:
+            return True
+        if self.max_memory_mb:
+            memory = browser_memory_mb()
+            if memory is not None and memory > self.max_memory_mb:
+                return True
+        return False
+
+    def _worker(self):
+        from playwright.sync_api import sync_playwright
+
+        try:
+            with sync_playwright() as playwright:
+                browser = None
+                uses = 0
+                while True:
+                    if browser is None:
+                        try:
+                            browser = self._launch(playwright)
+                        except Exception as e:
+                            log_message('error', f'Browser launch failed: {str(e)}')
+                        uses = 0
+                    job = self._jobs.get()
+                    if job is self._STOP:
+                        break
+                    if not job.future.set_running_or_notify_cancel():
+                        continue
+                    if browser is None or not browser.is_connected():
+                        # Launch failed earlier or the browser crashed; try once more
+                        if browser is not None:
+                            self._close(browser)
+                        try:
+                            browser = self._launch(playwright)
+                            uses = 0
+                        except Exception as e:
+                            browser = None
+                            self._finish(job, error=e)
+                            continue
+                    self._run_job(browser, job)
+                    uses += 1
+                    if self._should_recycle(uses):
+                        self._close(browser)
+                        browser = None
+                        with self._lock:
+                            self._recycles += 1
+                if browser is not None:
+                    self._close(browser)
+        except Exception as e:
+            log_message('error', f'Browser pool worker stopped: {str(e)}')
+        finally:
+            close_thread_db()
+
+    def _run_job(self, browser, job):
+        waited = time.monotonic() - job.submitted_at
+        with self._lock:
+            self._busy += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        context = None
+        try:
+            context = browser.new_context(**job.context_options)
+            result = job.func(context, *job.args, **job.kwargs)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, result=result)
+        finally:
+            if context is not None:
+                try:
+                    context.close()
+                except Exception:
+                    pass
+            with self._lock:
+                self._busy -= 1
+
+    def _finish(self, job, result=None, error=None):
+        with self._lock:
+            if error is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+        if error is None:
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(error)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _pool_state():
+    if _pool is None:
+        return None
+    state = _pool.metrics()
+    return {(key,): state[key] for key in ('queued', 'busy', 'warm')}
+
+metrics.gauge_callback('browser_pool_jobs', 'Browser pool: queued jobs, busy and warm browsers',
+                       _pool_state, ['state'])
+
+def browser_pool_health():
+    """Health of this process's pool without creating it"""
+    if _pool is None:
+        return {'ok': True, 'started': False}
+    return _pool.health()
+
+def get_browser_pool():
+    """Return the process-wide browser pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+        return _pool
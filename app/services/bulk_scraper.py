@@ -0,0 +1,130 @@
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app.models import list_products, update_products_bulk, create_scrape_run, update_scrape_run
+from app.services.scraper import scrape_product_metadata, product_updates_from_scrape, get_session
+
+class HostLimiter:
+    """Cap the number of in-flight requests per host"""
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+# Product columns a scrape can update (see product_updates_from_scrape)
+SCRAPED_FIELDS = ['name', 'price', 'stock_status', 'options']
+
+def _stale_fields(product, result):
+    """Scraped fields that differ from the product row"""
+    current = dict(product, options=product.get('options') or [])
+    return {field: value for field, value in product_updates_from_scrape(result).items()
+            if value != current.get(field)}
+
+def _scrape_one(product, limiter, max_retries):
+    result = None
+    for _ in range(max_retries):
+        with limiter.for_url(product['product_url']):
+            result = scrape_product_metadata(product['product_url'], session=get_session())
+        if 'error' not in result:
+            break
+    return product, result
+
+def refresh_products(product_ids=None, concurrency=None, per_host=None, batch_size=None,
+                     max_retries=2, progress=None):
+    """
+    Re-scrape products concurrently and write results back in batches
+
+    Args:
+        product_ids: optional list of product IDs (default: all products)
+        concurrency: total parallel fetches (default Config.SCRAPE_CONCURRENCY)
+        per_host: parallel fetches per host (default Config.SCRAPE_PER_HOST_CONCURRENCY)
+        batch_size: product updates per transaction (default Config.SCRAPE_BATCH_SIZE)
+        progress: optional callable(done, failed, total, errors)
+
+    Returns:
+        dict with 'total', 'done', 'failed', 'errors'
+    """
+    products, _ = list_products(fields=['id', 'product_url'] + SCRAPED_FIELDS)
+    if product_ids is not None:
+        wanted = {int(pid) for pid in product_ids}
+        products = [p for p in products if p['id'] in wanted]
+
+    concurrency = concurrency or Config.SCRAPE_CONCURRENCY
+    limiter = HostLimiter(per_host or Config.SCRAPE_PER_HOST_CONCURRENCY)
+    batch_size = batch_size or Config.SCRAPE_BATCH_SIZE
+
+    total = len(products)
+    done = 0
+    errors = []
+    pending = []
+
+    def flush():
+        update_products_bulk(pending)
+        pending.clear()
+        if progress:
+            progress(done, len(errors), total, errors)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='scraper') as pool:
+        futures = [pool.submit(_scrape_one, p, limiter, max_retries) for p in products]
+        for future in as_completed(futures):
+            product, result = future.result()
+            done += 1
+            if 'error' in result:
+                errors.append({'product_id': product['id'], 'error': result['error']})
+            else:
+                # Compare with the product row rather than trusting an unchanged
+                # page: the row may have been edited or a batch write lost since
+                updates = _stale_fields(product, result)
+                if updates:
+                    pending.append((product['id'], updates))
+            if len(pending) >= batch_size or done % batch_size == 0:
+                flush()
+    flush()
+
+    log_message('info', 'Bulk product refresh finished',
+                {'total': total, 'failed': len(errors)})
+    return {'total': total, 'done': done, 'failed': len(errors), 'errors': errors}
+
+def start_bulk_refresh(product_ids=None):
+    """
+    Run refresh_products in a background thread
+
+    Returns:
+        (run ID, requested product IDs that do not exist)
+    """
+    existing = [p['id'] for p in list_products(fields=['id'])[0]]
+    missing = []
+    if product_ids is not None:
+        requested = list(dict.fromkeys(int(pid) for pid in product_ids))
+        known = set(existing)
+        missing = [pid for pid in requested if pid not in known]
+        product_ids = [pid for pid in requested if pid in known]
+    total = len(product_ids) if product_ids is not None else len(existing)
+    run_id = create_scrape_run(total)
+
+    def report(done, failed, total, errors):
+        update_scrape_run(run_id, done, failed, errors)
+
+    def run():
+        try:
+            summary = refresh_products(product_ids, progress=report)
+            update_scrape_run(run_id, summary['done'], summary['failed'], summary['errors'],
+                              status='finished')
+        except Exception as e:
+            log_message('error', f'Bulk refresh failed: {str(e)}', {'run_id': run_id})
+            update_scrape_run(run_id, 0, 0, [{'error': str(e)}], status='failed')
+        finally:
+            close_thread_db()
+
+    threading.Thread(target=run, name=f'bulk-refresh-{run_id}', daemon=True).start()
+    return run_id, missing
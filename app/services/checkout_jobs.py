@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app.models import (
+    get_user_by_id, create_checkout_job, get_checkout_job, get_checkout_jobs_by_status,
+    claim_checkout_job, add_checkout_job_step, finish_checkout_job,
+    get_next_queued_checkout_job, get_checkout_batch_jobs, get_checkout_job_timings,
+    count_checkout_jobs_by_status, get_span_durations, get_dispatchable_checkout_jobs,
+    renew_checkout_job_leases, get_abandoned_checkout_jobs
+)
+from app.utils.helpers import percentile
+from app import metrics
+from app.services.automation import run_checkout
+from app.services.stock_check import check_stock, describe_unavailable
+
+ON_UNAVAILABLE_MODES = ('fail', 'trim', 'skip')
+
+class SubmissionKeyConflict(ValueError):
+    """A submission key was reused for a different checkout"""
+
+# Checkouts run here instead of on the request thread. Jobs of different
+# accounts run concurrently, each in its own BrowserContext with that
+# account's saved session; jobs of the same account run one at a time, in
+# order (enforced by claim_checkout_job, so it holds across processes). The
+# browser pool caps how many browsers run at once; this executor only has to
+# keep enough threads around to feed it.
+#
+# With CHECKOUT_RUNNER='worker' this only happens in the checkout worker
+# process (scripts/checkout_worker.py); web processes just queue jobs, so
+# restarting or recycling them never interrupts a checkout.
+#
+# A claimed job records the claiming process's instance id and a lease that
+# a background thread keeps renewing while the process lives. PIDs are no
+# use for this: a containerised worker is PID 1 again after every restart.
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()  # job ids submitted to the executor and not finished
+_lease_thread = None
+_lease_stop = threading.Event()
+_instance = {'pid': None, 'id': None}
+
+def instance_id():
+    """Random id of this process, new after every start (and fork)"""
+    if _instance['pid'] != os.getpid():
+        _instance.update(pid=os.getpid(), id=uuid.uuid4().hex)
+    return _instance['id']
+
+def _lease_until():
+    return (datetime.utcnow() + timedelta(seconds=Config.CHECKOUT_LEASE_SECONDS)).isoformat()
+
+def _get_executor():
+    global _executor, _lease_thread
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.CHECKOUT_WORKERS, thread_name_prefix='checkout-job'
+            )
+            _lease_stop.clear()
+            _lease_thread = threading.Thread(target=_keep_leases, name='checkout-lease', daemon=True)
+            _lease_thread.start()
+        return _executor
+
+def shutdown_checkout_jobs():
+    """Wait for running jobs; jobs not started yet stay queued for the next run"""
+    global _executor, _lease_thread
+    with _executor_lock:
+        executor, _executor = _executor, None
+        _in_flight.clear()
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+    # Leases are renewed until the last running job has finished
+    _lease_stop.set()
+    thread, _lease_thread = _lease_thread, None
+    if thread is not None:
+        thread.join(10)
+
+def _keep_leases():
+    """Renew this process's leases and fail jobs whose owner stopped renewing"""
+    try:
+        while not _lease_stop.wait(Config.CHECKOUT_LEASE_SECONDS / 3):
+            try:
+                renew_checkout_job_leases(instance_id(), _lease_until())
+                fail_abandoned_checkout_jobs()
+            except Exception as e:
+                log_message('error', f'Renewing checkout job leases failed: {str(e)}')
+    finally:
+        close_thread_db()
+
+def _submit_job(job_id):
+    """Hand a job to the executor unless this process already has it"""
+    with _executor_lock:
+        if job_id in _in_flight:
+            return
+        _in_flight.add(job_id)
+    _get_executor().submit(_run_job, job_id)
+
+metrics.gauge_callback(
+    'checkout_jobs', 'Checkout jobs queued or running (all processes)',
+    lambda: {(status,): count for status, count in count_checkout_jobs_by_status().items()
+             if status in ('queued', 'running')},
+    ['status']
+)
+
+def submit_checkout(user_id, items, submission_key=None, on_unavailable=None, batch_id=None):
+    """
+    Queue a checkout
+    
+    A repeated submission_key returns the job created by the first
+    submission instead of starting another checkout. on_unavailable
+    overrides Config.CHECKOUT_ON_UNAVAILABLE for this job.
+    
+    Returns:
+        tuple (job dict, created flag)
+    
+    Raises:
+        SubmissionKeyConflict: the key belongs to a job for another user,
+                               other items or another on_unavailable mode
+    """
+    submission_key = submission_key or uuid.uuid4().hex
+    on_unavailable = on_unavailable or Config.CHECKOUT_ON_UNAVAILABLE
+    job, created = create_checkout_job(submission_key, user_id, items, on_unavailable, batch_id)
+    if not created and (job['user_id'] != int(user_id) or job['items'] != json.loads(json.dumps(items))
+                        or job['on_unavailable'] != on_unavailable):
+        raise SubmissionKeyConflict(f'Submission key {submission_key} was used for a different checkout')
+    if created:
+        log_message('info', f'Queued checkout job {job["id"]}', {'user_id': user_id})
+        if Config.CHECKOUT_RUNNER == 'inline':
+            _submit_job(job['id'])
+    return job, created
+
+def submit_checkout_batch(orders, batch_id=None):
+    """
+    Queue checkouts for several accounts at once
+    
+    Args:
+        orders: list of dicts with 'user_id', 'items' and optional 'on_unavailable'
+        batch_id: idempotency key for the whole batch
+    
+    Returns:
+        tuple (batch_id, list of jobs)
+    
+    Raises:
+        SubmissionKeyConflict: the batch_id was used for different orders
+    """
+    batch_id = batch_id or uuid.uuid4().hex
+    existing = get_checkout_batch_jobs(batch_id)
+    if existing and len(existing) != len(orders):
+        raise SubmissionKeyConflict(f'Batch {batch_id} was submitted with {len(existing)} orders')
+    jobs = []
+    for index, order in enumerate(orders):
+        job, _ = submit_checkout(order['user_id'], order['items'], f'{batch_id}:{index}',
+                                 order.get('on_unavailable'), batch_id)
+        jobs.append(job)
+    return batch_id, jobs
+
+def get_checkout_batch(batch_id):
+    """Combined view of a batch: every job plus totals; None if unknown"""
+    jobs = get_checkout_batch_jobs(batch_id)
+    if not jobs:
+        return None
+    summary = {'total': len(jobs), 'queued': 0, 'running': 0, 'succeeded': 0, 'failed': 0,
+               'total_price': 0.0}
+    for job in jobs:
+        summary[job['status']] = summary.get(job['status'], 0) + 1
+        if job['status'] == 'succeeded' and job.get('result'):
+            summary['total_price'] += job['result'].get('total_price') or 0
+    finished = summary['succeeded'] + summary['failed'] == summary['total']
+    return {
+        'batch_id': batch_id,
+        'status': 'finished' if finished else 'running',
+        'summary': summary,
+        'jobs': jobs
+    }
+
+def _duration(job):
+    started = datetime.fromisoformat(job['started_at'])
+    return (datetime.fromisoformat(job['finished_at']) - started).total_seconds()
+
+def checkout_throughput(window_seconds=3600):
+    """Orders per minute and checkout durations over the last window_seconds"""
+    since = (datetime.utcnow() - timedelta(seconds=window_seconds)).isoformat()
+    finished = [job for job in get_checkout_job_timings(since) if job['started_at']]
+    succeeded = [job for job in finished if job['status'] == 'succeeded']
+    durations = [_duration(job) for job in finished]
+    counts = count_checkout_jobs_by_status()
+    return {
+        'window_seconds': window_seconds,
+        'finished': len(finished),
+        'succeeded': len(succeeded),
+        'failed': len(finished) - len(succeeded),
+        'orders_per_minute': round(len(succeeded) * 60 / window_seconds, 3),
+        'duration_p50_seconds': percentile(durations, 50),
+        'duration_p95_seconds': percentile(durations, 95),
+        'accounts_active': len({job['user_id'] for job in get_checkout_jobs_by_status('running')}),
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0)
+    }
+
+def checkout_step_metrics(window_seconds=3600):
+    """Per-step duration percentiles from the checkout traces of the last window_seconds"""
+    since = (datetime.utcnow() - timedelta(seconds=window_seconds)).isoformat()
+    by_step = {}
+    for span in get_span_durations(since):
+        by_step.setdefault(span['name'], []).append(span)
+    
+    steps = {}
+    for name, spans in by_step.items():
+        durations = [span['duration_ms'] for span in spans if span['duration_ms'] is not None]
+        steps[name] = {
+            'count': len(spans),
+            'errors': sum(1 for span in spans if span['status'] != 'ok'),
+            'p50_ms': percentile(durations, 50),
+            'p95_ms': percentile(durations, 95),
+            'p99_ms': percentile(durations, 99),
+            'max_ms': max(durations) if durations else None
+        }
+    runs = steps.pop('checkout', None)
+    return {'window_seconds': window_seconds, 'runs': runs, 'steps': steps}
+
+def _run_job(job_id):
+    """Run one queued job in a worker thread"""
+    try:
+        _run_claimed_job(job_id)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(job_id)
+
+def _run_claimed_job(job_id):
+    if not claim_checkout_job(job_id, os.getpid(), instance_id(), _lease_until()):
+        # Taken, finished, or its account is busy: the running job hands over when done
+        return
+    job = get_checkout_job(job_id)
+    try:
+        user = get_user_by_id(job['user_id'])
+        if not user or not user.get('dampfi_email') or not user.get('dampfi_password'):
+            result = {'success': False, 'message': 'User credentials not configured',
+                      'error': 'User credentials not configured'}
+        else:
+            result = _run_checked_checkout(job, user)
+    except Exception as e:
+        result = {'success': False, 'message': f'Checkout failed: {str(e)}', 'error': str(e)}
+    finish_checkout_job(job_id, 'succeeded' if result.get('success') else 'failed', result)
+    _dispatch_next(job['user_id'])
+
+def _dispatch_next(user_id):
+    """Start the account's next queued job now that it is free"""
+    next_job_id = get_next_queued_checkout_job(user_id)
+    if next_job_id is not None:
+        _submit_job(next_job_id)
+
+def _run_checked_checkout(job, user):
+    """Verify stock over plain HTTP, then run the browser checkout for what is left"""
+    job_id = job['id']
+    items = job['items']
+    mode = job.get('on_unavailable') or Config.CHECKOUT_ON_UNAVAILABLE
+    removed = []
+    
+    if mode != 'skip':
+        add_checkout_job_step(job_id, f'Checking stock for {len(items)} items')
+        report = check_stock(items)
+        removed = report['unavailable']
+        if removed and (mode == 'fail' or not report['available']):
+            return {
+                'success': False,
+                'message': f'Unavailable: {describe_unavailable(removed)}',
+                'error': 'out_of_stock',
+                'unavailable_items': removed
+            }
+        if removed:
+            add_checkout_job_step(job_id, f'Removed unavailable items: {describe_unavailable(removed)}')
+            items = report['available']
+    
+    result = run_checkout(
+        user_id=job['user_id'],
+        user_credentials={
+            'dampfi_email': user['dampfi_email'],
+            'dampfi_password': user['dampfi_password']
+        },
+        selected_items=items,
+        progress=lambda message: add_checkout_job_step(job_id, message)
+    )
+    if removed:
+        result['removed_items'] = removed
+    return result
+
+def fail_abandoned_checkout_jobs(any_owner=False):
+    """
+    Fail running jobs whose process is gone
+    
+    They are failed rather than retried, since the order may already have
+    been placed. The account's next queued job is dispatched.
+    """
+    jobs = get_abandoned_checkout_jobs(instance_id(), any_owner=any_owner)
+    for job in jobs:
+        finish_checkout_job(job['id'], 'failed', {
+            'success': False,
+            'message': 'Checkout was interrupted; check dampfi.ch before retrying',
+            'error': 'interrupted'
+        })
+        log_message('warning', 'Failed interrupted checkout job', {
+            'job_id': job['id'], 'user_id': job['user_id'], 'lease_until': job.get('lease_until')
+        })
+        if Config.CHECKOUT_RUNNER == 'inline':
+            _dispatch_next(job['user_id'])
+    return len(jobs)
+
+def recover_checkout_jobs():
+    """
+    Pick up jobs left behind by a previous process
+    
+    Running jobs of other process instances are failed once their lease has
+    run out; in worker mode there is only one checkout worker, so all of
+    them are. Queued jobs are dispatched again (claiming makes this safe
+    across workers).
+    """
+    _get_executor()  # starts the lease thread, which keeps checking
+    fail_abandoned_checkout_jobs(any_owner=Config.CHECKOUT_RUNNER == 'worker')
+    for job in get_checkout_jobs_by_status('queued'):
+        _submit_job(job['id'])
+
+def dispatch_queued_jobs():
+    """Start every job whose account is free (checkout worker poll)"""
+    job_ids = get_dispatchable_checkout_jobs()
+    for job_id in job_ids:
+        _submit_job(job_id)
+    return len(job_ids)
+
+def write_worker_heartbeat(health):
+    """Record that the checkout worker is alive, for the web processes' readiness check"""
+    path = Config.CHECKOUT_WORKER_HEARTBEAT
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'pid': os.getpid(), 'at': time.time(), 'browser_pool': health}, f)
+    os.replace(tmp_path, path)
+
+def read_worker_heartbeat():
+    """Last checkout worker heartbeat with its 'age' in seconds, or None"""
+    try:
+        with open(Config.CHECKOUT_WORKER_HEARTBEAT) as f:
+            heartbeat = json.load(f)
+    except (OSError, ValueError):
+        return None
+    heartbeat['age'] = round(time.time() - heartbeat.get('at', 0), 3)
+    return heartbeat
@@ -0,0 +1,162 @@
+import os
+import queue
+import importlib
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app import metrics
+
+# Uploads are stored under the SHA-256 of their content ("<digest>.<ext>"),
+# and every derived file under "<digest>_<size>.<format>", so identical
+# uploads share files and every URL can be cached forever. Decoding and
+# resizing happen in a process pool; the upload request only writes the
+# original and schedules the work; a thread in this process waits for each
+# result and records the variants on the product.
+
+# Target widths; 'original' keeps the source dimensions
+IMAGE_SIZES = {'thumb': 320, 'medium': 800}
+
+FORMAT_EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+def _available_formats():
+    """Output formats this Pillow build can write, best first"""
+    from PIL import Image
+    try:
+        importlib.import_module('pillow_avif')  # registers AVIF on older Pillow
+    except ImportError:
+        pass
+    Image.init()
+    formats = ['avif'] if 'AVIF' in Image.SAVE else []
+    return formats + ['webp', 'jpeg']
+
+def _save_atomic(image, path, fmt, quality):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    options = {'quality': quality}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    elif fmt == 'webp':
+        options['method'] = 4
+    image.save(tmp_path, format=fmt.upper(), **options)
+    os.replace(tmp_path, path)
+
+def process_image(src_path, out_dir, quality=None):
+    """
+    Build the resized/re-encoded variants of an uploaded image
+    (runs in a worker process)
+
+    Returns:
+        dict with the source 'width'/'height' and, per size name, the
+        variant 'width' and one filename per format
+    """
+    from PIL import Image, ImageOps
+
+    quality = quality or Config.IMAGE_QUALITY
+    digest = os.path.splitext(os.path.basename(src_path))[0]
+    formats = _available_formats()
+
+    with Image.open(src_path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        width, height = image.size
+
+        targets = dict(IMAGE_SIZES)
+        targets['original'] = width
+        variants = {'width': width, 'height': height, 'sizes': {}}
+        for name, target in targets.items():
+            resized = image
+            if target < width:
+                resized = image.resize((target, round(height * target / width)), Image.LANCZOS)
+            entry = {'width': resized.width}
+            for fmt in formats:
+                if name == 'original' and fmt == 'jpeg':
+                    continue  # the upload itself is the fallback
+                filename = f'{digest}_{name}.{FORMAT_EXTENSIONS[fmt]}'
+                path = os.path.join(out_dir, filename)
+                if not os.path.exists(path):
+                    frame = resized.convert('RGB') if fmt == 'jpeg' else resized
+                    _save_atomic(frame, path, fmt, quality)
+                entry[fmt] = filename
+            variants['sizes'][name] = entry
+    return variants
+
+def variant_filenames(variants):
+    """All derived filenames recorded in an image_variants dict"""
+    names = []
+    for entry in (variants or {}).get('sizes', {}).values():
+        names.extend(entry[fmt] for fmt in FORMAT_EXTENSIONS if fmt in entry)
+    return names
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+_results = queue.Queue()  # (product_id, image_path, future) to store
+_store_thread = None
+_store_pid = None
+
+metrics.gauge_callback('image_jobs_pending', 'Uploaded images waiting for or in processing',
+                       lambda: _pending)
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a threaded server process is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+def _store_variants(product_id, image_path, future):
+    from app.models import get_product_by_id, update_product
+    try:
+        variants = future.result()
+        product = get_product_by_id(product_id)
+        # The product may have been deleted or given another image meanwhile
+        if product and product.get('image_path') == image_path:
+            update_product(product_id, image_variants=variants)
+    except Exception as e:
+        log_message('error', f'Image processing failed: {str(e)}',
+                    {'product_id': product_id, 'image_path': image_path})
+    finally:
+        close_thread_db()
+
+def _run_store():
+    """Store the result of each scheduled job, in submission order"""
+    global _pending
+    while True:
+        product_id, image_path, future = _results.get()
+        try:
+            _store_variants(product_id, image_path, future)
+        except Exception as e:
+            print(f"Error storing image variants: {e}")
+        finally:
+            with _executor_lock:
+                _pending -= 1
+
+def _ensure_store_thread():
+    """Start the thread that stores results (again, if this is a forked child)"""
+    global _results, _store_thread, _store_pid
+    with _executor_lock:
+        if _store_thread is not None and _store_thread.is_alive() and _store_pid == os.getpid():
+            return
+        if _store_pid != os.getpid():
+            _results = queue.Queue()  # the parent's futures mean nothing here
+        _store_pid = os.getpid()
+        _store_thread = threading.Thread(target=_run_store, name='image-store', daemon=True)
+        _store_thread.start()
+
+def schedule_image_processing(product_id, image_path):
+    """Process an uploaded image in the background and attach the variants to the product"""
+    global _pending
+    _ensure_store_thread()
+    future = _get_executor().submit(process_image, image_path, Config.UPLOAD_FOLDER)
+    with _executor_lock:
+        _pending += 1
+    _results.put((product_id, image_path, future))
+    return future
@@ -0,0 +1,120 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app import metrics
+from app.models import get_log_overflow_id, get_prunable_logs, delete_logs
+from app.utils.helpers import acquire_process_lock
+
+LOGS_PRUNED = metrics.counter('logs_pruned', 'Log rows deleted by retention', ['reason'])
+
+def archive_logs(rows, directory=None):
+    """Append log rows to the day's NDJSON.gz archive; returns its path"""
+    directory = directory or Config.LOG_ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"logs-{datetime.utcnow():%Y-%m-%d}.ndjson.gz")
+    # Appending adds a gzip member; readers (zcat, gzip.open) see one stream
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            entry = dict(row)
+            if entry.get('context'):
+                try:
+                    entry['context'] = json.loads(entry['context'])
+                except ValueError:
+                    pass
+            archive.write(json.dumps(entry, default=str) + '\n')
+    return path
+
+class LogPruner:
+    """Background job enforcing LOG_RETENTION_DAYS and LOG_MAX_ROWS.
+
+    Rows are deleted oldest first in transactions of LOG_PRUNE_BATCH rows
+    with a short pause in between, so the log writer and request threads
+    never wait long for the write lock. With LOG_ARCHIVE_DIR set, each
+    batch is appended to a compressed NDJSON file before it is deleted.
+    Only one process per data directory prunes (file lock next to the
+    database).
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the pruning thread; False if another process already runs it"""
+        with self._lock:
+            if self._thread is not None:
+                return True
+            self._lock_file = acquire_process_lock('log_prune.lock')
+            if self._lock_file is None:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='log-pruner', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    log_message('error', f'Log pruning failed: {str(e)}')
+                self._stop.wait(Config.LOG_PRUNE_INTERVAL)
+        finally:
+            close_thread_db()
+
+    def _prune(self, reason, cutoff=None, max_id=None):
+        pruned = 0
+        while not self._stop.is_set():
+            rows = get_prunable_logs(Config.LOG_PRUNE_BATCH, cutoff=cutoff, max_id=max_id)
+            if not rows:
+                break
+            if Config.LOG_ARCHIVE_DIR:
+                archive_logs(rows)
+            delete_logs([row['id'] for row in rows])
+            pruned += len(rows)
+            LOGS_PRUNED.inc(len(rows), reason=reason)
+            if len(rows) < Config.LOG_PRUNE_BATCH:
+                break
+            time.sleep(Config.LOG_PRUNE_PAUSE)
+        return pruned
+
+    def run_once(self):
+        """
+        Delete (and archive) log rows outside the retention limits
+
+        Returns:
+            dict with the number of rows pruned for 'age' and 'rows'
+        """
+        summary = {'age': 0, 'rows': 0}
+        if Config.LOG_RETENTION_DAYS:
+            cutoff = (datetime.utcnow() - timedelta(days=Config.LOG_RETENTION_DAYS)).isoformat()
+            summary['age'] = self._prune('age', cutoff=cutoff)
+        if Config.LOG_MAX_ROWS:
+            max_id = get_log_overflow_id(Config.LOG_MAX_ROWS)
+            if max_id is not None:
+                summary['rows'] = self._prune('rows', max_id=max_id)
+        if summary['age'] or summary['rows']:
+            log_message('info', 'Pruned logs', dict(summary, archived=bool(Config.LOG_ARCHIVE_DIR)))
+        return summary
+
+log_pruner = LogPruner()
+atexit.register(log_pruner.stop)
@@ -0,0 +1,180 @@
+import time
+import random
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app import metrics
+from app.utils.helpers import acquire_process_lock
+from app.models import (
+    get_due_monitor_products, update_monitor_schedule, update_product, get_monitor_summary
+)
+from app.services.scraper import (
+    scrape_product_metadata, product_updates_from_scrape, get_session, request_budget
+)
+
+# Fields whose change counts as a stock/price change (history is recorded
+# by the products_history_update trigger)
+TRACKED_FIELDS = ('price', 'stock_status', 'options')
+
+def next_interval(interval, changed, stock_status, failures=0):
+    """
+    Adaptive polling interval in seconds
+
+    Products that just changed are polled twice as often, unchanged ones
+    back off by MONITOR_BACKOFF, partially stocked ones are capped at
+    MONITOR_PARTIAL_INTERVAL and failing ones back off exponentially.
+    """
+    if failures:
+        interval = interval * 2
+    elif changed:
+        interval = interval / 2
+    else:
+        interval = interval * Config.MONITOR_BACKOFF
+    if stock_status == 'partial' and not failures:
+        interval = min(interval, Config.MONITOR_PARTIAL_INTERVAL)
+    return max(Config.MONITOR_MIN_INTERVAL, min(Config.MONITOR_MAX_INTERVAL, interval))
+
+def _changed_fields(product, updates):
+    return [f for f in TRACKED_FIELDS if f in updates and updates[f] != product.get(f)]
+
+class ProductMonitor:
+    """Background scheduler that re-scrapes products when they are due.
+
+    Each pass picks the most overdue products, limited by MONITOR_BATCH_SIZE
+    and by MONITOR_BUDGET_SHARE of the scraper's request budget, so manual
+    and bulk scrapes are never starved. Only one process per data directory
+    runs the scheduler (file lock next to the database).
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._passes = 0
+        self._checked = 0
+        self._changed = 0
+        self._failed = 0
+        self._last_pass_at = None
+
+    def start(self):
+        """Start the scheduler thread; False if another process already runs it"""
+        with self._lock:
+            if self._thread is not None:
+                return True
+            self._lock_file = acquire_process_lock('monitor.lock')
+            if self._lock_file is None:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='product-monitor', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    log_message('error', f'Product monitor pass failed: {str(e)}')
+                self._stop.wait(Config.MONITOR_TICK)
+        finally:
+            close_thread_db()
+
+    def _check(self, product):
+        try:
+            result = scrape_product_metadata(product['product_url'], session=get_session())
+            if 'error' in result:
+                return product, {}, None, result['error']
+            updates = product_updates_from_scrape(result)
+            if any(updates[f] != product.get(f) for f in updates):
+                update_product(product['id'], **updates)
+            return product, updates, _changed_fields(product, updates), None
+        finally:
+            close_thread_db()
+
+    def run_once(self, limit=None):
+        """
+        Check the products that are due now
+
+        Returns:
+            dict with 'checked', 'changed', 'failed' counts
+        """
+        now = time.time()
+        limit = limit or Config.MONITOR_BATCH_SIZE
+        if request_budget.per_minute:
+            # Our share of the request budget for one tick; fetches are paced by the budget
+            share = request_budget.per_minute * Config.MONITOR_BUDGET_SHARE * Config.MONITOR_TICK / 60
+            limit = min(limit, max(int(share), 1))
+        products = get_due_monitor_products(now, limit, Config.MONITOR_DEFAULT_INTERVAL)
+        summary = {'checked': 0, 'changed': 0, 'failed': 0}
+        if not products:
+            return summary
+
+        schedule = []
+        with ThreadPoolExecutor(max_workers=Config.MONITOR_CONCURRENCY,
+                                thread_name_prefix='monitor') as pool:
+            for product, updates, changed, error in pool.map(self._check, products):
+                failures = product['failures'] + 1 if error else 0
+                stock_status = updates.get('stock_status', product['stock_status'])
+                if error:
+                    summary['failed'] += 1
+                else:
+                    summary['checked'] += 1
+                    if changed:
+                        summary['changed'] += 1
+                        log_message('info', 'Product changed', {
+                            'product_id': product['id'], 'fields': changed
+                        })
+                interval = next_interval(product['interval_seconds'], bool(changed), stock_status, failures)
+                checked_at = time.time()
+                schedule.append({
+                    'product_id': product['id'],
+                    'interval_seconds': interval,
+                    'next_check_at': checked_at + interval * random.uniform(0.9, 1.1),
+                    'checked_at': checked_at,
+                    'changed': bool(changed),
+                    'failures': failures
+                })
+        update_monitor_schedule(schedule)
+
+        with self._lock:
+            self._passes += 1
+            self._checked += summary['checked']
+            self._changed += summary['changed']
+            self._failed += summary['failed']
+            self._last_pass_at = now
+        return summary
+
+    def metrics(self):
+        """Scheduler counters plus the current schedule state"""
+        with self._lock:
+            metrics = {
+                'running': self._thread is not None,
+                'passes': self._passes,
+                'checked': self._checked,
+                'changed': self._changed,
+                'failed': self._failed,
+                'last_pass_at': self._last_pass_at
+            }
+        metrics.update(get_monitor_summary(time.time()))
+        metrics['request_budget_available'] = request_budget.available()
+        return metrics
+
+monitor = ProductMonitor()
+atexit.register(monitor.stop)
+
+metrics.gauge_callback('monitor_products_due', 'Monitored products due for a check',
+                       lambda: get_monitor_summary(time.time())['due'] or 0)
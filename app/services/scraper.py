@@ -1,130 +1,479 @@
 import requests
-from bs4 import BeautifulSoup
+import re
+import os
+import gzip
 import json
+import time
+import hashlib
+import importlib.util
+import threading
+from requests.adapters import HTTPAdapter
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
 from app.config import Config
 from app.database import log_message
+from app import metrics
+from app.models import get_scrape_cache_entry, save_scrape_cache_entry
 
-def scrape_product_metadata(product_url):
+try:
+    import fcntl
+except ImportError:  # Windows: the budget is per process
+    fcntl = None
+
+# Bump whenever parse_product_page changes what it extracts, so cached parse
+# results are recomputed (from the on-disk HTML cache when possible).
+PARSER_VERSION = 2
+
+# lxml builds the tree several times faster than the pure-Python parser
+PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+PRICE_PATTERN = re.compile(r'[\d,]+\.?\d*')
+
+# Selectors in priority order; the first group member with a match wins
+PRICE_SELECTORS = [
+    '.price', '.product-price', '[class*="price"]',
+    '.current-price', '.special-price'
+]
+NAME_SELECTORS = ['h1', '.product-name', '[class*="product-title"]']
+OPTION_SELECT_SELECTORS = [
+    'select[name*="option"]',
+    'select[name*="strength"]',
+    'select[name*="nicotine"]',
+    '.product-options select',
+    '[class*="option"] select'
+]
+OPTION_BUTTON_SELECTORS = ['[class*="option"]', '[data-option]', '[data-strength]']
+STOCK_SELECTORS = ['[class*="stock"]', '[class*="availability"]']
+
+FIRST_MATCH_SELECTORS = [
+    ((group, index), soupsieve.compile(selector))
+    for group, selectors in (
+        ('price', PRICE_SELECTORS),
+        ('name', NAME_SELECTORS),
+        ('option_select', OPTION_SELECT_SELECTORS)
+    )
+    for index, selector in enumerate(selectors)
+]
+OPTION_BUTTON_SELECTOR = soupsieve.compile(', '.join(OPTION_BUTTON_SELECTORS))
+STOCK_SELECTOR = soupsieve.compile(', '.join(STOCK_SELECTORS))
+CANDIDATE_SELECTOR = soupsieve.compile(', '.join(
+    PRICE_SELECTORS + NAME_SELECTORS + OPTION_SELECT_SELECTORS
+    + OPTION_BUTTON_SELECTORS + STOCK_SELECTORS
+))
+
+FETCH_SECONDS = metrics.histogram('scraper_fetch_duration_seconds', 'Product page HTTP requests')
+FETCH_RESPONSES = metrics.counter('scraper_responses', 'Product page responses by HTTP status', ['status'])
+PARSE_SECONDS = metrics.histogram('scraper_parse_duration_seconds', 'parse_product_page runs')
+SCRAPE_RESULTS = metrics.counter('scraper_results', 'Scrapes by cache outcome', ['cache'])
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared keep-alive session so repeated scrapes reuse TCP/TLS connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.SCRAPE_CONCURRENCY)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+class RequestBudget:
+    """Token bucket: at most ``per_minute`` requests to dampfi.ch, ``burst`` at once
+
+    The bucket is kept in a small file next to the database and updated
+    under an exclusive flock, so every process (gunicorn workers, the
+    checkout worker, scripts) draws from the same budget.
     """
-    Scrape product metadata from dampfi.ch
-    Returns: dict with price, stock_status, options
+
+    def __init__(self, per_minute=None, burst=None, path=None):
+        self.per_minute = Config.SCRAPE_REQUESTS_PER_MINUTE if per_minute is None else per_minute
+        self.burst = burst or Config.SCRAPE_REQUEST_BURST
+        self.path = path
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _state_path(self):
+        return self.path or os.path.join(
+            os.path.dirname(os.path.abspath(Config.DATABASE_PATH)), 'scrape_budget.json'
+        )
+
+    def _update(self, take):
+        """
+        Refill the bucket and, with take, take one token from it
+
+        Returns:
+            tuple (taken, tokens left)
+        """
+        with self._lock:
+            state_file = None
+            if fcntl is not None:
+                path = self._state_path()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                state_file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+')
+            try:
+                if state_file is not None:
+                    fcntl.flock(state_file, fcntl.LOCK_EX)
+                    try:
+                        state = json.load(state_file)
+                        self._tokens, self._updated = float(state['tokens']), float(state['updated'])
+                    except (ValueError, KeyError, TypeError):
+                        pass  # new file: start with a full bucket
+                now = time.time()
+                elapsed = max(now - self._updated, 0)
+                self._tokens = min(self.burst, self._tokens + elapsed * self.per_minute / 60)
+                self._updated = now
+                taken = take and self._tokens >= 1
+                if taken:
+                    self._tokens -= 1
+                if state_file is not None:
+                    state_file.seek(0)
+                    state_file.truncate()
+                    json.dump({'tokens': self._tokens, 'updated': self._updated}, state_file)
+                return taken, self._tokens
+            finally:
+                if state_file is not None:
+                    state_file.close()  # releases the flock
+
+    def available(self):
+        """Whole requests that can be made right now without waiting"""
+        if not self.per_minute:
+            return self.burst
+        return int(self._update(take=False)[1])
+
+    def acquire(self):
+        """Take one request from the budget, waiting for it if necessary"""
+        if not self.per_minute:
+            return
+        while True:
+            taken, tokens = self._update(take=True)
+            if taken:
+                return
+            time.sleep((1 - tokens) * 60 / self.per_minute)
+
+request_budget = RequestBudget()
+
+metrics.gauge_callback('scraper_budget_available', 'Requests to dampfi.ch available without waiting',
+                       request_budget.available)
+
+class HtmlCache:
+    """
+    Gzipped raw HTML on disk, keyed by URL
+
+    Entries expire after ``ttl`` seconds. When the cache grows past
+    ``max_bytes`` the least recently written files are evicted.
+    """
+
+    def __init__(self, directory=None, ttl=None, max_bytes=None):
+        self.directory = directory or Config.SCRAPE_CACHE_DIR
+        self.ttl = Config.SCRAPE_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = Config.SCRAPE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.html.gz')
+
+    def get(self, url):
+        """Cached HTML for url, or None if missing or expired"""
+        path = self._path(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self._remove(path)
+                return None
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def put(self, url, content):
+        """Store HTML for url"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with gzip.open(tmp_path, 'wb', compresslevel=5) as f:
+                f.write(content)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._grow(os.path.getsize(path) - old_size)
+        except OSError as e:
+            print(f"Error writing HTML cache: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _files(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return [e for e in entries if e.name.endswith('.html.gz')]
+        except OSError:
+            return []
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._grow(-size)
+        except OSError:
+            pass
+
+    def _grow(self, delta):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(e.stat().st_size for e in self._files())
+            else:
+                self._size += delta
+            if self._size <= self.max_bytes:
+                return
+            # Evict oldest entries down to 90% of the limit
+            entries = sorted(self._files(), key=lambda e: e.stat().st_mtime)
+            target = self.max_bytes * 0.9
+            for entry in entries:
+                if self._size <= target:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    self._size -= size
+                except OSError:
+                    pass
+
+html_cache = HtmlCache()
+
+def _content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+def _parse_and_store(product_url, content, etag, last_modified):
+    with PARSE_SECONDS.time():
+        result = parse_product_page(content)
+    save_scrape_cache_entry(product_url, etag, last_modified, _content_hash(content),
+                            PARSER_VERSION, result)
+    return result
+
+def fetch_product_metadata(product_url, session=None):
     """
+    Fetch and parse a product page, avoiding work wherever possible
+
+    - a stored result from an older parser version is re-parsed from the
+      on-disk HTML cache without touching the network
+    - otherwise the request carries If-None-Match / If-Modified-Since and a
+      304 reuses the stored result
+    - a 200 whose body hashes to the stored content hash is not re-parsed
+
+    Returns: (result dict, cache status) where cache status is one of
+    'not_modified', 'unchanged', 'reparsed' or 'miss'
+    """
+    entry = get_scrape_cache_entry(product_url)
+    reusable = entry is not None and entry['parser_version'] == PARSER_VERSION and entry['result'] is not None
+    
+    if entry is not None and not reusable:
+        content = html_cache.get(product_url)
+        if content is not None and _content_hash(content) == entry['content_hash']:
+            result = _parse_and_store(product_url, content, entry['etag'], entry['last_modified'])
+            return result, 'reparsed'
+    
+    headers = {}
+    if reusable:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    
+    request_budget.acquire()
+    started = time.perf_counter()
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(product_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract price
-        price = None
-        price_selectors = [
-            '.price', '.product-price', '[class*="price"]',
-            '.current-price', '.special-price'
-        ]
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                # Extract numeric value
-                import re
-                price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', '.'))
-                if price_match:
-                    try:
-                        price = float(price_match.group().replace(',', '.'))
-                        break
-                    except:
-                        pass
-        
-        # Extract product name
-        name = None
-        name_selectors = ['h1', '.product-name', '[class*="product-title"]']
-        for selector in name_selectors:
-            name_elem = soup.select_one(selector)
-            if name_elem:
-                name = name_elem.get_text(strip=True)
+        response = (session or get_session()).get(product_url, headers=headers, timeout=10)
+    except requests.RequestException:
+        FETCH_RESPONSES.inc(status='error')
+        raise
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - started)
+    FETCH_RESPONSES.inc(status=response.status_code)
+    if response.status_code == 304 and reusable:
+        save_scrape_cache_entry(product_url, entry['etag'], entry['last_modified'],
+                                entry['content_hash'], PARSER_VERSION, entry['result'])
+        return entry['result'], 'not_modified'
+    response.raise_for_status()
+    
+    content = response.content
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    html_cache.put(product_url, content)
+    
+    if reusable and _content_hash(content) == entry['content_hash']:
+        save_scrape_cache_entry(product_url, etag, last_modified, entry['content_hash'],
+                                PARSER_VERSION, entry['result'])
+        return entry['result'], 'unchanged'
+    
+    return _parse_and_store(product_url, content, etag, last_modified), 'miss'
+
+def _product_block(name, attrs):
+    """SoupStrainer filter: only build the tree for the main content block"""
+    return name == 'main' or attrs.get('id') == 'maincontent'
+
+def _product_root(content):
+    """Parse only the product block, or the whole page if there isn't one"""
+    soup = BeautifulSoup(content, PARSER, parse_only=SoupStrainer(_product_block))
+    if soup.find(True) is None:
+        soup = BeautifulSoup(content, PARSER)
+    return soup
+
+def _parse_price(text):
+    price_match = PRICE_PATTERN.search(text.replace(',', '.'))
+    if price_match:
+        try:
+            return float(price_match.group().replace(',', '.'))
+        except ValueError:
+            pass
+    return None
+
+def parse_product_page(content):
+    """
+    Parse a dampfi.ch product page
+    Returns: dict with name, price, stock_status, options
+    """
+    root = _product_root(content)
+    
+    # One traversal collects every element any selector cares about, in
+    # document order; selector priority is then resolved per group.
+    first_match = {}
+    option_buttons = []
+    stock_indicators = []
+    for elem in CANDIDATE_SELECTOR.select(root):
+        for key, selector in FIRST_MATCH_SELECTORS:
+            if key not in first_match and selector.match(elem):
+                first_match[key] = elem
+        if OPTION_BUTTON_SELECTOR.match(elem):
+            option_buttons.append(elem)
+        if STOCK_SELECTOR.match(elem):
+            stock_indicators.append(elem)
+    
+    # Extract price
+    price = None
+    for index in range(len(PRICE_SELECTORS)):
+        price_elem = first_match.get(('price', index))
+        if price_elem:
+            price = _parse_price(price_elem.get_text(strip=True))
+            if price is not None:
                 break
-        
-        # Extract options (nicotine strengths) and stock status
-        options = []
-        stock_status = 'unknown'
-        
-        # Look for select dropdowns or option buttons
-        option_selectors = [
-            'select[name*="option"]',
-            'select[name*="strength"]',
-            'select[name*="nicotine"]',
-            '.product-options select',
-            '[class*="option"] select'
-        ]
-        
-        for selector in option_selectors:
-            select_elem = soup.select_one(selector)
-            if select_elem:
-                option_tags = select_elem.find_all('option')
-                for opt in option_tags:
-                    if opt.get('value') and opt.get('value') != '':
-                        option_text = opt.get_text(strip=True)
-                        # Check if option is available (not disabled, not "out of stock")
-                        is_available = not opt.get('disabled') and 'out of stock' not in option_text.lower()
-                        options.append({
-                            'value': opt.get('value'),
-                            'label': option_text,
-                            'in_stock': is_available
-                        })
-                if options:
-                    break
-        
-        # If no options found, try to find option buttons/links
-        if not options:
-            option_buttons = soup.select('[class*="option"], [data-option], [data-strength]')
-            for btn in option_buttons:
-                option_text = btn.get_text(strip=True)
-                if option_text:
-                    is_available = 'out of stock' not in option_text.lower() and 'disabled' not in btn.get('class', [])
+    
+    # Extract product name
+    name = None
+    for index in range(len(NAME_SELECTORS)):
+        name_elem = first_match.get(('name', index))
+        if name_elem:
+            name = name_elem.get_text(strip=True)
+            break
+    
+    # Extract options (nicotine strengths) and stock status
+    options = []
+    stock_status = 'unknown'
+    
+    # Look for select dropdowns or option buttons
+    for index in range(len(OPTION_SELECT_SELECTORS)):
+        select_elem = first_match.get(('option_select', index))
+        if select_elem:
+            for opt in select_elem.find_all('option'):
+                if opt.get('value'):
+                    option_text = opt.get_text(strip=True)
+                    # Check if option is available (not disabled, not "out of stock")
+                    is_available = not opt.has_attr('disabled') and 'out of stock' not in option_text.lower()
                     options.append({
-                        'value': btn.get('data-value') or btn.get('data-option') or option_text,
+                        'value': opt.get('value'),
                         'label': option_text,
                         'in_stock': is_available
                     })
-        
-        # Determine overall stock status
-        if options:
-            in_stock_count = sum(1 for opt in options if opt.get('in_stock', False))
-            if in_stock_count == 0:
-                stock_status = 'out_of_stock'
-            elif in_stock_count == len(options):
-                stock_status = 'in_stock'
-            else:
-                stock_status = 'partial'
+            if options:
+                break
+    
+    # If no options found, try to find option buttons/links
+    if not options:
+        for btn in option_buttons:
+            option_text = btn.get_text(strip=True)
+            if option_text:
+                is_available = 'out of stock' not in option_text.lower() and 'disabled' not in btn.get('class', [])
+                options.append({
+                    'value': btn.get('data-value') or btn.get('data-option') or option_text,
+                    'label': option_text,
+                    'in_stock': is_available
+                })
+    
+    # Determine overall stock status
+    if options:
+        in_stock_count = sum(1 for opt in options if opt.get('in_stock', False))
+        if in_stock_count == 0:
+            stock_status = 'out_of_stock'
+        elif in_stock_count == len(options):
+            stock_status = 'in_stock'
         else:
-            # Try to find stock status indicators
-            stock_indicators = soup.select('[class*="stock"], [class*="availability"]')
-            for indicator in stock_indicators:
-                text = indicator.get_text(strip=True).lower()
-                if 'in stock' in text or 'available' in text:
-                    stock_status = 'in_stock'
-                    break
-                elif 'out of stock' in text or 'unavailable' in text:
-                    stock_status = 'out_of_stock'
-                    break
-        
-        result = {
-            'name': name,
-            'price': price,
-            'stock_status': stock_status,
-            'options': options if options else None
-        }
+            stock_status = 'partial'
+    else:
+        # Try to find stock status indicators
+        for indicator in stock_indicators:
+            text = indicator.get_text(strip=True).lower()
+            if 'in stock' in text or 'available' in text:
+                stock_status = 'in_stock'
+                break
+            elif 'out of stock' in text or 'unavailable' in text:
+                stock_status = 'out_of_stock'
+                break
+    
+    result = {
+        'name': name,
+        'price': price,
+        'stock_status': stock_status,
+        'options': options if options else None
+    }
+    return result
+
+def product_updates_from_scrape(result):
+    """Fields of a scrape result that should be written to the product"""
+    updates = {}
+    if result.get('name'):
+        updates['name'] = result['name']
+    if result.get('price') is not None:
+        updates['price'] = result['price']
+    if result.get('stock_status'):
+        updates['stock_status'] = result['stock_status']
+    if result.get('options') is not None:
+        updates['options'] = result['options']
+    return updates
+
+def scrape_product_metadata(product_url, session=None):
+    """
+    Scrape product metadata from dampfi.ch
+    Returns: dict with price, stock_status, options
+    """
+    try:
+        result, cache_status = fetch_product_metadata(product_url, session)
+        SCRAPE_RESULTS.inc(cache=cache_status)
         
-        log_message('info', f'Scraped product metadata', {'url': product_url, 'result': result})
-        return result
+        if cache_status in ('not_modified', 'unchanged'):
+            log_message('debug', 'Product page unchanged', {'url': product_url, 'cache': cache_status})
+        else:
+            log_message('info', 'Scraped product metadata', {
+                'url': product_url, 'name': result.get('name'), 'price': result.get('price'),
+                'stock_status': result.get('stock_status'), 'options': len(result.get('options') or [])
+            })
+        return dict(result, cache=cache_status)
         
     except requests.RequestException as e:
+        SCRAPE_RESULTS.inc(cache='error')
         log_message('error', f'Scraping failed: {str(e)}', {'url': product_url})
         return {'error': f'Failed to fetch product page: {str(e)}'}
     except Exception as e:
+        SCRAPE_RESULTS.inc(cache='error')
         log_message('error', f'Scraping error: {str(e)}', {'url': product_url})
         return {'error': f'Error parsing product page: {str(e)}'}
 
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.config import Config
+from app.database import log_message, close_thread_db
+from app.services.scraper import scrape_product_metadata, get_session
+
+def unavailable_reason(item, scraped):
+    """Why an item cannot be bought according to a fresh scrape, or None"""
+    option_value = item.get('option_value')
+    options = scraped.get('options') or []
+    if option_value and options:
+        option = next((o for o in options if str(o.get('value')) == str(option_value)), None)
+        if option is None:
+            return 'option no longer offered'
+        if not option.get('in_stock'):
+            return f"option {option.get('label') or option_value} is out of stock"
+        return None
+    if scraped.get('stock_status') == 'out_of_stock':
+        return 'out of stock'
+    return None
+
+def _scrape(url):
+    try:
+        return url, scrape_product_metadata(url, session=get_session())
+    finally:
+        close_thread_db()
+
+def check_stock(items, concurrency=None):
+    """
+    Re-scrape every product in a cart concurrently and check the requested options
+
+    Each product page is fetched once, however many options of it are in
+    the cart. Items whose page could not be fetched are kept (the browser
+    checkout still verifies them) and reported as unverified.
+
+    Returns:
+        dict with 'available' (items), 'unavailable' ([{'item', 'reason'}])
+        and 'unverified' (items)
+    """
+    urls = list(dict.fromkeys(item['product_url'] for item in items))
+    workers = max(1, min(len(urls), concurrency or Config.SCRAPE_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stock-check') as pool:
+        scraped = dict(pool.map(_scrape, urls))
+
+    report = {'available': [], 'unavailable': [], 'unverified': []}
+    for item in items:
+        result = scraped[item['product_url']]
+        if 'error' in result:
+            report['available'].append(item)
+            report['unverified'].append(item)
+            continue
+        reason = unavailable_reason(item, result)
+        if reason:
+            report['unavailable'].append({'item': item, 'reason': reason})
+        else:
+            report['available'].append(item)
+
+    log_message('info', 'Pre-checkout stock check', {
+        'items': len(items),
+        'unavailable': len(report['unavailable']),
+        'unverified': len(report['unverified'])
+    })
+    return report
+
+def describe_unavailable(unavailable):
+    """Human-readable list for job results"""
+    parts = []
+    for entry in unavailable:
+        item = entry['item']
+        parts.append(f"{item.get('name') or item['product_url']}: {entry['reason']}")
+    return '; '.join(parts)
@@ -46,27 +46,24 @@ async function displayCheckoutSummary(items, userId) {
     const summaryDiv = document.getElementById('items-summary');
     let total = 0;
     
-    // Fetch product details for display
-    const itemsWithDetails = await Promise.all(items.map(async (item) => {
-        try {
-            // Try to get product details from products list
-            const response = await fetch('/api/products');
-            const data = await response.json();
-            const product = data.products.find(p => p.product_url === item.product_url);
-            
-            return {
-                ...item,
-                product_name: product?.name || 'Unknown Product',
-                price: product?.price || 0
-            };
-        } catch (e) {
-            return {
-                ...item,
-                product_name: 'Unknown Product',
-                price: 0
-            };
-        }
-    }));
+    // Fetch product details for display (once, only the columns we need)
+    let productsByUrl = {};
+    try {
+        const response = await fetch('/api/products?fields=product_url,name,price');
+        const data = await response.json();
+        data.products.forEach(p => { productsByUrl[p.product_url] = p; });
+    } catch (e) {
+        console.error('Error loading products:', e);
+    }
+    
+    const itemsWithDetails = items.map(item => {
+        const product = productsByUrl[item.product_url];
+        return {
+            ...item,
+            product_name: product?.name || 'Unknown Product',
+            price: product?.price || 0
+        };
+    });
     
     summaryDiv.innerHTML = '';
     
@@ -122,21 +119,39 @@ async function handleCheckout() {
     progressMessage.textContent = 'Adding items to cart...';
     
     try {
+        const submissionKey = getSubmissionKey(userId, items);
+        
         const response = await fetch('/api/checkout/confirm', {
             method: 'POST',
-            headers: {'Content-Type': 'application/json'},
+            headers: {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': submissionKey
+            },
             body: JSON.stringify({
                 user_id: parseInt(userId),
                 items: items
             })
         });
         
-        const data = await response.json();
+        const submitted = await response.json();
+        if (!response.ok) {
+            progressModal.style.display = 'none';
+            alert('Checkout failed: ' + (submitted.message || submitted.error || 'Unknown error'));
+            confirmBtn.disabled = false;
+            return;
+        }
+        
+        const job = await pollCheckoutJob(submitted.status_url, progressMessage);
+        const data = job.result || {};
         
         progressModal.style.display = 'none';
+        sessionStorage.removeItem('checkout_submission_key');
         
         if (data.success) {
-            alert(`Order placed successfully!\n\nTotal: CHF ${data.total_price?.toFixed(2) || 'N/A'}\n${data.confirmation_data?.order_number ? 'Order #: ' + data.confirmation_data.order_number : ''}`);
+            const removed = (data.removed_items || [])
+                .map(entry => `\n- ${entry.item.name || entry.item.product_url}: ${entry.reason}`)
+                .join('');
+            alert(`Order placed successfully!\n\nTotal: CHF ${data.total_price?.toFixed(2) || 'N/A'}\n${data.confirmation_data?.order_number ? 'Order #: ' + data.confirmation_data.order_number : ''}${removed ? '\n\nRemoved (unavailable):' + removed : ''}`);
             
             // Clear session storage
             sessionStorage.removeItem('checkout_items');
@@ -155,5 +170,46 @@ async function handleCheckout() {
     }
 }
 
+// One key per checkout attempt, reused on retries (also after a reload) so
+// the server never places the same order twice. It is tied to the user and
+// cart it was made for; a different cart gets a new key.
+function getSubmissionKey(userId, items) {
+    const cart = JSON.stringify([userId, items]);
+    try {
+        const stored = JSON.parse(sessionStorage.getItem('checkout_submission_key'));
+        if (stored && stored.cart === cart) {
+            return stored.key;
+        }
+    } catch (e) {
+        // Unreadable entry (older format): start a new attempt
+    }
+    const key = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`);
+    sessionStorage.setItem('checkout_submission_key', JSON.stringify({key, cart}));
+    return key;
+}
+
+const CHECKOUT_POLL_TIMEOUT = 10 * 60 * 1000;  // ms; jobs may wait behind others of the account
+
+async function pollCheckoutJob(statusUrl, progressMessage) {
+    const deadline = Date.now() + CHECKOUT_POLL_TIMEOUT;
+    while (true) {
+        if (Date.now() > deadline) {
+            throw new Error('Checkout is still not finished. Check your orders on dampfi.ch before trying again.');
+        }
+        const response = await fetch(statusUrl);
+        if (response.ok) {
+            const data = await response.json();
+            const job = data.job;
+            if (job.progress) {
+                progressMessage.textContent = job.progress + '...';
+            }
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, 1500));
+    }
+}
+
 
 
@@ -6,11 +6,16 @@ document.addEventListener('DOMContentLoaded', () => {
     loadSelection();
     updateSelectionUI();
     
-    // Add to selection buttons
-    document.querySelectorAll('.add-to-selection').forEach(btn => {
-        btn.addEventListener('click', handleAddToSelection);
+    // Add to selection buttons (delegated so lazily loaded cards work too)
+    const grid = document.getElementById('gallery-grid');
+    grid?.addEventListener('click', (e) => {
+        if (e.target.classList.contains('add-to-selection')) {
+            handleAddToSelection(e);
+        }
     });
     
+    initLazyLoading();
+    
     // Review selection button
     const reviewBtn = document.getElementById('review-selection');
     if (reviewBtn) {
@@ -30,6 +35,164 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// Lazy loading of further gallery pages
+let loadingPage = false;
+
+function initLazyLoading() {
+    const grid = document.getElementById('gallery-grid');
+    const sentinel = document.getElementById('gallery-sentinel');
+    if (!grid || !sentinel || !grid.dataset.nextCursor) {
+        return;
+    }
+    
+    if (!('IntersectionObserver' in window)) {
+        loadAllPages();
+        return;
+    }
+    
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries.some(entry => entry.isIntersecting)) {
+            return;
+        }
+        await loadNextPage();
+        observer.unobserve(sentinel);
+        if (grid.dataset.nextCursor) {
+            // Re-observing fires again if the sentinel is still in view
+            observer.observe(sentinel);
+        }
+    }, {rootMargin: '600px'});
+    observer.observe(sentinel);
+}
+
+async function loadAllPages() {
+    const grid = document.getElementById('gallery-grid');
+    while (grid.dataset.nextCursor) {
+        if (!await loadNextPage()) {
+            break;
+        }
+    }
+}
+
+async function loadNextPage() {
+    const grid = document.getElementById('gallery-grid');
+    const cursor = grid.dataset.nextCursor;
+    if (loadingPage || !cursor) {
+        return false;
+    }
+    loadingPage = true;
+    
+    try {
+        const params = new URLSearchParams({
+            cursor: cursor,
+            limit: grid.dataset.pageSize,
+            fields: grid.dataset.fields
+        });
+        const response = await fetch(`/api/products?${params}`);
+        const data = await response.json();
+        
+        grid.querySelector('.empty-state')?.remove();
+        grid.insertAdjacentHTML('beforeend', data.products.map(renderProductCard).join(''));
+        grid.dataset.nextCursor = data.next_cursor || '';
+        return true;
+    } catch (e) {
+        console.error('Error loading products:', e);
+        return false;
+    } finally {
+        loadingPage = false;
+    }
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value ?? '';
+    return div.innerHTML.replace(/"/g, '&quot;');
+}
+
+const IMAGE_MIME_TYPES = {avif: 'image/avif', webp: 'image/webp'};
+const IMAGE_SIZES_ATTR = '(max-width: 600px) 100vw, 320px';
+
+function uploadUrl(filename) {
+    return `/uploads/${encodeURIComponent(filename)}`;
+}
+
+// Mirrors the product_picture macro in _macros.html
+function renderProductImage(product) {
+    const original = uploadUrl(product.image_path.split('/').pop());
+    const alt = escapeHtml(product.name);
+    const variants = product.image_variants;
+    if (!variants) {
+        return `<img src="${original}" alt="${alt}" class="product-image" loading="lazy">`;
+    }
+    
+    const sizes = Object.values(variants.sizes).sort((a, b) => a.width - b.width);
+    const srcset = format => sizes
+        .filter(entry => entry[format])
+        .map(entry => `${uploadUrl(entry[format])} ${entry.width}w`);
+    
+    const sources = Object.entries(IMAGE_MIME_TYPES)
+        .filter(([format]) => srcset(format).length)
+        .map(([format, type]) =>
+            `<source type="${type}" srcset="${srcset(format).join(', ')}" sizes="${IMAGE_SIZES_ATTR}">`)
+        .join('');
+    const jpeg = srcset('jpeg').concat(`${original} ${variants.width}w`);
+    const medium = variants.sizes.medium;
+    const src = medium && medium.jpeg ? uploadUrl(medium.jpeg) : original;
+    
+    return `<picture>${sources}<img src="${src}" srcset="${jpeg.join(', ')}" sizes="${IMAGE_SIZES_ATTR}" alt="${alt}" class="product-image" loading="lazy"></picture>`;
+}
+
+// Mirrors the product card markup in gallery.html
+function renderProductCard(product) {
+    const outOfStock = product.stock_status === 'out_of_stock';
+    const options = (product.options || []).map(option => `
+                                <option value="${escapeHtml(option.value)}" 
+                                        ${option.in_stock ? '' : 'disabled'}
+                                        data-in-stock="${option.in_stock ? 'true' : 'false'}">
+                                    ${escapeHtml(option.label)}${option.in_stock ? '' : ' (Out of Stock)'}
+                                </option>`).join('');
+    
+    return `
+            <div class="product-card" data-product-id="${product.id}" 
+                 data-product-url="${escapeHtml(product.product_url)}"
+                 ${outOfStock ? 'data-out-of-stock="true"' : ''}>
+                
+                ${outOfStock ? '' : '<div class="availability-badge">✓</div>'}
+                
+                <div class="product-image-container">
+                    ${product.image_path
+                        ? renderProductImage(product)
+                        : '<div class="product-image-placeholder">No Image</div>'}
+                </div>
+                
+                <div class="product-info">
+                    <h3 class="product-name">${escapeHtml(product.name)}</h3>
+                    <div class="product-price">
+                        ${product.price ? `CHF ${product.price.toFixed(2)}` : 'Price unknown'}
+                    </div>
+                    
+                    <div class="product-options">
+                        <label for="option-${product.id}">Option:</label>
+                        <select id="option-${product.id}" class="option-select" data-product-id="${product.id}">
+                            <option value="">Select option...</option>${options}
+                        </select>
+                    </div>
+                    
+                    <div class="product-quantity">
+                        <label for="qty-${product.id}">Quantity:</label>
+                        <input type="number" id="qty-${product.id}" 
+                               class="quantity-input" 
+                               min="1" max="5" 
+                               value="1"
+                               data-product-id="${product.id}">
+                    </div>
+                    
+                    <button class="btn btn-small add-to-selection" data-product-id="${product.id}">
+                        Add to Selection
+                    </button>
+                </div>
+            </div>`;
+}
+
 function handleAddToSelection(e) {
     const productId = parseInt(e.target.dataset.productId);
     const productCard = e.target.closest('.product-card');
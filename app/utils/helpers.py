@@ -1,32 +1,90 @@
 import os
+import base64
+import hashlib
+from cryptography.fernet import Fernet, InvalidToken
 from werkzeug.utils import secure_filename
 from app.config import Config
 from app.utils.validators import allowed_file
+from app.utils.uploads import HashingFile
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process guard
+    fcntl = None
 
 def save_uploaded_file(file, product_id=None):
-    """Save uploaded file and return the path"""
+    """Save uploaded file under its content hash and return the path
+
+    Identical uploads map to the same file, so it is written only once.
+    """
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add product ID prefix if provided
-        if product_id:
-            name, ext = os.path.splitext(filename)
-            filename = f"{product_id}_{name}{ext}"
+        ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+        stream = file.stream
+        if not isinstance(stream, HashingFile):
+            stream = HashingFile.from_stream(stream)
         
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        return filepath
+        filepath = os.path.join(Config.UPLOAD_FOLDER, f"{stream.hexdigest()}{ext}")
+        return stream.commit(filepath)
     return None
 
-def delete_image_file(image_path):
-    """Delete an image file"""
+def delete_image_file(image_path, variants=None):
+    """Delete an image file and its derived variants"""
+    from app.services.images import variant_filenames
+    
     if image_path and os.path.exists(image_path):
         try:
             os.remove(image_path)
+            for filename in variant_filenames(variants):
+                path = os.path.join(Config.UPLOAD_FOLDER, filename)
+                if os.path.exists(path):
+                    os.remove(path)
             return True
         except Exception as e:
             print(f"Error deleting image: {e}")
             return False
     return False
 
+def percentile(values, pct):
+    """Nearest-rank percentile (0-100) of a list of numbers; None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))  # ceil without floats
+    return ordered[int(rank) - 1]
+
+def acquire_process_lock(name):
+    """
+    Take an exclusive, non-blocking lock file next to the database
+
+    Used by background jobs that must run in only one process per data
+    directory. Returns the open lock file (keep it open to hold the lock,
+    close it to release), or None if another process holds the lock.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(Config.DATABASE_PATH)), name)
+    lock_file = open(path, 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+    return lock_file
+
+def _fernet():
+    """Fernet cipher keyed from the app SECRET_KEY"""
+    key = hashlib.sha256(Config.SECRET_KEY.encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def encrypt_data(data):
+    """Encrypt a string for storage"""
+    return _fernet().encrypt(data.encode('utf-8'))
+
+def decrypt_data(token):
+    """Decrypt data from encrypt_data; returns None if it can't be decrypted"""
+    try:
+        return _fernet().decrypt(token).decode('utf-8')
+    except (InvalidToken, TypeError, ValueError):
+        return None
+
 
 
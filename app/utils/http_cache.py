@@ -0,0 +1,101 @@
+import os
+import gzip
+import hashlib
+from flask import request, make_response
+from app.config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'application/javascript', 'text/javascript'
+}
+
+# Compressed bodies get their own strong ETag: "<etag>-gz" / "<etag>-br"
+ENCODING_SUFFIXES = {'gzip': '-gz', 'br': '-br'}
+
+# Files whose changes alter responses (code, templates, static assets)
+BUILD_FILE_TYPES = ('.py', '.html', '.js', '.css')
+
+def _build_id():
+    """
+    Identify the deployed code: Config.BUILD_ID, or a digest of the names,
+    sizes and mtimes of the app's files (the same in every worker)
+    """
+    if Config.BUILD_ID:
+        return Config.BUILD_ID
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        for name in sorted(filenames):
+            if name.endswith(BUILD_FILE_TYPES):
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                digest.update(f'{os.path.relpath(path, root)}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+BUILD_ID = _build_id()
+
+def catalog_etag(version, *parts):
+    """Strong ETag for a view of the catalog at a given version (and build)"""
+    key = '|'.join([BUILD_ID, str(version)] + [str(p) for p in parts])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def is_not_modified(etag):
+    """True if the request's If-None-Match matches etag (in any encoding)"""
+    candidates = [etag] + [etag + suffix for suffix in ENCODING_SUFFIXES.values()]
+    return any(request.if_none_match.contains(c) for c in candidates)
+
+def not_modified_response(etag):
+    """Empty 304 carrying the validator, without building the body"""
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def version_static_urls(endpoint, values):
+    """url_defaults hook: ?v=<build> on static URLs, so cached assets change with a deploy"""
+    if endpoint == 'static':
+        values.setdefault('v', BUILD_ID)
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    """after_request hook: gzip/brotli large text responses"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    
+    if response.content_length is not None and response.content_length < Config.COMPRESS_MIN_SIZE:
+        return response
+    encoding = _choose_encoding()
+    if not encoding:
+        return response
+    
+    data = response.get_data()
+    if len(data) < Config.COMPRESS_MIN_SIZE:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=Config.COMPRESS_LEVEL_BR)
+    else:
+        data = gzip.compress(data, compresslevel=Config.COMPRESS_LEVEL_GZIP)
+    
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ENCODING_SUFFIXES[encoding], weak=weak)
+    return response
@@ -0,0 +1,72 @@
+import os
+import hashlib
+import tempfile
+from flask import Request
+from app.config import Config
+
+CHUNK_SIZE = 64 * 1024
+
+class HashingFile:
+    """Temp file in the upload folder that hashes bytes as they are written.
+
+    Werkzeug streams each multipart file part into this object chunk by
+    chunk, so an upload is never held in memory; ``commit()`` then moves it
+    to its content-addressed name with an atomic rename (same directory,
+    same filesystem). Uncommitted files are removed on close.
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or Config.UPLOAD_FOLDER
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def commit(self, path):
+        """Move the upload to path; an identical file already there is kept"""
+        self._file.flush()
+        if os.path.exists(path):
+            self.close()
+        else:
+            self._file.close()
+            # mkstemp creates 0600; uploads are served by the web server
+            os.chmod(self._file.name, 0o644)
+            os.replace(self._file.name, path)
+        return path
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush/... for werkzeug and FileStorage
+        return getattr(self._file, name)
+
+    @classmethod
+    def from_stream(cls, stream, directory=None):
+        """Copy a readable stream in chunks (uploads not parsed by UploadRequest)"""
+        hashing_file = cls(directory)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hashing_file.write(chunk)
+        return hashing_file
+
+class UploadRequest(Request):
+    """Request class that spools file uploads straight into HashingFile"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile()
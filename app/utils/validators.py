@@ -1,4 +1,4 @@
-import re
+import math
 from urllib.parse import urlparse
 from app.config import Config
 
@@ -19,6 +19,21 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+def product_fields_error(product):
+    """Why a product's name/price/stock_status/options can't be stored, or None"""
+    price = product.get('price')
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))
+                              or not math.isfinite(price)):
+        return 'price must be a number or null'
+    for field in ('name', 'stock_status'):
+        if product.get(field) is not None and not isinstance(product[field], str):
+            return f'{field} must be a string'
+    options = product.get('options')
+    if options is not None and not (isinstance(options, list)
+                                    and all(isinstance(option, dict) for option in options)):
+        return 'options must be a list of objects'
+    return None
+
 def validate_user_id(user_id):
     """Validate user ID is between 1 and 5"""
     try:
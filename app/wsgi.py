@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production servers: gunicorn -c gunicorn.conf.py app.wsgi:app
+
+Background threads are started per worker by gunicorn.conf.py (post_worker_init).
+"""
+from app import create_app
+
+app = create_app(start_services=False)
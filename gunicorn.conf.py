@@ -0,0 +1,96 @@
+"""
+Gunicorn settings for production: gunicorn -c gunicorn.conf.py app.wsgi:app
+
+gthread workers: WEB_WORKERS processes (default CPUs + 1), each serving
+WEB_THREADS requests at a time (default 2 x CPUs, at least 4). Catalog
+requests are short SQLite reads with per-thread connections, so threads
+cover the I/O waits and processes use the cores.
+
+The app is preloaded in the master, so workers fork with it already
+imported and the schema migrated once. Background threads (monitor, log
+pruning, inline checkouts) are started in each worker after the fork.
+
+Graceful reload: `kill -HUP <master pid>` starts new workers and lets the
+old ones finish their requests (graceful_timeout). Because the app is
+preloaded, a code upgrade needs a new master: `kill -USR2 <master pid>`,
+then `kill -QUIT` the old master once the new one serves.
+
+Checkouts take minutes and hold a Chromium instance, so under gunicorn
+CHECKOUT_RUNNER defaults to 'worker': the web workers only queue jobs and
+can be recycled freely, and the master starts scripts/checkout_worker.py
+next to them (set CHECKOUT_WORKER_SPAWN=false when it runs elsewhere, as
+in docker-compose). CHECKOUT_RUNNER=inline needs WEB_WORKERS=1, since
+every worker would get its own browser pool.
+
+A scrape of /metrics reaches an arbitrary worker, so every worker (and the
+checkout worker) writes its metrics to METRICS_DIR, by default next to the
+database, and /metrics serves the sum over all of them.
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('CHECKOUT_RUNNER', 'worker')
+
+from app.config import Config
+from app import metrics
+
+if not Config.METRICS_DIR:
+    # Also inherited by the checkout worker started below
+    os.environ['METRICS_DIR'] = Config.METRICS_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(Config.DATABASE_PATH)), 'metrics'
+    )
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+worker_class = 'gthread'
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
+if Config.CHECKOUT_RUNNER == 'worker':
+    graceful_timeout = 30
+    # Request workers hold no long-running state; recycle them to cap leaks
+    max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+    max_requests_jitter = max_requests // 10
+else:
+    # Inline checkouts run in the web workers; let them finish on reload
+    graceful_timeout = int((Config.PLAYWRIGHT_TIMEOUT + Config.CHECKOUT_ORDER_TIMEOUT) / 1000) + 60
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+if Config.CHECKOUT_RUNNER == 'inline' and workers > 1:
+    raise RuntimeError(
+        f'CHECKOUT_RUNNER=inline with {workers} workers would start {workers} browser pools; '
+        'use CHECKOUT_RUNNER=worker or WEB_WORKERS=1'
+    )
+
+spawn_checkout_worker = (Config.CHECKOUT_RUNNER == 'worker'
+                         and os.environ.get('CHECKOUT_WORKER_SPAWN', 'true').lower() == 'true')
+_checkout_worker = None
+
+def on_starting(server):
+    # Counters start from zero with every server run
+    metrics.clear_multiprocess_dir(Config.METRICS_DIR)
+
+def when_ready(server):
+    global _checkout_worker
+    if spawn_checkout_worker:
+        _checkout_worker = subprocess.Popen([sys.executable, os.path.join(ROOT, 'scripts', 'checkout_worker.py')])
+        server.log.info('Started checkout worker (pid %s)', _checkout_worker.pid)
+
+def on_exit(server):
+    if _checkout_worker is not None and _checkout_worker.poll() is None:
+        # Running checkouts finish first (see scripts/checkout_worker.py)
+        _checkout_worker.terminate()
+        _checkout_worker.wait()
+
+def post_worker_init(worker):
+    from app.wsgi import app
+    from app import start_background_services
+    start_background_services(app)
@@ -1,13 +1,30 @@
 #!/usr/bin/env python3
 """
 Run the Flask application
-"""
-from app import create_app
 
-app = create_app()
+Starts gunicorn with gunicorn.conf.py. With --dev (or FLASK_DEBUG=1), or
+where gunicorn is not available (Windows), the Flask development server
+runs instead.
+"""
+import os
+import sys
+import importlib.util
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+ROOT = os.path.dirname(os.path.abspath(__file__))
 
+def main():
+    dev = '--dev' in sys.argv or os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true')
+    if not dev:
+        if importlib.util.find_spec('gunicorn') is None:
+            print('gunicorn is not installed; using the development server')
+        else:
+            os.execvp(sys.executable, [
+                sys.executable, '-m', 'gunicorn', '--chdir', ROOT,
+                '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app.wsgi:app'
+            ])
 
+    from app import create_app
+    create_app().run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=dev)
 
+if __name__ == '__main__':
+    main()
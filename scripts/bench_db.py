@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark API request latency with per-call vs. per-thread SQLite connections
+
+Simulates gunicorn gthread workers by hitting the API from a thread pool
+through Flask's test client, first with the legacy open/chmod/close get_db()
+and then with the pooled per-thread connections.
+"""
+import sys
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+
+def legacy_get_db():
+    """The original get_db(): makedirs, chmod and a fresh connection per call"""
+    db_path = Config.DATABASE_PATH
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+        try:
+            os.chmod(db_dir, 0o755)
+        except:
+            pass
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        if os.path.exists(db_path):
+            os.chmod(db_path, 0o644)
+    except:
+        pass
+    return conn
+
+def patch_get_db(func):
+    """Point every module that imported get_db at func"""
+    import app.database
+    import app.models
+    import app.routes.api
+    for module in (app.database, app.models, app.routes.api):
+        module.get_db = func
+
+def seed(product_count):
+    """Insert product_count products"""
+    from app.models import create_product
+    for i in range(product_count):
+        create_product(
+            product_url=f'https://www.dampfi.ch/bench-{i}',
+            name=f'Bench Product {i}',
+            price=9.9,
+            stock_status='in_stock',
+            options=[{'value': '3', 'label': '3mg', 'in_stock': True}]
+        )
+
+def run(app, threads, requests_per_thread, product_count):
+    """Fire requests from a thread pool and return per-request latencies (ms)"""
+    client = app.test_client()
+
+    def worker(n):
+        latencies = []
+        for i in range(requests_per_thread):
+            product_id = (n * requests_per_thread + i) % product_count + 1
+            start = time.perf_counter()
+            response = client.get(f'/api/products/{product_id}')
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    latencies = [l for r in results for l in r]
+    return latencies, elapsed
+
+def report(label, latencies, elapsed):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} p50={statistics.median(latencies):7.2f}ms "
+          f"p95={p95:7.2f}ms  {len(latencies) / elapsed:8.1f} req/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        Config.UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+        # The seeded URLs are fake; never let the monitor scrape them
+        Config.MONITOR_ENABLED = False
+
+        from app import create_app
+        import app.database as database
+        pooled_get_db = database.get_db
+
+        app = create_app(start_services=False)
+        seed(args.products)
+
+        patch_get_db(legacy_get_db)
+        report('legacy', *run(app, args.threads, args.requests, args.products))
+
+        patch_get_db(pooled_get_db)
+        report('pooled', *run(app, args.threads, args.requests, args.products))
+
+        # Write queued log records before the temporary database goes away
+        database.flush_logs()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark product creation and bulk import
+
+Times three ways of adding products through the API:
+  legacy  - the original POST /api/products with a full-table duplicate scan
+  single  - POST /api/products relying on the product_url UNIQUE index
+  bulk    - POST /api/products/import, one transaction for all rows
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+
+def legacy_create(url):
+    """The original endpoint logic: scan every product, then insert"""
+    from app.models import get_all_products, create_product
+    for p in get_all_products():
+        if p['product_url'] == url:
+            return None
+    return create_product(product_url=url, name='Bench Product')
+
+def run_legacy(app, urls):
+    with app.app_context():
+        for url in urls:
+            legacy_create(url)
+
+def run_single(app, urls):
+    client = app.test_client()
+    for url in urls:
+        response = client.post('/api/products', json={'product_url': url, 'name': 'Bench Product'})
+        assert response.status_code == 201, response.status_code
+
+def run_bulk(app, urls):
+    client = app.test_client()
+    body = '\n'.join(f'{{"product_url": "{url}", "name": "Bench Product"}}' for url in urls)
+    response = client.post('/api/products/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200 and response.json['summary']['created'] == len(urls), response.json['summary']
+    return response.json['summary']
+
+def timed(label, func, app, urls):
+    start = time.perf_counter()
+    func(app, urls)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<7} {len(urls):>6} products  {elapsed:8.2f}s  {len(urls) / elapsed:9.0f} products/s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark product creation and bulk import')
+    parser.add_argument('--count', type=int, default=10000, help='products for single/bulk')
+    parser.add_argument('--legacy-count', type=int, default=1000,
+                        help='products for the legacy path (quadratic, keep small)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+        # The imported URLs are fake; never let the monitor scrape them
+        Config.MONITOR_ENABLED = False
+        from app import create_app
+
+        for label, func, count in (
+            ('legacy', run_legacy, args.legacy_count),
+            ('single', run_single, args.count),
+            ('bulk', run_bulk, args.count),
+        ):
+            Config.DATABASE_PATH = os.path.join(tmp, f'{label}.db')
+            app = create_app(start_services=False)
+            urls = [f'https://www.dampfi.ch/bench-{label}-{i}' for i in range(count)]
+            timed(label, func, app, urls)
+
+        # Write queued log records before the temporary database goes away
+        from app.database import flush_logs
+        flush_logs()
+
+if __name__ == '__main__':
+    main()
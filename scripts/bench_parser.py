@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark product page parsing
+
+Parses saved product pages (.html or gzipped .html.gz, by default the
+scraper's HTML cache) with the original full-tree parser and with
+parse_product_page, and reports the time per page and any differences in
+the extracted data. Without saved pages a synthetic Magento-style page is
+used.
+"""
+import sys
+import os
+import re
+import gzip
+import time
+import argparse
+import statistics
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from app.config import Config
+from app.services.scraper import parse_product_page, PARSER
+
+def legacy_parse(content):
+    """The original extraction: full html.parser tree, one select per selector"""
+    soup = BeautifulSoup(content, 'html.parser')
+    price = None
+    for selector in ['.price', '.product-price', '[class*="price"]', '.current-price', '.special-price']:
+        price_elem = soup.select_one(selector)
+        if price_elem:
+            price_match = re.search(r'[\d,]+\.?\d*', price_elem.get_text(strip=True).replace(',', '.'))
+            if price_match:
+                try:
+                    price = float(price_match.group().replace(',', '.'))
+                    break
+                except:
+                    pass
+    name = None
+    for selector in ['h1', '.product-name', '[class*="product-title"]']:
+        name_elem = soup.select_one(selector)
+        if name_elem:
+            name = name_elem.get_text(strip=True)
+            break
+    options = []
+    for selector in ['select[name*="option"]', 'select[name*="strength"]', 'select[name*="nicotine"]',
+                     '.product-options select', '[class*="option"] select']:
+        select_elem = soup.select_one(selector)
+        if select_elem:
+            for opt in select_elem.find_all('option'):
+                if opt.get('value'):
+                    text = opt.get_text(strip=True)
+                    options.append({'value': opt.get('value'), 'label': text,
+                                    'in_stock': not opt.get('disabled') and 'out of stock' not in text.lower()})
+            if options:
+                break
+    if not options:
+        for btn in soup.select('[class*="option"], [data-option], [data-strength]'):
+            text = btn.get_text(strip=True)
+            if text:
+                options.append({'value': btn.get('data-value') or btn.get('data-option') or text, 'label': text,
+                                'in_stock': 'out of stock' not in text.lower() and 'disabled' not in btn.get('class', [])})
+    stock_status = 'unknown'
+    if options:
+        in_stock = sum(1 for opt in options if opt['in_stock'])
+        stock_status = 'out_of_stock' if in_stock == 0 else 'in_stock' if in_stock == len(options) else 'partial'
+    else:
+        for indicator in soup.select('[class*="stock"], [class*="availability"]'):
+            text = indicator.get_text(strip=True).lower()
+            if 'in stock' in text or 'available' in text:
+                stock_status = 'in_stock'
+                break
+            elif 'out of stock' in text or 'unavailable' in text:
+                stock_status = 'out_of_stock'
+                break
+    return {'name': name, 'price': price, 'stock_status': stock_status, 'options': options or None}
+
+def synthetic_page():
+    """A product page padded with the navigation, scripts and footer of a real shop"""
+    nav = ''.join(f'<li class="level0"><a href="/c/{i}"><span>Category {i}</span></a></li>' for i in range(300))
+    footer = ''.join(f'<div class="footer-col"><a href="/p/{i}">Link {i}</a></div>' for i in range(300))
+    scripts = '<script type="text/x-magento-init">{"*": {"config": "' + 'x' * 20000 + '"}}</script>'
+    options = ''.join(
+        f'<option value="{v}"{" disabled" if v % 3 == 0 else ""}>{v} mg</option>' for v in range(1, 7)
+    )
+    return f'''<html><head><title>Liquid</title>{scripts}</head><body>
+    <header><div class="minicart-wrapper"><span class="price">CHF 0.00</span></div><ul>{nav}</ul></header>
+    <main id="maincontent" class="page-main"><div class="product-info-main">
+    <h1 class="page-title"><span>Sample Liquid 10ml</span></h1>
+    <div class="price-box"><span class="price">CHF 7,90</span></div>
+    <div class="product-options-wrapper"><select name="super_attribute[93]" class="super-attribute-select">
+    <option value="">Choose...</option>{options}</select></div>
+    <div class="stock available"><span>In stock</span></div></div></main>
+    <footer>{footer}</footer>{scripts}</body></html>'''.encode('utf-8')
+
+def load_pages(paths):
+    pages = []
+    for path in paths:
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for file in files:
+            if file.endswith('.html.gz'):
+                with gzip.open(file, 'rb') as f:
+                    pages.append((file, f.read()))
+            elif file.endswith('.html'):
+                with open(file, 'rb') as f:
+                    pages.append((file, f.read()))
+    return pages
+
+def time_parser(func, pages, rounds):
+    timings = []
+    for _ in range(rounds):
+        for _, content in pages:
+            start = time.perf_counter()
+            func(content)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark product page parsing')
+    parser.add_argument('paths', nargs='*', help='HTML files or directories (default: scraper cache)')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args.paths or ([Config.SCRAPE_CACHE_DIR] if os.path.isdir(Config.SCRAPE_CACHE_DIR) else []))
+    if not pages:
+        print('No saved pages found, using a synthetic product page')
+        pages = [('synthetic', synthetic_page())]
+
+    mismatches = [name for name, content in pages if legacy_parse(content) != parse_product_page(content)]
+
+    print(f"{len(pages)} page(s), {args.rounds} round(s), backend: {PARSER}")
+    legacy_ms = time_parser(legacy_parse, pages, args.rounds)
+    current_ms = time_parser(parse_product_page, pages, args.rounds)
+    print(f"legacy   {legacy_ms:8.2f} ms/page")
+    print(f"current  {current_ms:8.2f} ms/page  ({legacy_ms / current_ms:.1f}x)")
+    if mismatches:
+        print(f"{len(mismatches)} page(s) extract differently (product block only):")
+        for name in mismatches[:10]:
+            print(f"  {name}")
+
+if __name__ == '__main__':
+    main()
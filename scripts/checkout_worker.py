@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Run queued checkout jobs outside the web server (CHECKOUT_RUNNER=worker)
+
+Polls the checkout_jobs table, runs jobs on this process's browser pool
+and writes a heartbeat the web processes report in /readyz. Only one
+runs per data directory; a second one exits right away.
+"""
+import sys
+import os
+import signal
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+from app import metrics
+from app.database import init_db, flush_logs, log_message
+from app.services.browser_pool import browser_pool_health, get_browser_pool
+from app.services.checkout_jobs import (
+    recover_checkout_jobs, dispatch_queued_jobs, write_worker_heartbeat, shutdown_checkout_jobs
+)
+from app.utils.helpers import acquire_process_lock
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    init_db()
+    # recover_checkout_jobs fails every running job it does not own, so a
+    # second worker must never get that far
+    lock_file = acquire_process_lock('checkout_worker.lock')
+    if lock_file is None:
+        print('Another checkout worker is running for this data directory')
+        sys.exit(1)
+    if Config.METRICS_DIR:
+        # Served by the web workers' /metrics
+        metrics.enable_multiprocess(Config.METRICS_DIR, Config.METRICS_WRITE_INTERVAL)
+    get_browser_pool().start()  # launch the browsers before the first job
+    recover_checkout_jobs()
+    log_message('info', 'Checkout worker started', {'pid': os.getpid()})
+    print(f'Checkout worker running (pid {os.getpid()}), Ctrl+C to stop')
+    try:
+        while not stop.is_set():
+            dispatch_queued_jobs()
+            write_worker_heartbeat(browser_pool_health())
+            stop.wait(Config.CHECKOUT_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Running checkouts finish before the browsers close
+        shutdown_checkout_jobs()
+        get_browser_pool().shutdown()
+        flush_logs()
+
+if __name__ == '__main__':
+    main()
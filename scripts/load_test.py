@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Load-test the catalog endpoints of a running server and report requests/second
+
+Start the server in production mode first (python run.py, or gunicorn -c
+gunicorn.conf.py app.wsgi:app), then e.g.:
+
+    python scripts/load_test.py --url http://127.0.0.1:5000 --concurrency 32 --duration 20
+
+Each client thread keeps one HTTP keep-alive session and cycles through the
+gallery page, the product listing (plain and revalidated with its ETag) and
+single products.
+"""
+import sys
+import os
+import time
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.helpers import percentile
+
+def catalog_requests(base_url, session):
+    """(name, url, headers) tuples for one client round"""
+    listing = session.get(f'{base_url}/api/products', timeout=10)
+    listing.raise_for_status()
+    etag = listing.headers.get('ETag')
+    product_ids = [p['id'] for p in listing.json().get('products', [])][:20]
+    plan = [
+        ('gallery', f'{base_url}/', {}),
+        ('products', f'{base_url}/api/products', {'Accept-Encoding': 'gzip'}),
+    ]
+    if etag:
+        plan.append(('products_304', f'{base_url}/api/products', {'If-None-Match': etag}))
+    plan.extend(('product', f'{base_url}/api/products/{pid}', {}) for pid in product_ids[:5])
+    return plan
+
+def client(base_url, deadline, results, lock):
+    session = requests.Session()
+    plan = catalog_requests(base_url, session)
+    local = []
+    while time.monotonic() < deadline:
+        for name, url, headers in plan:
+            started = time.perf_counter()
+            try:
+                status = session.get(url, headers=headers, timeout=30).status_code
+            except requests.RequestException:
+                status = 'error'
+            local.append((name, status, time.perf_counter() - started))
+    with lock:
+        results.extend(local)
+
+def main():
+    parser = argparse.ArgumentParser(description='Catalog endpoint load test')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--duration', type=float, default=15, help='seconds')
+    args = parser.parse_args()
+    base_url = args.url.rstrip('/')
+
+    results, lock = [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=client, args=(base_url, deadline, results, lock))
+               for _ in range(args.concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f'{len(results)} requests in {elapsed:.1f}s with {args.concurrency} clients: '
+          f'{len(results) / elapsed:.0f} req/s')
+    print(f"{'endpoint':<14}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for name in dict.fromkeys(name for name, _, _ in results):
+        rows = [r for r in results if r[0] == name]
+        latencies = [r[2] * 1000 for r in rows]
+        statuses = Counter(str(r[1]) for r in rows)
+        print(f'{name:<14}{len(rows):>10}{len(rows) / elapsed:>9.0f}'
+              f'{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}'
+              f'{percentile(latencies, 99):>9.1f}  {dict(statuses)}')
+
+if __name__ == '__main__':
+    main()
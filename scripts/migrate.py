@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations (app/migrations) to the database
+"""
+import sys
+import os
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import get_db, configure_db, flush_logs
+from app.migrations import migrate, pending_migrations, current_version
+
+def main():
+    parser = argparse.ArgumentParser(description='Upgrade the database schema')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='check pending migrations in a rolled-back transaction')
+    parser.add_argument('--status', action='store_true', help='list pending migrations and exit')
+    parser.add_argument('--no-backup', action='store_true', help='skip the backup before migrating')
+    args = parser.parse_args()
+
+    configure_db()
+    conn = get_db()
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    pending = pending_migrations()
+    print(f'Schema version {version}, {len(pending)} pending migration(s)')
+    for migration in pending:
+        backfill = ' (with backfill)' if migration.has_backfill else ''
+        print(f'  {migration.version:04d}_{migration.name}: {migration.description}{backfill}')
+    if args.status:
+        return
+
+    applied = migrate(dry_run=args.dry_run, backup=not args.no_backup)
+    if args.dry_run:
+        print(f'Dry run: {len(applied)} migration(s) checked, nothing changed')
+    else:
+        print(f'Applied {len(applied)} migration(s)')
+    flush_logs()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run the stock/price monitor outside the web app (or a single pass with --once)
+"""
+import sys
+import os
+import time
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db, flush_logs
+from app.services.monitor import monitor
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-scrape due products and record changes')
+    parser.add_argument('--once', action='store_true', help='run one scheduling pass and exit')
+    parser.add_argument('--limit', type=int, help='max products per pass')
+    args = parser.parse_args()
+
+    init_db()
+    if args.once:
+        summary = monitor.run_once(limit=args.limit)
+        print(f"Checked {summary['checked']} products, {summary['changed']} changed, "
+              f"{summary['failed']} failed")
+        flush_logs()
+        return
+
+    if not monitor.start():
+        print('The monitor is already running in another process')
+        sys.exit(1)
+    print('Monitor running, Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(60)
+            metrics = monitor.metrics()
+            print(f"{metrics['checked']} checked, {metrics['changed']} changed, "
+                  f"{metrics['failed']} failed, {metrics['due'] or 0} due")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        flush_logs()
+
+if __name__ == '__main__':
+    main()
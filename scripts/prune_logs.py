@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Apply the log retention limits once (e.g. from cron when the web app's
+pruning thread is disabled)
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db, flush_logs
+from app.services.log_retention import log_pruner
+
+def main():
+    init_db()
+    summary = log_pruner.run_once()
+    print(f"Pruned {summary['age']} expired and {summary['rows']} excess log rows")
+    flush_logs()
+
+if __name__ == '__main__':
+    main()
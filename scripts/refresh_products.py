@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Re-scrape product metadata for all (or selected) products concurrently
+"""
+import sys
+import os
+import time
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db, flush_logs
+from app.services.bulk_scraper import refresh_products
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh product metadata from dampfi.ch')
+    parser.add_argument('product_ids', nargs='*', type=int, help='only refresh these products')
+    parser.add_argument('--concurrency', type=int, help='total parallel fetches')
+    parser.add_argument('--per-host', type=int, help='parallel fetches per host')
+    parser.add_argument('--batch-size', type=int, help='product updates per transaction')
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+
+    def report(done, failed, total, errors):
+        print(f"\r{done}/{total} scraped, {failed} failed", end='', flush=True)
+
+    summary = refresh_products(
+        product_ids=args.product_ids or None,
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        batch_size=args.batch_size,
+        progress=report
+    )
+    print(f"\nRefreshed {summary['done'] - summary['failed']} of {summary['total']} products "
+          f"in {time.perf_counter() - start:.1f}s")
+    for error in summary['errors']:
+        print(f"  product {error['product_id']}: {error['error']}")
+    flush_logs()
+
+if __name__ == '__main__':
+    main()